@@ -6,52 +6,678 @@ that orchestrates domain entities and repository operations.
 """
 
 import asyncio
-from typing import List
-import pandas as pd
-from ..domain.entities import PatientData, PredictionResult, HypertensionAssessment
-from ..domain.repositories import ModelRepository, RecommendationService
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+import numpy as np
+from ..domain.entities import (
+    PatientData, PredictionResult, HypertensionAssessment, AssessmentEvent, ColumnarAssessment,
+    RecommendationJob, PATIENT_FIELDS, RECOMMENDATION_MODES
+)
+from ..domain.features import build_feature_matrix, build_feature_matrix_from_columns
+from ..domain.repositories import (
+    AuditLog, InferenceRunner, ModelRepository, Predictor, RecommendationJobs, RecommendationService,
+    RecommendationUnavailableError, ResultCache, ShadowScorer, UseCaseMetrics
+)
+
+
+def _to_prediction_str(prediction: int) -> str:
+    """Map a model output to the label shown to the user."""
+    return "Sí" if prediction == 1 else "No"
+
+
+def _label_recommendation(label: str, service: RecommendationService) -> Awaitable[str]:
+    """Ask a service for the recommendation of one prediction label."""
+    return service.generate_recommendation(label)
+
+
+def _consensus_recommendation(predictions: Dict[str, str], service: RecommendationService) -> Awaitable[str]:
+    """Ask a service for one recommendation covering every model's prediction."""
+    return service.generate_consensus_recommendation(predictions)
+
+
+def _assessment_events(assessment: HypertensionAssessment, recommendation_mode: str) -> List[AssessmentEvent]:
+    """Replay a complete assessment as the events of a stream."""
+    events = [AssessmentEvent("predictions", predictions=[
+        PredictionResult(modelo=prediction.modelo, prediccion=prediction.prediccion)
+        for prediction in assessment.predictions
+    ])]
+    if recommendation_mode == "per_model":
+        events.extend(
+            AssessmentEvent("recommendation", predictions=[prediction], degradado=prediction.degradado)
+            for prediction in assessment.predictions
+        )
+    elif recommendation_mode == "consensus":
+        events.append(AssessmentEvent(
+            "consensus", recomendacion=assessment.recomendacion, degradado=assessment.degradado
+        ))
+    events.append(AssessmentEvent("done", degradado=assessment.degradado))
+    return events
+
+
+def _check_recommendation_mode(recommendation_mode: str) -> None:
+    """Reject unknown recommendation modes."""
+    if recommendation_mode not in RECOMMENDATION_MODES:
+        raise ValueError(
+            f"Unknown recommendation mode {recommendation_mode!r}, expected one of {RECOMMENDATION_MODES}"
+        )
+
+
+def _describe_failure(exc: BaseException) -> str:
+    """Describe why recommendations were not completed, for the audit log."""
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return f"{type(exc).__name__}: {exc}"
+
+
+def _normalize(patient_data: PatientData) -> Tuple[float, float, float, float, int]:
+    """Return the patient fields in a canonical form for use as a cache key."""
+    # Adding 0.0 folds -0.0 into 0.0; int and float inputs compare equal anyway.
+    return (
+        float(patient_data.peso) + 0.0,
+        float(patient_data.estatura) + 0.0,
+        float(patient_data.actividad_total) + 0.0,
+        float(patient_data.tension_arterial) + 0.0,
+        int(patient_data.edad)
+    )
+
+
+@dataclass(frozen=True)
+class InferenceOptions:
+    """How the use case builds feature matrices and runs the models.
+
+    Without an executor the models run on the event loop; a micro-batcher,
+    when given, takes the single-row predictions instead.
+    """
+
+    executor: Optional[InferenceRunner] = None
+    micro_batcher: Optional[Predictor] = None
+    feature_dtype: np.dtype = np.dtype(np.float64)
 
 
 class HypertensionPredictionUseCase:
     """Use case for predicting hypertension risk."""
-    
-    def __init__(self, model_repo: ModelRepository, recommendation_service: RecommendationService):
+
+    def __init__(
+        self,
+        model_repo: ModelRepository,
+        recommendation_service: RecommendationService,
+        inference: InferenceOptions = InferenceOptions(),
+        metrics: Optional[UseCaseMetrics] = None,
+        result_cache: Optional[ResultCache] = None,
+        cache_version: Hashable = None,
+        request_deadline: Optional[float] = None,
+        fallback_service: Optional[RecommendationService] = None,
+        recommendation_jobs: Optional[RecommendationJobs] = None,
+        shadow_scorer: Optional[ShadowScorer] = None,
+        audit_log: Optional[AuditLog] = None
+    ):
         self.model_repo = model_repo
         self.recommendation_service = recommendation_service
-    
-    async def predict_hypertension_risk(self, patient_data: PatientData) -> HypertensionAssessment:
-        """Predict hypertension risk for a patient."""
+        self.inference = inference
+        self.metrics = metrics
+        self.result_cache = result_cache
+        self.cache_version = cache_version
+        self.request_deadline = request_deadline
+        self.fallback_service = fallback_service
+        self.recommendation_jobs = recommendation_jobs
+        self.shadow_scorer = shadow_scorer
+        self.audit_log = audit_log
+
+    async def predict_hypertension_risk(
+        self,
+        patient_data: PatientData,
+        recommendation_mode: str = "per_model"
+    ) -> HypertensionAssessment:
+        """Predict hypertension risk for a patient, reusing cached or in-flight results."""
+        _check_recommendation_mode(recommendation_mode)
+        start = time.perf_counter()
+        if self.result_cache is None:
+            assessment = await self._assess(patient_data, recommendation_mode)
+            await self._audit("predict", [assessment], start)
+            return assessment
+
+        # The version keeps results of replaced models from being served after a reload.
+        key = (self.cache_version, recommendation_mode, _normalize(patient_data))
+        shared = await self.result_cache.get_or_load(
+            key, lambda: self._assess(patient_data, recommendation_mode)
+        )
+        if shared.degradado:
+            # Fallback advice is only kept for the callers that shared this computation.
+            self.result_cache.discard(key)
+        assessment = HypertensionAssessment(
+            patient_data=patient_data,
+            predictions=shared.predictions,
+            recomendacion=shared.recomendacion,
+            degradado=shared.degradado
+        )
+        await self._audit("predict", [assessment], start)
+        return assessment
+
+    async def _assess(self, patient_data: PatientData, recommendation_mode: str) -> HypertensionAssessment:
+        """Run every model and the requested recommendations for a patient."""
+        deadline = self._deadline()
+
         # Prepare input data
-        imc = patient_data.calculate_imc()
-        input_data = pd.DataFrame(
-            [[
-                imc,
-                patient_data.actividad_total,
-                patient_data.tension_arterial,
-                patient_data.peso,
-                patient_data.edad
-            ]],
-            columns=["IMC_calculado", "actividad_total", "tension_arterial", "peso_promedio", "edad"]
-        )
-        
+        input_data = self._build_input_data([patient_data])
+
         # Get predictions from all models
         models = self.model_repo.get_available_models()
-        tasks = [self._generate_prediction(model, input_data) for model in models]
-        predictions = await asyncio.gather(*tasks)
-        
+        if recommendation_mode == "per_model":
+            tasks = [self._generate_prediction(model, input_data, deadline) for model in models]
+            predictions = await asyncio.gather(*tasks)
+            self._shadow(input_data, {
+                prediction.modelo: 1 if prediction.prediccion == "Sí" else 0 for prediction in predictions
+            })
+
+            return HypertensionAssessment(
+                patient_data=patient_data,
+                predictions=predictions,
+                degradado=any(prediction.degradado for prediction in predictions)
+            )
+
+        outputs = await asyncio.gather(*[self._predict(model, input_data) for model in models])
+        self._shadow(input_data, dict(zip(models, outputs)))
+        labels = {model: _to_prediction_str(output) for model, output in zip(models, outputs)}
+        recommendation, degraded = None, False
+        if recommendation_mode == "consensus":
+            recommendation, degraded = await self._recommend(
+                partial(_consensus_recommendation, labels), deadline
+            )
+
+        return HypertensionAssessment(
+            patient_data=patient_data,
+            predictions=[PredictionResult(modelo=model, prediccion=label) for model, label in labels.items()],
+            recomendacion=recommendation,
+            degradado=degraded
+        )
+
+    async def stream_hypertension_risk(
+        self,
+        patient_data: PatientData,
+        recommendation_mode: str = "per_model"
+    ) -> AsyncIterator[AssessmentEvent]:
+        """Predict hypertension risk for a patient, yielding each part as soon as it is known.
+
+        The predictions of every model come first, then the recommendations
+        in the order they complete, so callers need not wait for the
+        slowest recommendation to show the predictions.
+        """
+        _check_recommendation_mode(recommendation_mode)
+        start = time.perf_counter()
+        key = (self.cache_version, recommendation_mode, _normalize(patient_data))
+        cached = self.result_cache.get(key) if self.result_cache is not None else None
+        if cached is not None:
+            await self._audit("stream", [HypertensionAssessment(
+                patient_data=patient_data,
+                predictions=cached.predictions,
+                recomendacion=cached.recomendacion,
+                degradado=cached.degradado
+            )], start)
+            for event in _assessment_events(cached, recommendation_mode):
+                yield event
+            return
+
+        deadline = self._deadline()
+        predictions = await self._predict_all(patient_data)
+        assessment = HypertensionAssessment(patient_data=patient_data, predictions=predictions)
+        staged = recommendation_mode != "none"
+        # Logged before they are sent; recommendations get a line of their own, whatever their outcome.
+        await self._audit("stream", [
+            HypertensionAssessment(patient_data=patient_data, predictions=predictions)
+        ], start, stage="predicciones" if staged else "completa")
+        try:
+            yield AssessmentEvent("predictions", predictions=predictions)
+            if recommendation_mode == "per_model":
+                async def recommend(prediction: PredictionResult) -> PredictionResult:
+                    recommendation, degraded = await self._recommend(
+                        partial(_label_recommendation, prediction.prediccion), deadline
+                    )
+                    return PredictionResult(prediction.modelo, prediction.prediccion, recommendation, degraded)
+
+                tasks = [asyncio.ensure_future(recommend(prediction)) for prediction in predictions]
+                try:
+                    for next_done in asyncio.as_completed(tasks):
+                        result = await next_done
+                        yield AssessmentEvent("recommendation", predictions=[result], degradado=result.degradado)
+                finally:
+                    # Stop pending recommendations when the consumer goes away early.
+                    for task in tasks:
+                        task.cancel()
+                    assessment.predictions = [
+                        task.result() if task.done() and not task.cancelled() and task.exception() is None
+                        else prediction
+                        for task, prediction in zip(tasks, predictions)
+                    ]
+                assessment.degradado = any(prediction.degradado for prediction in assessment.predictions)
+            elif recommendation_mode == "consensus":
+                labels = {prediction.modelo: prediction.prediccion for prediction in predictions}
+                assessment.recomendacion, assessment.degradado = await self._recommend(
+                    partial(_consensus_recommendation, labels), deadline
+                )
+                yield AssessmentEvent(
+                    "consensus", recomendacion=assessment.recomendacion, degradado=assessment.degradado
+                )
+        except BaseException as exc:
+            if staged:
+                await self._audit(
+                    "stream", [assessment], start, stage="recomendaciones", error=_describe_failure(exc)
+                )
+            raise
+
+        if self.result_cache is not None and not assessment.degradado:
+            self.result_cache.set(key, assessment)
+        if staged:
+            await self._audit("stream", [assessment], start, stage="recomendaciones")
+        yield AssessmentEvent("done", degradado=assessment.degradado)
+
+    async def predict_hypertension_risk_deferred(
+        self,
+        patient_data: PatientData,
+        recommendation_mode: str = "per_model"
+    ) -> Tuple[HypertensionAssessment, Optional[RecommendationJob]]:
+        """Predict hypertension risk now and leave the recommendations to a background job.
+
+        Returns the assessment without recommendations and the job that
+        completes it, or a complete assessment and no job when nothing is
+        left to do: a cached result, or ``recommendation_mode=none``.
+        Raises ``JobQueueFullError`` when the job queue is full.
+        """
+        _check_recommendation_mode(recommendation_mode)
+        if self.recommendation_jobs is None:
+            raise RuntimeError("Deferred recommendations are not configured")
+        if recommendation_mode == "none":
+            return await self.predict_hypertension_risk(patient_data, recommendation_mode), None
+
+        start = time.perf_counter()
+        key = (self.cache_version, recommendation_mode, _normalize(patient_data))
+        cached = self.result_cache.get(key) if self.result_cache is not None else None
+        if cached is not None:
+            assessment = HypertensionAssessment(
+                patient_data=patient_data,
+                predictions=cached.predictions,
+                recomendacion=cached.recomendacion,
+                degradado=cached.degradado
+            )
+            await self._audit("deferred", [assessment], start)
+            return assessment, None
+
+        # A full queue is refused before paying for inference.
+        self.recommendation_jobs.reserve()
+        try:
+            predictions = await self._predict_all(patient_data)
+        except BaseException:
+            self.recommendation_jobs.release()
+            raise
+        job = self.recommendation_jobs.submit(
+            partial(self._complete_assessment, patient_data, predictions, recommendation_mode, key),
+            reserved=True
+        )
+        assessment = HypertensionAssessment(patient_data=patient_data, predictions=predictions)
+        # The job logs the outcome of the recommendations on a line of its own.
+        await self._audit("deferred", [assessment], start, stage="predicciones")
+        return assessment, job
+
+    async def warm_up(self) -> List[str]:
+        """Run synthetic predictions through every model and return their names.
+
+        Touches the parts of the models and of the inference workers that
+        initialize lazily, so that the first real requests do not pay for
+        them. Nothing is cached or shadow-scored.
+        """
+        patient_data = PatientData(
+            peso=70.0, estatura=1.70, actividad_total=150.0, tension_arterial=120.0, edad=40
+        )
+        single = self._build_input_data([patient_data])
+        batch = self._build_input_data([patient_data] * 8)
+        # One call per worker, so that every thread or process of the executor runs each model.
+        calls = getattr(self.inference.executor, "max_workers", 1)
+        models = self.model_repo.get_available_models()
+        for model in models:
+            await asyncio.gather(*[self._predict(model, single) for _ in range(calls)])
+            await self._predict_batch(model, batch)
+        return models
+
+    async def _complete_assessment(
+        self,
+        patient_data: PatientData,
+        predictions: List[PredictionResult],
+        recommendation_mode: str,
+        key: Hashable
+    ) -> HypertensionAssessment:
+        """Add the recommendations to deferred predictions and cache the result."""
+        start = time.perf_counter()
+        try:
+            assessment = await self._recommend_deferred(patient_data, predictions, recommendation_mode)
+        except BaseException as exc:
+            await self._audit("deferred", [
+                HypertensionAssessment(patient_data=patient_data, predictions=predictions)
+            ], start, stage="recomendaciones", error=_describe_failure(exc))
+            raise
+        if self.result_cache is not None and not assessment.degradado:
+            self.result_cache.set(key, assessment)
+        await self._audit("deferred", [assessment], start, stage="recomendaciones")
+        return assessment
+
+    async def _recommend_deferred(
+        self,
+        patient_data: PatientData,
+        predictions: List[PredictionResult],
+        recommendation_mode: str
+    ) -> HypertensionAssessment:
+        """Return deferred predictions with their recommendations."""
+        # Nobody is waiting on a background job, so only the service's own timeouts apply.
+        if recommendation_mode == "per_model":
+            distinct_labels = sorted({prediction.prediccion for prediction in predictions})
+            recommendations = dict(zip(distinct_labels, await asyncio.gather(*[
+                self._recommend(partial(_label_recommendation, label), None) for label in distinct_labels
+            ])))
+            completed = [
+                PredictionResult(prediction.modelo, prediction.prediccion, *recommendations[prediction.prediccion])
+                for prediction in predictions
+            ]
+            return HypertensionAssessment(
+                patient_data=patient_data,
+                predictions=completed,
+                degradado=any(prediction.degradado for prediction in completed)
+            )
+        labels = {prediction.modelo: prediction.prediccion for prediction in predictions}
+        recommendation, degraded = await self._recommend(partial(_consensus_recommendation, labels), None)
         return HypertensionAssessment(
             patient_data=patient_data,
-            predictions=predictions
+            predictions=predictions,
+            recomendacion=recommendation,
+            degradado=degraded
         )
-    
-    async def _generate_prediction(self, model_name: str, input_data: pd.DataFrame) -> PredictionResult:
+
+    async def predict_batch(
+        self,
+        patients: List[PatientData],
+        recommendation_mode: str = "per_model"
+    ) -> List[HypertensionAssessment]:
+        """Predict hypertension risk for many patients with one model call per model."""
+        _check_recommendation_mode(recommendation_mode)
+        start = time.perf_counter()
+        assessments = await self._assess_batch(patients, recommendation_mode)
+        await self._audit("batch", assessments, start)
+        return assessments
+
+    async def _assess_batch(
+        self,
+        patients: List[PatientData],
+        recommendation_mode: str
+    ) -> List[HypertensionAssessment]:
+        """Predict a batch of patients and add the requested recommendations."""
+        deadline = self._deadline()
+        input_data = self._build_input_data(patients)
+
+        models = self.model_repo.get_available_models()
+        batch_predictions = await asyncio.gather(*[
+            self._predict_batch(model, input_data) for model in models
+        ])
+        self._shadow(input_data, dict(zip(models, batch_predictions)))
+        labels_by_model = {
+            model: [_to_prediction_str(p) for p in predictions]
+            for model, predictions in zip(models, batch_predictions)
+        }
+
+        if recommendation_mode == "per_model":
+            return await self._with_recommendations_per_model(patients, models, labels_by_model, deadline)
+
+        consensus: Dict[Tuple[str, ...], Tuple[Optional[str], bool]] = {}
+        rows = [tuple(labels_by_model[model][row] for model in models) for row in range(len(patients))]
+        if recommendation_mode == "consensus":
+            # One recommendation per distinct combination of model outputs
+            distinct_rows = sorted(set(rows))
+            consensus = dict(zip(
+                distinct_rows,
+                await asyncio.gather(*[
+                    self._recommend(
+                        partial(_consensus_recommendation, dict(zip(models, labels))), deadline
+                    )
+                    for labels in distinct_rows
+                ])
+            ))
+
+        assessments = []
+        for patient_data, labels in zip(patients, rows):
+            recommendation, degraded = consensus.get(labels, (None, False))
+            assessments.append(HypertensionAssessment(
+                patient_data=patient_data,
+                predictions=[
+                    PredictionResult(modelo=model, prediccion=label) for model, label in zip(models, labels)
+                ],
+                recomendacion=recommendation,
+                degradado=degraded
+            ))
+        return assessments
+
+    async def predict_columns(
+        self,
+        columns: Dict[str, np.ndarray],
+        recommendation_mode: str = "per_model"
+    ) -> ColumnarAssessment:
+        """Predict many patients given as one array per patient field.
+
+        Works on whole columns throughout, so no object is built per
+        patient; recommendations are looked up by label or by combination
+        of model outputs and spread over the rows with NumPy indexing.
+        """
+        _check_recommendation_mode(recommendation_mode)
+        start = time.perf_counter()
+        assessment = await self._assess_columns(columns, recommendation_mode)
+        if self.audit_log is not None:
+            await self.audit_log.record_columns("columns", columns, assessment, time.perf_counter() - start)
+        return assessment
+
+    async def _assess_columns(
+        self,
+        columns: Dict[str, np.ndarray],
+        recommendation_mode: str
+    ) -> ColumnarAssessment:
+        """Predict patients given as columns and add the requested recommendations."""
+        deadline = self._deadline()
+        input_data = self._build_input_data_from_columns(columns)
+
+        models = self.model_repo.get_available_models()
+        outputs = await asyncio.gather(*[self._predict_batch(model, input_data) for model in models])
+        predictions = {model: np.asarray(output, dtype=np.int8) for model, output in zip(models, outputs)}
+        self._shadow(input_data, predictions)
+        assessment = ColumnarAssessment(models=list(models), predictions=predictions)
+        if recommendation_mode == "none" or not models:
+            return assessment
+
+        if recommendation_mode == "per_model":
+            # Indexed by model output, so a lookup array maps a whole column at once
+            outputs_seen = sorted({int(output) for column in predictions.values() for output in np.unique(column)})
+            texts = np.empty(2, dtype=object)
+            degraded = np.zeros(2, dtype=bool)
+            results = await asyncio.gather(*[
+                self._recommend(partial(_label_recommendation, _to_prediction_str(output)), deadline)
+                for output in outputs_seen
+            ])
+            for output, (text, fallback) in zip(outputs_seen, results):
+                texts[output], degraded[output] = text, fallback
+            assessment.respuestas = {model: texts[column] for model, column in predictions.items()}
+            assessment.degradado = np.logical_or.reduce([degraded[column] for column in predictions.values()])
+            return assessment
+
+        combinations, rows = np.unique(
+            np.column_stack([predictions[model] for model in models]), axis=0, return_inverse=True
+        )
+        results = await asyncio.gather(*[
+            self._recommend(
+                partial(_consensus_recommendation, {
+                    model: _to_prediction_str(output) for model, output in zip(models, combination)
+                }),
+                deadline
+            )
+            for combination in combinations
+        ])
+        texts = np.empty(len(results), dtype=object)
+        texts[:] = [text for text, _ in results]
+        rows = rows.reshape(-1)
+        assessment.recomendaciones = texts[rows]
+        assessment.degradado = np.array([fallback for _, fallback in results], dtype=bool)[rows]
+        return assessment
+
+    async def _with_recommendations_per_model(
+        self,
+        patients: List[PatientData],
+        models: List[str],
+        labels_by_model: Dict[str, List[str]],
+        deadline: Optional[float]
+    ) -> List[HypertensionAssessment]:
+        """Attach a recommendation to every model's prediction of every patient."""
+        # Recommendations only depend on the label, so ask once per distinct label
+        distinct_labels = sorted({label for labels in labels_by_model.values() for label in labels})
+        recommendations: Dict[str, Tuple[str, bool]] = dict(zip(
+            distinct_labels,
+            await asyncio.gather(*[
+                self._recommend(partial(_label_recommendation, label), deadline)
+                for label in distinct_labels
+            ])
+        ))
+
+        assessments = []
+        for row, patient_data in enumerate(patients):
+            predictions = [
+                PredictionResult(
+                    modelo=model,
+                    prediccion=labels_by_model[model][row],
+                    respuesta=recommendations[labels_by_model[model][row]][0],
+                    degradado=recommendations[labels_by_model[model][row]][1]
+                )
+                for model in models
+            ]
+            assessments.append(HypertensionAssessment(
+                patient_data=patient_data,
+                predictions=predictions,
+                degradado=any(prediction.degradado for prediction in predictions)
+            ))
+        return assessments
+
+    async def _generate_prediction(
+        self,
+        model_name: str,
+        input_data: np.ndarray,
+        deadline: Optional[float] = None
+    ) -> PredictionResult:
         """Generate prediction and recommendation for a single model."""
-        prediction = self.model_repo.predict(model_name, input_data)
-        prediction_str = "Sí" if prediction == 1 else "No"
-        recommendation = await self.recommendation_service.generate_recommendation(prediction_str)
-        
+        prediction = await self._predict(model_name, input_data)
+        prediction_str = _to_prediction_str(prediction)
+        recommendation, degraded = await self._recommend(
+            partial(_label_recommendation, prediction_str), deadline
+        )
+
         return PredictionResult(
             modelo=model_name,
             prediccion=prediction_str,
-            respuesta=recommendation
-        )
\ No newline at end of file
+            respuesta=recommendation,
+            degradado=degraded
+        )
+
+    async def _predict_all(self, patient_data: PatientData) -> List[PredictionResult]:
+        """Run every model for a patient, without recommendations."""
+        input_data = self._build_input_data([patient_data])
+        models = self.model_repo.get_available_models()
+        outputs = await asyncio.gather(*[self._predict(model, input_data) for model in models])
+        self._shadow(input_data, dict(zip(models, outputs)))
+        return [
+            PredictionResult(modelo=model, prediccion=_to_prediction_str(output))
+            for model, output in zip(models, outputs)
+        ]
+
+    def _shadow(self, input_data: np.ndarray, outputs: Dict[str, Any]) -> None:
+        """Hand the features and production outputs to the shadow scorer, without waiting."""
+        if self.shadow_scorer is not None:
+            self.shadow_scorer.submit(input_data, outputs)
+
+    async def _audit(
+        self,
+        source: str,
+        assessments: List[HypertensionAssessment],
+        start: float,
+        stage: str = "completa",
+        error: Optional[str] = None
+    ) -> None:
+        """Hand assessments to the audit log, without waiting for the disk."""
+        if self.audit_log is not None:
+            await self.audit_log.record(source, assessments, time.perf_counter() - start, stage, error)
+
+    def _deadline(self) -> Optional[float]:
+        """Return the event loop time by which recommendations must have arrived."""
+        if self.request_deadline is None:
+            return None
+        return asyncio.get_running_loop().time() + self.request_deadline
+
+    async def _recommend(
+        self,
+        generate: Callable[[RecommendationService], Awaitable[str]],
+        deadline: Optional[float]
+    ) -> Tuple[str, bool]:
+        """Ask for a recommendation before the deadline, falling back to local advice.
+
+        Returns the recommendation and whether it is the fallback. Without a
+        fallback service, a missed deadline or an unavailable service is
+        raised. Any other error is a bug and always propagates.
+        """
+        try:
+            if deadline is None:
+                return await generate(self.recommendation_service), False
+            remaining = max(deadline - asyncio.get_running_loop().time(), 0.0)
+            return await asyncio.wait_for(generate(self.recommendation_service), remaining), False
+        except (asyncio.TimeoutError, RecommendationUnavailableError) as exc:
+            if self.fallback_service is None:
+                raise
+            if self.metrics is not None:
+                reason = "timeout" if isinstance(exc, asyncio.TimeoutError) else "error"
+                self.metrics.recommendation_fallbacks.labels(reason).inc()
+            return await generate(self.fallback_service), True
+
+    async def _predict(self, model_name: str, input_data: np.ndarray) -> int:
+        """Run a single-row prediction, coalesced or off the event loop when configured."""
+        start = time.perf_counter_ns()
+        if self.inference.micro_batcher is not None:
+            prediction = await self.inference.micro_batcher.predict(self.model_repo, model_name, input_data)
+        elif self.inference.executor is None:
+            prediction = self.model_repo.predict(model_name, input_data)
+        else:
+            prediction = await self.inference.executor.predict(self.model_repo, model_name, input_data)
+        self._observe_prediction(model_name, start)
+        return prediction
+
+    async def _predict_batch(self, model_name: str, input_data: np.ndarray) -> List[int]:
+        """Run a batch prediction, off the event loop when an executor is set."""
+        start = time.perf_counter_ns()
+        if self.inference.executor is None:
+            predictions = self.model_repo.predict_batch(model_name, input_data)
+        else:
+            predictions = await self.inference.executor.predict_batch(self.model_repo, model_name, input_data)
+        self._observe_prediction(model_name, start)
+        return predictions
+
+    def _observe_prediction(self, model_name: str, start: int) -> None:
+        """Record how long a model took to answer, queueing included."""
+        if self.metrics is not None:
+            self.metrics.model_prediction.labels(model_name).observe_ns(time.perf_counter_ns() - start)
+
+    def _build_input_data(self, patients: List[PatientData]) -> np.ndarray:
+        """Build the model feature matrix, one row per patient."""
+        return self._build_features(partial(build_feature_matrix, patients))
+
+    def _build_input_data_from_columns(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Build the model feature matrix from one array per patient field."""
+        return self._build_features(
+            partial(build_feature_matrix_from_columns, *(columns[field] for field in PATIENT_FIELDS))
+        )
+
+    def _build_features(self, build: Callable[..., np.ndarray]) -> np.ndarray:
+        """Run a feature matrix builder, timing it when metrics are enabled."""
+        if self.metrics is None:
+            return build(dtype=self.inference.feature_dtype)
+        start = time.perf_counter_ns()
+        input_data = build(dtype=self.inference.feature_dtype)
+        self.metrics.feature_build.observe_ns(time.perf_counter_ns() - start)
+        return input_data
@@ -0,0 +1,153 @@
+"""
+Application settings.
+
+This module reads the runtime configuration of the service from
+environment variables so every layer shares a single source of truth.
+"""
+
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+def _env_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Read a string environment variable."""
+    value = os.environ.get(name)
+    return value if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Read a boolean environment variable."""
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer environment variable."""
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float environment variable."""
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime configuration of the prediction service."""
+    model_dir: Optional[str] = None
+    model_reload_interval: float = 0.0
+    admin_token: Optional[str] = None
+    recommendation_cache_size: int = 256
+    recommendation_cache_ttl: float = 3600.0
+    openai_max_concurrency: int = 16
+    openai_timeout: float = 30.0
+    openai_max_retries: int = 2
+    openai_max_connections: int = 32
+    openai_circuit_failures: int = 5
+    openai_circuit_reset: float = 30.0
+    request_deadline: float = 10.0
+    recommendation_fallback: bool = True
+    inference_executor: str = "thread"
+    inference_workers: int = 4
+    micro_batch_enabled: bool = False
+    micro_batch_window_ms: float = 2.0
+    micro_batch_max_size: int = 64
+    feature_dtype: str = "float64"
+    compiled_inference: bool = False
+    model_store: Optional[str] = None
+    preload_models: bool = False
+    metrics_enabled: bool = True
+    prediction_cache_size: int = 1024
+    prediction_cache_ttl: float = 3600.0
+    idempotency_cache_size: int = 1024
+    idempotency_ttl: float = 86400.0
+    websocket_max_in_flight: int = 16
+    recommendation_job_workers: int = 4
+    recommendation_job_queue_size: int = 1000
+    recommendation_job_ttl: float = 3600.0
+    recommendation_job_results: int = 10000
+    shadow_model_dir: Optional[str] = None
+    shadow_queue_size: int = 1000
+    admission_max_in_flight: int = 64
+    admission_max_in_flight_predictions: int = 512
+    admission_max_waiting: int = 32
+    admission_wait_timeout: float = 0.5
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.0
+    profiling_dir: str = "profiles"
+    warmup_enabled: bool = True
+    audit_log_path: Optional[str] = None
+    audit_log_max_bytes: int = 100 * 1024 * 1024
+    audit_log_backups: int = 10
+    audit_log_queue_size: int = 10000
+    audit_log_overflow: str = "drop_newest"
+    audit_log_flush_interval: float = 1.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Build settings from environment variables."""
+        return cls(
+            model_dir=_env_str("MODEL_DIR"),
+            model_reload_interval=_env_float("MODEL_RELOAD_INTERVAL", 0.0),
+            admin_token=_env_str("ADMIN_TOKEN"),
+            recommendation_cache_size=_env_int("RECOMMENDATION_CACHE_SIZE", 256),
+            recommendation_cache_ttl=_env_float("RECOMMENDATION_CACHE_TTL", 3600.0),
+            openai_max_concurrency=_env_int("OPENAI_MAX_CONCURRENCY", 16),
+            openai_timeout=_env_float("OPENAI_TIMEOUT", 30.0),
+            openai_max_retries=_env_int("OPENAI_MAX_RETRIES", 2),
+            openai_max_connections=_env_int("OPENAI_MAX_CONNECTIONS", 32),
+            openai_circuit_failures=_env_int("OPENAI_CIRCUIT_FAILURES", 5),
+            openai_circuit_reset=_env_float("OPENAI_CIRCUIT_RESET", 30.0),
+            request_deadline=_env_float("REQUEST_DEADLINE", 10.0),
+            recommendation_fallback=_env_bool("RECOMMENDATION_FALLBACK", True),
+            inference_executor=_env_str("INFERENCE_EXECUTOR", "thread"),
+            inference_workers=_env_int("INFERENCE_WORKERS", 4),
+            micro_batch_enabled=_env_bool("MICRO_BATCH_ENABLED", False),
+            micro_batch_window_ms=_env_float("MICRO_BATCH_WINDOW_MS", 2.0),
+            micro_batch_max_size=_env_int("MICRO_BATCH_MAX_SIZE", 64),
+            feature_dtype=_env_str("FEATURE_DTYPE", "float64"),
+            compiled_inference=_env_bool("COMPILED_INFERENCE", False),
+            model_store=_env_str("MODEL_STORE"),
+            preload_models=_env_bool("PRELOAD_MODELS", False),
+            metrics_enabled=_env_bool("METRICS_ENABLED", True),
+            prediction_cache_size=_env_int("PREDICTION_CACHE_SIZE", 1024),
+            prediction_cache_ttl=_env_float("PREDICTION_CACHE_TTL", 3600.0),
+            idempotency_cache_size=_env_int("IDEMPOTENCY_CACHE_SIZE", 1024),
+            idempotency_ttl=_env_float("IDEMPOTENCY_TTL", 86400.0),
+            websocket_max_in_flight=_env_int("WEBSOCKET_MAX_IN_FLIGHT", 16),
+            recommendation_job_workers=_env_int("RECOMMENDATION_JOB_WORKERS", 4),
+            recommendation_job_queue_size=_env_int("RECOMMENDATION_JOB_QUEUE_SIZE", 1000),
+            recommendation_job_ttl=_env_float("RECOMMENDATION_JOB_TTL", 3600.0),
+            recommendation_job_results=_env_int("RECOMMENDATION_JOB_RESULTS", 10000),
+            shadow_model_dir=_env_str("SHADOW_MODEL_DIR"),
+            shadow_queue_size=_env_int("SHADOW_QUEUE_SIZE", 1000),
+            admission_max_in_flight=_env_int("ADMISSION_MAX_IN_FLIGHT", 64),
+            admission_max_in_flight_predictions=_env_int("ADMISSION_MAX_IN_FLIGHT_PREDICTIONS", 512),
+            admission_max_waiting=_env_int("ADMISSION_MAX_WAITING", 32),
+            admission_wait_timeout=_env_float("ADMISSION_WAIT_TIMEOUT", 0.5),
+            profiling_enabled=_env_bool("PROFILING_ENABLED", False),
+            profiling_sample_rate=_env_float("PROFILING_SAMPLE_RATE", 0.0),
+            profiling_dir=_env_str("PROFILING_DIR", "profiles"),
+            warmup_enabled=_env_bool("WARMUP_ENABLED", True),
+            audit_log_path=_env_str("AUDIT_LOG_PATH"),
+            audit_log_max_bytes=_env_int("AUDIT_LOG_MAX_BYTES", 100 * 1024 * 1024),
+            audit_log_backups=_env_int("AUDIT_LOG_BACKUPS", 10),
+            audit_log_queue_size=_env_int("AUDIT_LOG_QUEUE_SIZE", 10000),
+            audit_log_overflow=_env_str("AUDIT_LOG_OVERFLOW", "drop_newest"),
+            audit_log_flush_interval=_env_float("AUDIT_LOG_FLUSH_INTERVAL", 1.0),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings, after loading a local .env file."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings.from_env()
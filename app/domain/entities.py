@@ -5,8 +5,25 @@ This module contains the core business entities that represent
 the fundamental concepts in the hypertension prediction domain.
 """
 
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, TypeVar
+import numpy as np
+
+# Model input features, in the column order the models were trained with.
+FEATURE_NAMES = ("IMC_calculado", "actividad_total", "tension_arterial", "peso_promedio", "edad")
+
+# Patient fields, in the order of PatientData and of columnar inputs.
+PATIENT_FIELDS = ("peso", "estatura", "actividad_total", "tension_arterial", "edad")
+
+# How recommendations are produced: one per model, one for all models, or none.
+RECOMMENDATION_MODES = ("per_model", "consensus", "none")
+
+Number = TypeVar("Number")
+
+
+def calculate_imc(peso: Number, estatura: Number) -> Number:
+    """Calculate BMI from weight and height, for scalars or whole NumPy columns."""
+    return peso / (estatura ** 2)
 
 
 @dataclass
@@ -20,7 +37,17 @@ class PatientData:
 
     def calculate_imc(self) -> float:
         """Calculate BMI from weight and height."""
-        return self.peso / (self.estatura ** 2)
+        return calculate_imc(self.peso, self.estatura)
+
+    def to_feature_row(self) -> Tuple[float, float, float, float, float]:
+        """Return the model features in FEATURE_NAMES order."""
+        return (
+            self.calculate_imc(),
+            self.actividad_total,
+            self.tension_arterial,
+            self.peso,
+            self.edad
+        )
 
 
 @dataclass
@@ -28,11 +55,59 @@ class PredictionResult:
     """Result of a hypertension prediction."""
     modelo: str
     prediccion: str
-    respuesta: str
+    respuesta: Optional[str] = None
+    # True when respuesta is the local fallback instead of the service's.
+    degradado: bool = False
 
 
 @dataclass
 class HypertensionAssessment:
     """Complete hypertension risk assessment."""
     patient_data: PatientData
-    predictions: List[PredictionResult]
\ No newline at end of file
+    predictions: List[PredictionResult]
+    recomendacion: Optional[str] = None
+    # True when any recommendation is the local fallback instead of the service's.
+    degradado: bool = False
+
+
+@dataclass
+class AssessmentEvent:
+    """One step of an assessment streamed as its parts become available.
+
+    ``predictions`` first carries every model's prediction, then each
+    ``recommendation`` the prediction of one model with its recommendation;
+    ``consensus`` carries the shared recommendation and ``done`` ends the
+    stream.
+    """
+    event: str
+    predictions: List[PredictionResult] = field(default_factory=list)
+    recomendacion: Optional[str] = None
+    degradado: bool = False
+
+
+@dataclass
+class RecommendationJob:
+    """Recommendations of an assessment, produced after its predictions were returned."""
+    job_id: str
+    # pending, running, done or failed.
+    status: str = "pending"
+    # The complete assessment, once the job is done.
+    assessment: Optional[HypertensionAssessment] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class ColumnarAssessment:
+    """Risk assessment of many patients, one array per output column."""
+    models: List[str]
+    # Model name to 0/1 predictions, one per patient.
+    predictions: Dict[str, np.ndarray]
+    # Model name to per-patient recommendations, with recommendation_mode=per_model.
+    respuestas: Optional[Dict[str, np.ndarray]] = None
+    # Shared per-patient recommendations, with recommendation_mode=consensus.
+    recomendaciones: Optional[np.ndarray] = None
+    # Per-patient flags for recommendations replaced by the local fallback.
+    degradado: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(next(iter(self.predictions.values()), ()))
@@ -0,0 +1,35 @@
+"""
+Feature building for the hypertension models.
+
+This module turns patient entities into the dense NumPy feature matrix
+the models consume, without going through pandas.
+"""
+
+from typing import Sequence
+import numpy as np
+from .entities import PatientData, FEATURE_NAMES, calculate_imc
+
+
+def build_feature_matrix(patients: Sequence[PatientData], dtype: np.dtype = np.float64) -> np.ndarray:
+    """Build a C-contiguous matrix with one row per patient in FEATURE_NAMES order."""
+    matrix = np.array([patient.to_feature_row() for patient in patients], dtype=dtype)
+    return matrix.reshape(len(patients), len(FEATURE_NAMES))
+
+
+def build_feature_matrix_from_columns(
+    peso: np.ndarray,
+    estatura: np.ndarray,
+    actividad_total: np.ndarray,
+    tension_arterial: np.ndarray,
+    edad: np.ndarray,
+    dtype: np.dtype = np.float64
+) -> np.ndarray:
+    """Build the same matrix as build_feature_matrix from one array per patient field."""
+    peso = np.asarray(peso, dtype=np.float64)
+    matrix = np.empty((len(peso), len(FEATURE_NAMES)), dtype=dtype)
+    matrix[:, 0] = calculate_imc(peso, np.asarray(estatura, dtype=np.float64))
+    matrix[:, 1] = actividad_total
+    matrix[:, 2] = tension_arterial
+    matrix[:, 3] = peso
+    matrix[:, 4] = edad
+    return matrix
@@ -2,21 +2,27 @@
 Repository interfaces for the domain layer.
 
 This module defines the contracts that infrastructure components
-must implement to provide data access and external services.
+must implement to provide data access and external services, and the
+optional runtime services the use cases call into.
 """
 
 from abc import ABC, abstractmethod
-from typing import List
-import pandas as pd
-from .entities import PredictionResult
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Protocol, Sequence
+import numpy as np
+from .entities import ColumnarAssessment, HypertensionAssessment, PredictionResult, RecommendationJob
 
 
 class ModelRepository(ABC):
     """Interface for ML model access."""
     
     @abstractmethod
-    def predict(self, model_name: str, data: pd.DataFrame) -> int:
-        """Make prediction using specified model."""
+    def predict(self, model_name: str, data: np.ndarray) -> int:
+        """Make prediction for a one-row feature matrix in FEATURE_NAMES order."""
+        pass
+    
+    @abstractmethod
+    def predict_batch(self, model_name: str, data: np.ndarray) -> List[int]:
+        """Make one prediction per row of a feature matrix in FEATURE_NAMES order."""
         pass
     
     @abstractmethod
@@ -25,10 +31,152 @@ class ModelRepository(ABC):
         pass
 
 
+class RecommendationUnavailableError(Exception):
+    """Raised by a recommendation service that cannot answer right now."""
+
+
 class RecommendationService(ABC):
-    """Interface for generating recommendations."""
+    """Interface for generating recommendations.
+
+    Implementations raise ``RecommendationUnavailableError`` when the
+    backing service fails or is unreachable; any other exception is a bug.
+    """
     
     @abstractmethod
     async def generate_recommendation(self, prediction: str) -> str:
         """Generate recommendation based on prediction."""
-        pass
\ No newline at end of file
+        pass
+    
+    @abstractmethod
+    async def generate_consensus_recommendation(self, predictions: Dict[str, str]) -> str:
+        """Generate one recommendation from every model's prediction, keyed by model name."""
+        pass
+
+
+class Predictor(Protocol):
+    """Runs single-row predictions on behalf of a model repository."""
+
+    async def predict(self, repository: ModelRepository, model_name: str, data: np.ndarray) -> int:
+        """Predict one row with the repository's model."""
+        ...
+
+
+class InferenceRunner(Predictor, Protocol):
+    """Runs single-row and batch predictions on behalf of a model repository."""
+
+    async def predict_batch(self, repository: ModelRepository, model_name: str, data: np.ndarray) -> List[int]:
+        """Predict every row with the repository's model."""
+        ...
+
+
+class ResultCache(Protocol):
+    """Expiring cache that shares one computation between concurrent callers."""
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry, or the default."""
+        ...
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store an entry."""
+        ...
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return a live entry, or load it once for every concurrent caller."""
+        ...
+
+    def discard(self, key: Hashable) -> None:
+        """Drop an entry if present."""
+        ...
+
+
+class RecommendationJobs(Protocol):
+    """Bounded queue of recommendation work finished after the response."""
+
+    def reserve(self) -> None:
+        """Hold a place for a job, or raise when the queue is full."""
+        ...
+
+    def release(self) -> None:
+        """Give back a place held by ``reserve``."""
+        ...
+
+    def submit(
+        self,
+        work: Callable[[], Awaitable[HypertensionAssessment]],
+        reserved: bool = False
+    ) -> RecommendationJob:
+        """Queue work that completes an assessment and return its job."""
+        ...
+
+
+class ShadowScorer(Protocol):
+    """Scores production inputs with candidate models off the request path."""
+
+    def submit(self, features: np.ndarray, production: Dict[str, np.ndarray]) -> bool:
+        """Queue one comparison; False when it was dropped."""
+        ...
+
+
+class AuditLog(Protocol):
+    """Records every assessment without waiting for storage."""
+
+    async def record(
+        self,
+        source: str,
+        assessments: Sequence[HypertensionAssessment],
+        duration: float,
+        stage: str = "completa",
+        error: Optional[str] = None
+    ) -> None:
+        """Record assessments, one entry each."""
+        ...
+
+    async def record_columns(
+        self,
+        source: str,
+        columns: Dict[str, np.ndarray],
+        assessment: ColumnarAssessment,
+        duration: float
+    ) -> None:
+        """Record a columnar assessment, one entry per row."""
+        ...
+
+
+class LatencySeries(Protocol):
+    """One histogram series."""
+
+    def observe_ns(self, duration_ns: int) -> None:
+        """Record a duration in nanoseconds."""
+        ...
+
+
+class CountSeries(Protocol):
+    """One counter series."""
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Add to the counter."""
+        ...
+
+
+class LabelledLatency(Protocol):
+    """Histogram with one series per set of label values."""
+
+    def labels(self, *values: str) -> LatencySeries:
+        """Return the series for the label values."""
+        ...
+
+
+class LabelledCount(Protocol):
+    """Counter with one series per set of label values."""
+
+    def labels(self, *values: str) -> CountSeries:
+        """Return the series for the label values."""
+        ...
+
+
+class UseCaseMetrics(Protocol):
+    """Series the prediction use case records into."""
+
+    model_prediction: LabelledLatency
+    feature_build: LatencySeries
+    recommendation_fallbacks: LabelledCount
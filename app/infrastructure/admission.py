@@ -0,0 +1,61 @@
+"""
+Admission control.
+
+This module caps how many requests are worked on at once. A request
+beyond the cap waits briefly in a bounded queue for a free slot; when
+the queue is full or the wait runs out it is rejected at once, so load
+spikes are shed quickly instead of piling up in memory behind slow
+recommendation calls.
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+
+class AdmissionRejected(RuntimeError):
+    """Raised when a request cannot be admitted."""
+
+
+class AdmissionLimiter:
+    """Concurrency cap with a short, bounded wait queue."""
+
+    def __init__(self, max_in_flight: int, max_waiting: int = 0, wait_timeout: float = 0.5):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting at most ``wait_timeout`` seconds in the queue.
+
+        Raises AdmissionRejected when the queue is full or the wait runs out.
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        if self._slots.locked():
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise AdmissionRejected("Too many requests in flight")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise AdmissionRejected("Timed out waiting for a free slot") from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+
+    def release(self) -> None:
+        """Give a slot back."""
+        self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        """Return in-flight, waiting and rejected counts."""
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "rejected": self.rejected}
@@ -0,0 +1,315 @@
+"""
+Prediction audit log.
+
+This module keeps an audit trail of every prediction as JSON Lines
+without adding disk latency to requests: the request path only puts its
+assessments on a bounded in-memory queue, and a writer thread turns them
+into one line per patient, appends them in batches and rotates the file
+by size. What happens when the queue is full is configurable, and
+closing the log writes out everything still queued.
+
+Predictions returned before their recommendations are logged twice: once
+with the predictions, at the ``predicciones`` stage, and once with the
+outcome of the recommendations, at the ``recomendaciones`` stage, also
+when they failed or were cancelled.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from ..domain.entities import ColumnarAssessment, HypertensionAssessment, PATIENT_FIELDS
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+# Longest a "block" policy holds up the caller before dropping the entry after all.
+BLOCK_TIMEOUT = 1.0
+
+# Entries written per batch at most.
+BATCH_SIZE = 512
+
+# Wakes the writer up on close; the closing event, not this marker, tells it to stop.
+_WAKE = object()
+
+
+def _dumps(record: Dict[str, Any]) -> bytes:
+    """Serialize one record as a JSON line."""
+    if orjson is not None:
+        return orjson.dumps(record) + b"\n"
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _assessment_records(
+    assessments: Sequence[HypertensionAssessment],
+    base: Dict[str, Any]
+) -> Iterator[Dict[str, Any]]:
+    """Describe each assessment as one audit record."""
+    for assessment in assessments:
+        patient = assessment.patient_data
+        yield {
+            **base,
+            "paciente": {field: getattr(patient, field) for field in PATIENT_FIELDS},
+            "predicciones": [
+                {
+                    "modelo": prediction.modelo,
+                    "prediccion": prediction.prediccion,
+                    "respuesta": prediction.respuesta,
+                    "degradado": prediction.degradado
+                }
+                for prediction in assessment.predictions
+            ],
+            "recomendacion": assessment.recomendacion,
+            "degradado": assessment.degradado
+        }
+
+
+def _columnar_records(
+    columns: Dict[str, np.ndarray],
+    assessment: ColumnarAssessment,
+    base: Dict[str, Any]
+) -> Iterator[Dict[str, Any]]:
+    """Describe each row of a columnar assessment as one audit record."""
+    rows = len(assessment)
+    patients = [columns[field].tolist() for field in PATIENT_FIELDS]
+    labels = {
+        model: ["Sí" if output else "No" for output in assessment.predictions[model].tolist()]
+        for model in assessment.models
+    }
+    respuestas = {
+        model: assessment.respuestas[model].tolist() if assessment.respuestas is not None else [None] * rows
+        for model in assessment.models
+    }
+    degradado = assessment.degradado.tolist() if assessment.degradado is not None else [False] * rows
+    recomendaciones = (
+        assessment.recomendaciones.tolist() if assessment.recomendaciones is not None else [None] * rows
+    )
+    for row in range(rows):
+        yield {
+            **base,
+            "paciente": {field: values[row] for field, values in zip(PATIENT_FIELDS, patients)},
+            "predicciones": [
+                {
+                    "modelo": model,
+                    "prediccion": labels[model][row],
+                    "respuesta": respuestas[model][row],
+                    # Columnar results only keep one flag per row.
+                    "degradado": bool(degradado[row]) and assessment.respuestas is not None
+                }
+                for model in assessment.models
+            ],
+            "recomendacion": recomendaciones[row],
+            "degradado": bool(degradado[row])
+        }
+
+
+class AuditLog:
+    """Buffered JSONL audit log written by a background thread."""
+
+    def __init__(
+        self,
+        path: Path,
+        max_bytes: int = 100 * 1024 * 1024,
+        backup_count: int = 10,
+        max_queue_size: int = 10000,
+        overflow: str = "drop_newest",
+        flush_interval: float = 1.0
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown audit log overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}"
+            )
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.overflow = overflow
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue_size)
+        self.written = 0
+        self.dropped = 0
+        self._closed = False
+        self._closing = threading.Event()
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Entries waiting to be written."""
+        return self._queue.qsize()
+
+    async def record(
+        self,
+        source: str,
+        assessments: Sequence[HypertensionAssessment],
+        duration: float,
+        stage: str = "completa",
+        error: Optional[str] = None
+    ) -> None:
+        """Queue assessments for the log, one line each, without waiting for the disk.
+
+        Only waits, without holding up the event loop, when the queue is
+        full and the overflow policy is ``block``.
+        """
+        await self._put(("assessments", self._base(source, stage, duration, error), assessments))
+
+    async def record_columns(
+        self,
+        source: str,
+        columns: Dict[str, np.ndarray],
+        assessment: ColumnarAssessment,
+        duration: float
+    ) -> None:
+        """Queue a columnar assessment for the log, one line per row."""
+        await self._put(("columns", self._base(source, "completa", duration, None), (columns, assessment)))
+
+    def stats(self) -> Dict[str, int]:
+        """Return written, dropped and queued counts."""
+        return {"written": self.written, "dropped": self.dropped, "queued": self.queue_depth}
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Write out everything queued and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._closing.set()
+        try:
+            self._queue.put_nowait(_WAKE)
+        except queue.Full:
+            # The writer has entries to take, and sees the closing event after them.
+            pass
+        self._thread.join(timeout)
+
+    @staticmethod
+    def _base(source: str, stage: str, duration: float, error: Optional[str]) -> Dict[str, Any]:
+        """Return the fields every record of an entry shares."""
+        base = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "origen": source,
+            "etapa": stage,
+            "duracion_ms": round(duration * 1000, 3)
+        }
+        if error is not None:
+            base["error"] = error
+        return base
+
+    async def _put(self, entry: Tuple[str, Dict[str, Any], Any]) -> None:
+        """Queue an entry, applying the overflow policy when the queue is full."""
+        if self._closed:
+            self.dropped += 1
+            return
+        try:
+            self._queue.put_nowait(entry)
+            return
+        except queue.Full:
+            pass
+        if self.overflow == "block":
+            try:
+                # Waits in a worker thread, so other requests keep being served meanwhile.
+                await asyncio.to_thread(self._queue.put, entry, True, BLOCK_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+        elif self.overflow == "drop_oldest":
+            try:
+                # The writer may have made room in the meantime, then nothing is lost.
+                self._queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(entry)
+                return
+            except queue.Full:
+                pass
+        self.dropped += 1
+
+    def _run(self) -> None:
+        """Write queued entries in batches until the log is closed."""
+        self._file = self._open()
+        try:
+            closing = False
+            while not closing:
+                try:
+                    entries = [self._queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    entries = []
+                while entries and len(entries) < BATCH_SIZE:
+                    try:
+                        entries.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                closing = self._closing.is_set()
+                if closing:
+                    # Everything still queued is written before stopping.
+                    while not self._queue.empty():
+                        entries.append(self._queue.get_nowait())
+                entries = [entry for entry in entries if entry is not _WAKE]
+                if not entries:
+                    continue
+                try:
+                    self._write(entries)
+                except Exception:
+                    logger.exception("Writing the audit log failed, %d entries lost", len(entries))
+                    self.dropped += len(entries)
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def _open(self) -> Optional[BinaryIO]:
+        """Open the log file for appending, None when that fails."""
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            file = open(self.path, "ab")
+        except OSError:
+            logger.exception("Cannot open the audit log at %s", self.path)
+            return None
+        self._size = file.tell()
+        return file
+
+    def _write(self, entries: List[Tuple[str, Dict[str, Any], Any]]) -> None:
+        """Append the lines of some entries, rotating the file when it would grow too big."""
+        lines = []
+        for kind, base, payload in entries:
+            records = (
+                _assessment_records(payload, base) if kind == "assessments"
+                else _columnar_records(*payload, base)
+            )
+            lines.extend(_dumps(record) for record in records)
+        data = b"".join(lines)
+        if self._file is None:
+            self._file = self._open()
+            if self._file is None:
+                raise OSError(f"The audit log at {self.path} is not open")
+        if self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+        self.written += len(lines)
+
+    def _rotate(self) -> None:
+        """Move the current file to ``<name>.1``, shifting older backups up."""
+        self._file.close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                older = self.path.with_name(f"{self.path.name}.{index}")
+                if older.exists():
+                    older.replace(self.path.with_name(f"{self.path.name}.{index + 1}"))
+            self.path.replace(self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        self._file = open(self.path, "ab")
+        self._size = 0
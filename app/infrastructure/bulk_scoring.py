@@ -0,0 +1,279 @@
+"""
+Offline bulk scoring.
+
+This module scores population files with millions of rows without going
+through the HTTP API: the input is streamed in fixed-size chunks, each
+chunk becomes one feature matrix and one vectorized prediction per
+model, and the results are appended to a columnar output file. Memory
+stays bounded by the chunk size however large the input is.
+
+Usage:
+    python -m app.infrastructure.bulk_scoring <input> <output> [options]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+from ..domain.entities import PATIENT_FIELDS
+from ..domain.features import build_feature_matrix_from_columns
+from ..domain.repositories import ModelRepository, RecommendationService
+from .ml_models import JoblibModelRepository
+from .model_store import MmapModelRepository
+
+BULK_RECOMMENDATION_MODES = ("none", "lookup")
+PREDICTION_LABELS = {1: "Sí", 0: "No"}
+
+# Repository owned by each worker process when scoring in parallel.
+_worker_repository: Optional[ModelRepository] = None
+
+
+def _init_worker(repository_factory: Callable[[], ModelRepository]) -> None:
+    """Load the models once in a freshly started worker process."""
+    global _worker_repository
+    _worker_repository = repository_factory()
+
+
+def _score_in_worker(chunk: pd.DataFrame, keep_columns: Sequence[str], dtype: np.dtype) -> pd.DataFrame:
+    """Score one chunk inside a worker process."""
+    return score_chunk(_worker_repository, chunk, keep_columns, dtype)
+
+
+def _is_parquet(path: Path) -> bool:
+    """Tell Parquet paths from CSV ones by extension."""
+    return path.suffix.lower() in (".parquet", ".pq")
+
+
+def _import_parquet() -> Any:
+    """Import pyarrow's Parquet module, which is only needed for Parquet files."""
+    try:
+        import pyarrow.parquet
+    except ImportError as exc:
+        raise RuntimeError("Parquet files require pyarrow: pip install pyarrow") from exc
+    return pyarrow.parquet
+
+
+def read_chunks(path: Path, chunk_size: int, columns: Sequence[str]) -> Iterator[pd.DataFrame]:
+    """Stream the selected columns of a CSV or Parquet file in chunks."""
+    path = Path(path)
+    if _is_parquet(path):
+        parquet_file = _import_parquet().ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=list(columns)):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=list(columns))
+
+
+def score_chunk(
+    repository: ModelRepository,
+    chunk: pd.DataFrame,
+    keep_columns: Sequence[str] = (),
+    dtype: np.dtype = np.float64
+) -> pd.DataFrame:
+    """Predict every model for one chunk of patients.
+
+    Rows with a missing or non-numeric field, or a non-positive height,
+    are kept in the output with empty predictions.
+    """
+    values = {
+        column: pd.to_numeric(chunk[column], errors="coerce").to_numpy(np.float64) for column in PATIENT_FIELDS
+    }
+    valid = np.logical_and.reduce([~np.isnan(column) for column in values.values()]) & (values["estatura"] > 0)
+    data = build_feature_matrix_from_columns(*(values[column][valid] for column in PATIENT_FIELDS), dtype=dtype)
+
+    result = chunk[list(keep_columns)].reset_index(drop=True)
+    for model_name in repository.get_available_models():
+        predictions = pd.array(np.full(len(chunk), pd.NA), dtype="Int8")
+        if len(data):
+            predictions[valid] = repository.predict_batch(model_name, data)
+        result[f"prediccion_{model_name}"] = predictions
+    return result
+
+
+def add_recommendations(result: pd.DataFrame, lookup: Dict[str, str]) -> pd.DataFrame:
+    """Fill one recommendation column per model from a label lookup."""
+    for column in [c for c in result.columns if c.startswith("prediccion_")]:
+        model_name = column[len("prediccion_"):]
+        labels = result[column].map(PREDICTION_LABELS, na_action="ignore")
+        result[f"respuesta_{model_name}"] = labels.map(lookup, na_action="ignore")
+    return result
+
+
+async def build_recommendation_lookup(service: RecommendationService) -> Dict[str, str]:
+    """Ask for the recommendation of each distinct label once."""
+    labels = list(PREDICTION_LABELS.values())
+    recommendations = await asyncio.gather(*[service.generate_recommendation(label) for label in labels])
+    return dict(zip(labels, recommendations))
+
+
+async def _fetch_openai_lookup() -> Dict[str, str]:
+    """Build the lookup with the OpenAI service and close its connections."""
+    from .openai_service import OpenAIRecommendationService
+
+    service = OpenAIRecommendationService()
+    try:
+        return await build_recommendation_lookup(service)
+    finally:
+        await service.aclose()
+
+
+class _CsvWriter:
+    """Appends chunks to a CSV file, writing the header once."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._header = True
+
+    def write(self, frame: pd.DataFrame) -> None:
+        """Append a chunk."""
+        frame.to_csv(self._path, mode="w" if self._header else "a", header=self._header, index=False)
+        self._header = False
+
+    def close(self) -> None:
+        """Finish the file."""
+        if self._header:
+            # Still create the file for an empty input.
+            self._path.write_text("")
+
+
+class _ParquetWriter:
+    """Appends chunks to a Parquet file as row groups."""
+
+    def __init__(self, path: Path):
+        self._parquet = _import_parquet()
+        self._path = path
+        self._writer = None
+
+    def write(self, frame: pd.DataFrame) -> None:
+        """Append a chunk as one row group."""
+        import pyarrow
+
+        table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self._path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self) -> None:
+        """Write the footer."""
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _open_writer(path: Path) -> Any:
+    """Pick the output writer from the file extension."""
+    return _ParquetWriter(path) if _is_parquet(path) else _CsvWriter(path)
+
+
+def score_file(
+    input_path: Path,
+    output_path: Path,
+    repository_factory: Callable[[], ModelRepository] = JoblibModelRepository,
+    chunk_size: int = 100_000,
+    workers: int = 1,
+    keep_columns: Sequence[str] = (),
+    recommendation_lookup: Optional[Dict[str, str]] = None,
+    dtype: np.dtype = np.float64
+) -> Dict[str, int]:
+    """Score a whole file chunk by chunk and return row counts.
+
+    With more than one worker, chunks are scored in a process pool and
+    written in input order; at most two chunks per worker are in flight.
+    """
+    input_path, output_path = Path(input_path), Path(output_path)
+    columns = list(dict.fromkeys([*PATIENT_FIELDS, *keep_columns]))
+    chunks = read_chunks(input_path, chunk_size, columns)
+    writer = _open_writer(output_path)
+    counts = {"rows": 0, "scored": 0}
+
+    def write(result: pd.DataFrame) -> None:
+        if recommendation_lookup is not None:
+            result = add_recommendations(result, recommendation_lookup)
+        writer.write(result)
+        counts["rows"] += len(result)
+        counts["scored"] += int(result.filter(like="prediccion_").notna().all(axis=1).sum())
+
+    try:
+        if workers <= 1:
+            repository = repository_factory()
+            for chunk in chunks:
+                write(score_chunk(repository, chunk, keep_columns, dtype))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker, initargs=(repository_factory,)
+            ) as executor:
+                pending: deque = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(_score_in_worker, chunk, keep_columns, dtype))
+                    if len(pending) >= 2 * workers:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        writer.close()
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet population file with every model.")
+    parser.add_argument("input", type=Path, help="CSV or Parquet file with the patient fields as columns")
+    parser.add_argument("output", type=Path, help="Output file; .parquet writes Parquet, anything else CSV")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Rows per chunk (default: 100000)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes scoring chunks in parallel (default: 1)")
+    parser.add_argument("--keep-columns", nargs="+", default=[], help="Input columns copied to the output, e.g. an id")
+    parser.add_argument("--recommendations", choices=BULK_RECOMMENDATION_MODES, default="none",
+                        help="'lookup' adds one recommendation column per model (default: none)")
+    parser.add_argument("--lookup-file", type=Path,
+                        help="JSON mapping of label to recommendation, instead of asking OpenAI")
+    parser.add_argument("--model-dir", type=Path, default=None, help="Directory with the .pkl models")
+    parser.add_argument("--model-store", type=Path, default=None, help="Memory-mapped model store directory")
+    parser.add_argument("--compiled", action="store_true", help="Use the compiled evaluators")
+    parser.add_argument("--feature-dtype", default="float64", choices=("float64", "float32"))
+    args = parser.parse_args(argv)
+    if _is_parquet(args.input) or _is_parquet(args.output):
+        try:
+            _import_parquet()
+        except RuntimeError as exc:
+            parser.error(str(exc))
+
+    if args.model_store is not None:
+        repository_factory = partial(MmapModelRepository, args.model_store)
+    else:
+        repository_factory = partial(JoblibModelRepository, args.model_dir, compiled=args.compiled)
+
+    lookup = None
+    if args.recommendations == "lookup":
+        if args.lookup_file is not None:
+            lookup = json.loads(args.lookup_file.read_text(encoding="utf-8"))
+        else:
+            lookup = asyncio.run(_fetch_openai_lookup())
+
+    start = time.perf_counter()
+    counts = score_file(
+        args.input,
+        args.output,
+        repository_factory=repository_factory,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        keep_columns=args.keep_columns,
+        recommendation_lookup=lookup,
+        dtype=np.dtype(args.feature_dtype)
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"Scored {counts['scored']} of {counts['rows']} rows into {args.output} "
+        f"in {elapsed:.1f}s ({counts['rows'] - counts['scored']} rows with invalid fields)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Async caching infrastructure.
+
+This module provides a bounded LRU cache with time-to-live expiry and
+single-flight loading, so concurrent callers asking for the same key
+share one computation instead of each running it.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class AsyncTTLCache:
+    """Bounded LRU/TTL cache with single-flight deduplication."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a fresh cached value without loading it."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting the least recently used entries."""
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, loading it at most once at a time."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            self.hits += 1
+            return value
+
+        task = self._pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(loader())
+            self._pending[key] = task
+            task.add_done_callback(partial(self._on_loaded, key))
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the shared load.
+        return await asyncio.shield(task)
+
+    def discard(self, key: Hashable) -> None:
+        """Drop one cached value, if present."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every cached value."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, miss and coalescing counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self._entries),
+        }
+
+    def _on_loaded(self, key: Hashable, task: asyncio.Future) -> None:
+        """Publish the result of a finished load; failures are not cached."""
+        self._pending.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.set(key, task.result())
@@ -0,0 +1,272 @@
+"""
+Compiled model evaluators.
+
+This module turns the loaded scikit-learn and XGBoost models into lean
+evaluators that skip the libraries' validation and dispatch layers:
+logistic regression becomes a dot product, random forests become
+flattened node arrays walked with NumPy, and XGBoost boosters are
+flattened the same way, summing leaf margins instead of averaging class
+probabilities.
+"""
+
+import json
+from typing import Any, Callable, Optional
+import numpy as np
+
+
+def _descend(
+    data: np.ndarray,
+    roots: np.ndarray,
+    feature: np.ndarray,
+    threshold: np.ndarray,
+    children: np.ndarray,
+    max_depth: int,
+    goes_left: Callable[[np.ndarray, np.ndarray], np.ndarray]
+) -> np.ndarray:
+    """Walk every row down every tree and return the reached leaves.
+
+    Leaves point to themselves, so all trees advance one level per step
+    for all rows at once and stop moving when they reach a leaf.
+    ``children[2 * node]`` is the right child and ``children[2 * node + 1]``
+    the left one.
+    """
+    n_rows, n_features = data.shape
+    flat_data = data.ravel()
+    row_offsets = (np.arange(n_rows) * n_features)[:, None]
+    nodes = np.repeat(roots[None, :], n_rows, axis=0)
+    for _ in range(max_depth):
+        go_left = goes_left(flat_data.take(row_offsets + feature.take(nodes)), threshold.take(nodes))
+        nodes = children.take(2 * nodes + go_left)
+    return nodes
+
+
+class LinearEvaluator:
+    """Linear classifier evaluated as a coefficient dot product."""
+
+    def __init__(self, coef: np.ndarray, intercept: np.ndarray, classes: np.ndarray):
+        self.coef = np.ascontiguousarray(coef.T, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.classes = np.asarray(classes)
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Predict one class per row."""
+        scores = data @ self.coef + self.intercept
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(np.intp)]
+        return self.classes[scores.argmax(axis=1)]
+
+
+class ForestEvaluator:
+    """Tree ensemble flattened into shared node arrays.
+
+    Nodes of every tree live in one set of arrays, walked level by level
+    for all rows and trees at once. Batches larger than
+    ``max_rows`` go to the original model, whose compiled tree walk wins
+    once there are enough rows to amortize its per-call overhead.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        leaf_proba: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        classes: np.ndarray,
+        fallback: Optional[Any] = None,
+        max_rows: int = 256
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.leaf_proba = leaf_proba
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes = np.asarray(classes)
+        self.fallback = fallback
+        self.max_rows = max_rows
+
+    @classmethod
+    def from_forest(cls, model: Any, max_rows: int = 256) -> "ForestEvaluator":
+        """Flatten a fitted scikit-learn forest classifier."""
+        features, thresholds, children, probas, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left < 0
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            children.append(np.column_stack([
+                np.where(is_leaf, node_ids, tree.children_right),
+                np.where(is_leaf, node_ids, tree.children_left)
+            ]) + offset)
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0] = 1.0
+            probas.append(value / normalizer)
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.intp).ravel(),
+            leaf_proba=np.concatenate(probas).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            classes=model.classes_,
+            fallback=model,
+            max_rows=max_rows
+        )
+
+    def predict_proba(self, data: np.ndarray) -> np.ndarray:
+        """Average the leaf class probabilities of every tree."""
+        # scikit-learn compares float32 features against float64 thresholds.
+        data = np.asarray(data, dtype=np.float32).astype(np.float64)
+        nodes = _descend(
+            data, self.roots, self.feature, self.threshold, self.children, self.max_depth, np.less_equal
+        )
+
+        proba = np.zeros((data.shape[0], self.leaf_proba.shape[1]))
+        # Summed tree by tree, in the same order as scikit-learn.
+        for tree in range(nodes.shape[1]):
+            proba += self.leaf_proba[nodes[:, tree]]
+        return proba / nodes.shape[1]
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Predict one class per row."""
+        if self.fallback is not None and data.shape[0] > self.max_rows:
+            return self.fallback.predict(data)
+        return self.classes[self.predict_proba(data).argmax(axis=1)]
+
+
+class BoosterEvaluator:
+    """XGBoost binary classifier flattened into shared node arrays.
+
+    Each row's margin is the sum of the leaves it reaches plus the base
+    margin, compared in float32 like XGBoost does. Batches larger than
+    ``max_rows``, and any batch with missing values, go to the booster's
+    in-place prediction, which wins on large batches and follows each
+    split's default direction for missing values.
+    """
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        leaf_value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        base_margin: float,
+        classes: np.ndarray,
+        booster: Optional[Any] = None,
+        iteration_range: tuple = (0, 0),
+        max_rows: int = 32
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.base_margin = np.float32(base_margin)
+        self.classes = np.asarray(classes)
+        self.booster = booster
+        self.iteration_range = iteration_range
+        self.max_rows = max_rows
+
+    @classmethod
+    def from_classifier(cls, model: Any, max_rows: int = 32) -> Optional["BoosterEvaluator"]:
+        """Flatten a fitted binary XGBClassifier, or return None for categorical splits."""
+        booster = model.get_booster()
+        best_iteration = booster.attr("best_iteration")
+        iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+        learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+        trees = learner["gradient_booster"]["model"]["trees"]
+        if iteration_range[1]:
+            per_round = int(learner["gradient_booster"]["gbtree_model_param"]["num_parallel_tree"])
+            trees = trees[:iteration_range[1] * per_round]
+        if any(any(tree["split_type"]) for tree in trees):
+            return None
+
+        features, thresholds, children, leaves, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            left = np.asarray(tree["left_children"], dtype=np.intp)
+            right = np.asarray(tree["right_children"], dtype=np.intp)
+            node_ids = np.arange(left.size)
+            is_leaf = left < 0
+            # A leaf's split condition holds its value.
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            features.append(np.where(is_leaf, 0, tree["split_indices"]))
+            thresholds.append(conditions)
+            children.append(np.column_stack([
+                np.where(is_leaf, node_ids, right),
+                np.where(is_leaf, node_ids, left)
+            ]) + offset)
+            leaves.append(np.where(is_leaf, conditions, np.float32(0)))
+            roots.append(offset)
+            offset += left.size
+            max_depth = max(max_depth, _tree_depth(left, right))
+
+        # XGBoost stores the logistic base score as a probability.
+        base_score = float(str(learner["learner_model_param"]["base_score"]).strip("[]"))
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children).astype(np.intp).ravel(),
+            leaf_value=np.concatenate(leaves),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            base_margin=np.log(base_score / (1.0 - base_score)),
+            classes=model.classes_,
+            booster=booster,
+            iteration_range=iteration_range,
+            max_rows=max_rows
+        )
+
+    def predict_margin(self, data: np.ndarray) -> np.ndarray:
+        """Sum the leaf values every row reaches, plus the base margin."""
+        data = np.asarray(data, dtype=np.float32)
+        nodes = _descend(
+            data, self.roots, self.feature, self.threshold, self.children, self.max_depth, np.less
+        )
+        return self.leaf_value.take(nodes).sum(axis=1, dtype=np.float32) + self.base_margin
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        """Predict one class per row."""
+        if self.booster is not None and (data.shape[0] > self.max_rows or np.isnan(data).any()):
+            scores = self.booster.inplace_predict(
+                data, iteration_range=self.iteration_range, validate_features=False
+            )
+            return self.classes[(scores > 0.5).astype(np.intp)]
+        return self.classes[(self.predict_margin(data) > 0).astype(np.intp)]
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Return the depth of a tree given as child index arrays."""
+    depth = np.zeros(left.size, dtype=np.intp)
+    stack = [0]
+    while stack:
+        node = stack.pop()
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+            stack.extend((left[node], right[node]))
+    return int(depth.max())
+
+
+def compile_model(model: Any) -> Any:
+    """Return a lean evaluator for a supported model, or the model itself."""
+    if hasattr(type(model), "get_booster") and getattr(model, "objective", None) == "binary:logistic":
+        return BoosterEvaluator.from_classifier(model) or model
+    if hasattr(model, "estimators_") and all(hasattr(e, "tree_") for e in model.estimators_):
+        return ForestEvaluator.from_forest(model)
+    if hasattr(model, "coef_") and hasattr(model, "intercept_") and hasattr(model, "classes_"):
+        return LinearEvaluator(model.coef_, model.intercept_, model.classes_)
+    return model
@@ -0,0 +1,44 @@
+"""
+Local fallback recommendations.
+
+This module provides fixed recommendations that are served without any
+external call when the OpenAI service is too slow or unavailable, so a
+prediction can still be answered with general advice.
+"""
+
+from typing import Dict
+from ..domain.repositories import RecommendationService
+
+FALLBACK_RECOMMENDATIONS = {
+    "Sí": (
+        "La predicción indica riesgo de hipertensión. Se recomienda consultar con un médico para "
+        "controlar la presión arterial, reducir el consumo de sal, mantener un peso saludable y "
+        "realizar actividad física regular."
+    ),
+    "No": (
+        "La predicción no indica riesgo de hipertensión. Se recomienda mantener hábitos saludables: "
+        "una alimentación equilibrada con poca sal, actividad física regular y controles periódicos "
+        "de la presión arterial."
+    ),
+}
+
+MIXED_RECOMMENDATION = (
+    "Los modelos no coinciden sobre el riesgo de hipertensión. Se recomienda consultar con un médico "
+    "para controlar la presión arterial y, mientras tanto, reducir el consumo de sal y realizar "
+    "actividad física regular."
+)
+
+
+class FallbackRecommendationService(RecommendationService):
+    """Recommendation service answering from fixed local texts."""
+
+    async def generate_recommendation(self, prediction: str) -> str:
+        """Return the fixed recommendation for a prediction label."""
+        return FALLBACK_RECOMMENDATIONS.get(prediction, MIXED_RECOMMENDATION)
+
+    async def generate_consensus_recommendation(self, predictions: Dict[str, str]) -> str:
+        """Return the fixed recommendation for the models' predictions."""
+        labels = set(predictions.values())
+        if len(labels) == 1:
+            return await self.generate_recommendation(labels.pop())
+        return MIXED_RECOMMENDATION
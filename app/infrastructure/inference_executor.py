@@ -0,0 +1,106 @@
+"""
+Inference executor implementation.
+
+This module runs CPU-bound model inference in a thread or process pool
+so that it never blocks the event loop serving HTTP requests.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+import numpy as np
+from ..domain.repositories import ModelRepository
+from .ml_models import JoblibModelRepository
+from .profiling import add_worker_stats, is_profiling, profiled_call
+
+EXECUTOR_KINDS = ("thread", "process")
+
+# Repository owned by each worker process of a process pool.
+_worker_repository: Optional[ModelRepository] = None
+
+
+def _init_worker(repository_factory: Callable[[], ModelRepository]) -> None:
+    """Load the models once in a freshly started worker process."""
+    global _worker_repository
+    _worker_repository = repository_factory()
+
+
+def _predict_in_worker(method: str, model_name: str, data: np.ndarray) -> Any:
+    """Run a repository prediction method inside a worker process."""
+    return getattr(_worker_repository, method)(model_name, data)
+
+
+class InferenceExecutor:
+    """Runs model predictions off the event loop."""
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 4,
+        repository_factory: Callable[[], ModelRepository] = JoblibModelRepository
+    ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown inference executor {kind!r}, expected one of {EXECUTOR_KINDS}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self._repository_factory = repository_factory
+        self._executor = self._create_executor()
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Predictions submitted and not yet finished."""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Predictions waiting for a free worker."""
+        return max(0, self._in_flight - self.max_workers)
+
+    async def predict(self, repository: ModelRepository, model_name: str, data: np.ndarray) -> int:
+        """Make a prediction in the pool."""
+        if self.kind == "process":
+            return await self._run(_predict_in_worker, "predict", model_name, data)
+        return await self._run(repository.predict, model_name, data)
+
+    async def predict_batch(self, repository: ModelRepository, model_name: str, data: np.ndarray) -> List[int]:
+        """Make one prediction per row in the pool."""
+        if self.kind == "process":
+            return await self._run(_predict_in_worker, "predict_batch", model_name, data)
+        return await self._run(repository.predict_batch, model_name, data)
+
+    def restart(self) -> None:
+        """Replace the pool so process workers pick up reloaded models."""
+        if self.kind != "process":
+            return
+        old_executor = self._executor
+        self._executor = self._create_executor()
+        # Work already queued on the old pool still completes.
+        old_executor.shutdown(wait=False)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool."""
+        self._executor.shutdown(wait=wait)
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Submit a call to the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        self._in_flight += 1
+        try:
+            if is_profiling():
+                result, stats = await loop.run_in_executor(self._executor, profiled_call, fn, *args)
+                add_worker_stats(stats)
+                return result
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    def _create_executor(self) -> Executor:
+        """Create the underlying pool."""
+        if self.kind == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self._repository_factory,)
+            )
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
@@ -0,0 +1,380 @@
+"""
+Metrics instrumentation.
+
+This module provides lightweight counters, gauges and latency histograms
+rendered in the Prometheus text exposition format, and the set of
+metrics recorded along the prediction path. Recording a histogram
+observation is a bisect over integer nanosecond bounds plus two
+integer increments, well under a microsecond.
+
+Every series updates under a lock of its own. ``+=`` on an attribute or
+a list item is a separate load and store, and CPython does not
+guarantee that another thread cannot run in between, so observations
+from the inference threads could otherwise be lost.
+"""
+
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Bucket upper bounds in seconds, from 10 µs (a compiled model) to 30 s (OpenAI timeout).
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    """Escape a label value."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _CounterChild:
+    """One labelled counter series."""
+
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Add to the counter."""
+        with self._lock:
+            self._value += amount
+
+    def set(self, value: float) -> None:
+        """Set the total from a counter maintained elsewhere."""
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        """Current value."""
+        return self._value
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        """Render the series' sample lines."""
+        return [f"{name}{labels} {_format_value(self._value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    """One labelled gauge series."""
+
+    __slots__ = ()
+
+    def dec(self, amount: float = 1.0) -> None:
+        """Subtract from the gauge."""
+        with self._lock:
+            self._value -= amount
+
+
+class _HistogramChild:
+    """One labelled histogram series, bucketed in integer nanoseconds."""
+
+    __slots__ = ("_bounds", "_bounds_ns", "_counts", "_sum_ns", "_lock")
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds = tuple(bounds)
+        self._bounds_ns = [int(round(bound * 1e9)) for bound in bounds]
+        # The last slot counts observations above every bound (+Inf).
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum_ns = 0
+        self._lock = threading.Lock()
+
+    def observe_ns(self, duration_ns: int) -> None:
+        """Record a duration measured with ``time.perf_counter_ns``."""
+        bucket = bisect_left(self._bounds_ns, duration_ns)
+        with self._lock:
+            self._counts[bucket] += 1
+            self._sum_ns += duration_ns
+
+    def observe(self, seconds: float) -> None:
+        """Record a duration in seconds."""
+        self.observe_ns(int(seconds * 1e9))
+
+    @property
+    def count(self) -> int:
+        """Number of observations."""
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        """Sum of the observations in seconds."""
+        return self._sum_ns / 1e9
+
+    def samples(self, name: str, labels: str) -> List[str]:
+        """Render the bucket, sum and count lines."""
+        # Copied together, so the count and the sum describe the same observations.
+        with self._lock:
+            counts = list(self._counts)
+            sum_ns = self._sum_ns
+        prefix = labels[1:-1] + "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float("inf"),), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{name}_sum{labels} {_format_value(sum_ns / 1e9)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Metric(ABC):
+    """A named metric family with zero or more label dimensions."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values: str):
+        """Return the series for the given label values, creating it once."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """Create the series for one set of label values."""
+        pass
+
+    def render(self) -> List[str]:
+        """Render the family in the text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in sorted(self._children.items()):
+            labels = ""
+            if values:
+                labels = "{" + ",".join(
+                    f'{label}="{_escape(value)}"' for label, value in zip(self.labelnames, values)
+                ) + "}"
+            lines.extend(child.samples(self.name, labels))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Add to an unlabelled counter."""
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Add to an unlabelled gauge."""
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        """Subtract from an unlabelled gauge."""
+        self._default.dec(amount)
+
+    def set(self, value: float) -> None:
+        """Set an unlabelled gauge."""
+        self._default.set(value)
+
+
+class Histogram(_Metric):
+    """Latency distribution over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe_ns(self, duration_ns: int) -> None:
+        """Record a duration in nanoseconds on an unlabelled histogram."""
+        self._default.observe_ns(duration_ns)
+
+    def observe(self, seconds: float) -> None:
+        """Record a duration in seconds on an unlabelled histogram."""
+        self._default.observe(seconds)
+
+
+class MetricsRegistry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Register a callback that refreshes gauges right before rendering."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the text exposition format."""
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric):
+        """Add a metric to the rendered set."""
+        self._metrics.append(metric)
+        return metric
+
+
+class PredictionMetrics(MetricsRegistry):
+    """Metrics recorded along the prediction path."""
+
+    def __init__(self):
+        super().__init__()
+        self.http_requests_in_flight = self.gauge(
+            "http_requests_in_flight", "HTTP requests currently being served."
+        )
+        self.http_requests = self.counter(
+            "http_requests_total", "HTTP requests served.", ("method", "path", "status")
+        )
+        self.http_request_errors = self.counter(
+            "http_request_errors_total", "HTTP requests that failed with a server error.", ("method", "path")
+        )
+        self.http_request_duration = self.histogram(
+            "http_request_duration_seconds", "HTTP request latency.", ("method", "path")
+        )
+        self.feature_build = self.histogram(
+            "hypertension_feature_build_seconds", "Time to build the model feature matrix."
+        )
+        self.model_prediction = self.histogram(
+            "hypertension_model_prediction_seconds",
+            "Time to obtain a model's predictions, including executor and micro-batch queueing.",
+            ("model",)
+        )
+        self.model_inference = self.histogram(
+            "hypertension_model_inference_seconds", "Time spent in a model's predict call.", ("model",)
+        )
+        self.recommendation = self.histogram(
+            "hypertension_recommendation_seconds", "Time to obtain a recommendation, including cache hits."
+        )
+        self.openai_request = self.histogram(
+            "hypertension_openai_request_seconds", "Time of each OpenAI completion attempt.", ("outcome",)
+        )
+        self.recommendation_fallbacks = self.counter(
+            "hypertension_recommendation_fallbacks_total",
+            "Recommendations answered with the local fallback, by reason.",
+            ("reason",)
+        )
+        self.openai_circuit_open = self.gauge(
+            "hypertension_openai_circuit_open", "1 while the OpenAI circuit breaker rejects calls, else 0."
+        )
+        self.inference_in_flight = self.gauge(
+            "hypertension_inference_in_flight", "Predictions submitted to the inference executor and not finished."
+        )
+        self.inference_queue_depth = self.gauge(
+            "hypertension_inference_queue_depth", "Predictions waiting for a free inference worker."
+        )
+        self.recommendation_cache = self.counter(
+            "hypertension_recommendation_cache_total", "Recommendation cache lookups by result.", ("result",)
+        )
+        self.prediction_cache = self.counter(
+            "hypertension_prediction_cache_total", "Prediction result cache lookups by result.", ("result",)
+        )
+        self.recommendation_cache_size = self.gauge(
+            "hypertension_recommendation_cache_size", "Recommendations currently cached."
+        )
+        self.recommendation_jobs = self.counter(
+            "hypertension_recommendation_jobs_total", "Deferred recommendation jobs by outcome.", ("outcome",)
+        )
+        self.recommendation_job_queue_depth = self.gauge(
+            "hypertension_recommendation_job_queue_depth", "Deferred recommendation jobs waiting for a worker."
+        )
+        self.admission_in_flight = self.gauge(
+            "hypertension_admission_in_flight", "/predict requests admitted and not finished, by lane.", ("lane",)
+        )
+        self.admission_waiting = self.gauge(
+            "hypertension_admission_waiting", "/predict requests waiting for a free slot, by lane.", ("lane",)
+        )
+        self.admission_rejected = self.counter(
+            "hypertension_admission_rejected_total", "/predict requests shed with a 503, by lane.", ("lane",)
+        )
+        self.shadow_rows = self.counter(
+            "hypertension_shadow_rows_total", "Rows scored by a candidate model.", ("version", "model")
+        )
+        self.shadow_agreements = self.counter(
+            "hypertension_shadow_agreements_total",
+            "Rows where a candidate model agreed with the production model.",
+            ("version", "model")
+        )
+        self.shadow_dropped = self.gauge(
+            "hypertension_shadow_dropped", "Shadow scoring work dropped because the queue was full, since start."
+        )
+        self.audit_log_written = self.gauge(
+            "hypertension_audit_log_written", "Lines written to the prediction audit log since start."
+        )
+        self.audit_log_dropped = self.gauge(
+            "hypertension_audit_log_dropped", "Audit log entries dropped because the queue was full, since start."
+        )
+        self.audit_log_queue_depth = self.gauge(
+            "hypertension_audit_log_queue_depth", "Audit log entries waiting to be written."
+        )
+        self.micro_batches = self.counter(
+            "hypertension_micro_batches_total", "Model calls made by the micro-batcher."
+        )
+        self.micro_batch_rows = self.counter(
+            "hypertension_micro_batch_rows_total", "Rows predicted by the micro-batcher."
+        )
+        self.model_version = self.gauge(
+            "hypertension_model_version", "Version of the loaded model set, incremented on every reload."
+        )
@@ -0,0 +1,92 @@
+"""
+Micro-batching of concurrent predictions.
+
+This module coalesces single-row predictions that arrive within a short
+window into one vectorized call per model, and hands each caller back
+its own row's result.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+import numpy as np
+from ..domain.repositories import ModelRepository
+
+
+class _PendingBatch:
+    """Rows collected for one model while the window is open."""
+
+    def __init__(self, repository: ModelRepository, model_name: str):
+        self.repository = repository
+        self.model_name = model_name
+        self.rows: List[np.ndarray] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-row predictions into batched model calls."""
+
+    def __init__(self, window: float = 0.002, max_batch_size: int = 64, executor: Optional[Any] = None):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.executor = executor
+        self._pending: Dict[Tuple[int, str], _PendingBatch] = {}
+        self._running: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.rows = 0
+
+    async def predict(self, repository: ModelRepository, model_name: str, data: np.ndarray) -> int:
+        """Queue a one-row prediction and wait for its batched result."""
+        loop = asyncio.get_running_loop()
+        # Keyed by repository identity so a model reload never mixes versions.
+        key = (id(repository), model_name)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = _PendingBatch(repository, model_name)
+            batch.timer = loop.call_later(self.window, self._flush, key)
+            self._pending[key] = batch
+
+        future = loop.create_future()
+        batch.rows.append(data)
+        batch.futures.append(future)
+        if len(batch.rows) >= self.max_batch_size:
+            self._flush(key)
+        return await future
+
+    def stats(self) -> Dict[str, float]:
+        """Return batch counters."""
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+        }
+
+    def _flush(self, key: Tuple[int, str]) -> None:
+        """Close the window for a model and run its batch."""
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = asyncio.ensure_future(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: _PendingBatch) -> None:
+        """Predict a whole batch and resolve each caller's future."""
+        self.batches += 1
+        self.rows += len(batch.rows)
+        data = np.concatenate(batch.rows)
+        try:
+            if self.executor is not None:
+                predictions = await self.executor.predict_batch(batch.repository, batch.model_name, data)
+            else:
+                predictions = batch.repository.predict_batch(batch.model_name, data)
+        except Exception as exc:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for future, prediction in zip(batch.futures, predictions):
+            if not future.done():
+                future.set_result(prediction)
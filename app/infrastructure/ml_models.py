@@ -5,40 +5,92 @@ This module provides concrete implementations for loading and using
 machine learning models for hypertension prediction.
 """
 
+import time
 from pathlib import Path
-from typing import List, Dict, Any
-import joblib
-import pandas as pd
+from typing import List, Dict, Any, Optional
+import numpy as np
+from ..domain.entities import FEATURE_NAMES
 from ..domain.repositories import ModelRepository
+from .compiled_models import compile_model
+
+MODEL_DIR = Path(__file__).parent.parent / 'ml_models'
+
+MODEL_FILES = {
+    'LOG': 'modelo_hipertension_LOG.pkl',
+    'RF': 'modelo_hipertension_RF.pkl',
+    'XGB': 'modelo_hipertension_XGB.pkl'
+}
+
+
+def _feature_order(model_name: str, model: Any) -> Optional[np.ndarray]:
+    """Validate a model's feature names once and return the column permutation it needs.
+
+    Returns None when the model already expects FEATURE_NAMES order. The
+    stored names are dropped afterwards so the libraries skip their
+    per-call feature-name checks on plain arrays.
+    """
+    names = None
+    if "feature_names_in_" in vars(model):
+        names = list(model.feature_names_in_)
+        del model.feature_names_in_
+    elif hasattr(type(model), "get_booster"):
+        booster = model.get_booster()
+        if booster.feature_names is not None:
+            names = list(booster.feature_names)
+            booster.feature_names = None
+
+    if names is None:
+        return None
+    if sorted(names) != sorted(FEATURE_NAMES):
+        raise ValueError(
+            f"Model {model_name} expects features {names}, expected {list(FEATURE_NAMES)}"
+        )
+    order = np.array([FEATURE_NAMES.index(name) for name in names])
+    return None if np.array_equal(order, np.arange(len(FEATURE_NAMES))) else order
 
 
 class JoblibModelRepository(ModelRepository):
     """Repository for joblib-serialized ML models."""
-    
-    def __init__(self):
+
+    def __init__(self, model_dir: Optional[Path] = None, compiled: bool = False, metrics: Optional[Any] = None):
+        self._model_dir = Path(model_dir) if model_dir is not None else MODEL_DIR
+        self._compiled = compiled
+        self._metrics = metrics
         self._models: Dict[str, Any] = {}
+        self._feature_orders: Dict[str, Optional[np.ndarray]] = {}
         self._load_models()
-    
+
     def _load_models(self) -> None:
         """Load all available models from disk."""
-        model_path = Path(__file__).parent.parent / 'ml_models'
-        model_files = {
-            'LOG': 'modelo_hipertension_LOG.pkl',
-            'RF': 'modelo_hipertension_RF.pkl',
-            'XGB': 'modelo_hipertension_XGB.pkl'
-        }
-        
-        for name, filename in model_files.items():
-            file_path = model_path / filename
+        # Imported here, with scikit-learn and XGBoost pulled in by unpickling,
+        # so that importing the application stays fast.
+        import joblib
+
+        for name, filename in MODEL_FILES.items():
+            file_path = self._model_dir / filename
             if file_path.exists():
-                self._models[name] = joblib.load(file_path)
-    
-    def predict(self, model_name: str, data: pd.DataFrame) -> int:
+                model = joblib.load(file_path)
+                self._feature_orders[name] = _feature_order(name, model)
+                self._models[name] = compile_model(model) if self._compiled else model
+
+    def predict(self, model_name: str, data: np.ndarray) -> int:
         """Make prediction using specified model."""
+        return self.predict_batch(model_name, data)[0]
+
+    def predict_batch(self, model_name: str, data: np.ndarray) -> List[int]:
+        """Make one prediction per row using specified model."""
         if model_name not in self._models:
             raise ValueError(f"Model {model_name} not found")
-        return self._models[model_name].predict(data)[0]
-    
+        order = self._feature_orders[model_name]
+        if order is not None:
+            data = data[:, order]
+        if self._metrics is None:
+            return np.asarray(self._models[model_name].predict(data)).tolist()
+        start = time.perf_counter_ns()
+        predictions = self._models[model_name].predict(data)
+        self._metrics.model_inference.labels(model_name).observe_ns(time.perf_counter_ns() - start)
+        return np.asarray(predictions).tolist()
+
     def get_available_models(self) -> List[str]:
         """Get list of available model names."""
-        return list(self._models.keys())
\ No newline at end of file
+        return list(self._models.keys())
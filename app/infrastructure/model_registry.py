@@ -0,0 +1,109 @@
+"""
+Process-wide model registry.
+
+This module keeps a single loaded model repository per process so that
+requests share it instead of unpickling the models on every call, and
+supports swapping in a freshly loaded repository without blocking
+in-flight requests.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from ..domain.repositories import ModelRepository
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Holds the current model repository and reloads it atomically."""
+
+    def __init__(self, loader: Callable[[], ModelRepository], model_dir: Path):
+        self._loader = loader
+        self._model_dir = Path(model_dir)
+        self._reload_lock = threading.Lock()
+        self._repository: Optional[ModelRepository] = None
+        self._mtimes: Dict[str, float] = {}
+        self._version = 0
+        self._loaded_at: Optional[float] = None
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def repository(self) -> ModelRepository:
+        """Return the current repository, loading it on first access."""
+        repository = self._repository
+        if repository is None:
+            with self._reload_lock:
+                if self._repository is None:
+                    self._load_locked()
+            repository = self._repository
+        return repository
+
+    @property
+    def version(self) -> int:
+        """Number of times the models have been loaded."""
+        return self._version
+
+    @property
+    def loaded_at(self) -> Optional[float]:
+        """Wall-clock time of the last successful load."""
+        return self._loaded_at
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether a repository has been loaded."""
+        return self._repository is not None
+
+    def add_reload_listener(self, listener: Callable[[], None]) -> None:
+        """Register a callback run after models are swapped by a reload."""
+        self._listeners.append(listener)
+
+    def reload(self) -> int:
+        """Load the models again and swap them in; return the new version."""
+        with self._reload_lock:
+            self._load_locked()
+            version = self._version
+        if version > 1:
+            for listener in self._listeners:
+                listener()
+        return version
+
+    def has_changed(self) -> bool:
+        """Check whether model files changed since the last load."""
+        return self._snapshot_mtimes() != self._mtimes
+
+    async def watch(self, interval: float) -> None:
+        """Poll the model directory and reload when files change."""
+        while True:
+            await asyncio.sleep(interval)
+            if not self.has_changed():
+                continue
+            try:
+                version = await asyncio.to_thread(self.reload)
+                logger.info("Model files changed, reloaded models (version %d)", version)
+            except Exception:
+                logger.exception("Model reload failed, keeping previous models")
+
+    def _load_locked(self) -> None:
+        """Load a new repository and publish it with a single reference swap."""
+        mtimes = self._snapshot_mtimes()
+        repository = self._loader()
+        # In-flight requests keep the reference they already hold.
+        self._repository = repository
+        self._mtimes = mtimes
+        self._version += 1
+        self._loaded_at = time.time()
+
+    def _snapshot_mtimes(self) -> Dict[str, float]:
+        """Return the modification time of every file in the model directory."""
+        if not self._model_dir.is_dir():
+            return {}
+        return {
+            path.name: path.stat().st_mtime
+            for path in self._model_dir.iterdir()
+            # Hidden files are partial writes that are still being replaced.
+            if path.is_file() and not path.name.startswith(".")
+        }
@@ -0,0 +1,164 @@
+"""
+Memory-mapped model store.
+
+This module exports the compiled evaluators to a directory of plain
+``.npy`` arrays plus a JSON manifest, and loads them back with
+``mmap_mode="r"``. Every worker process that maps the same files shares
+one copy of the model arrays through the page cache instead of holding
+its own unpickled models.
+
+Usage:
+    python -m app.infrastructure.model_store export <store_dir> [--model-dir DIR]
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Optional
+import numpy as np
+from .compiled_models import BoosterEvaluator, ForestEvaluator, LinearEvaluator
+from .ml_models import JoblibModelRepository
+
+MANIFEST_FILE = "manifest.json"
+STORE_FORMAT = 2
+
+
+def _replace_file(path: Path, write) -> None:
+    """Write a file next to its final path and move it into place.
+
+    Replacing the directory entry instead of truncating the file keeps
+    pages already mapped by running workers valid.
+    """
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as handle:
+        write(handle)
+    os.replace(tmp_path, path)
+
+
+class MmapModelRepository(JoblibModelRepository):
+    """Repository serving compiled models from a memory-mapped store.
+
+    Only the loading differs from the joblib repository: ``_load_models``
+    maps the store instead of unpickling the model files.
+    """
+
+    def __init__(self, store_dir: Path, metrics: Optional[Any] = None):
+        super().__init__(store_dir, compiled=True, metrics=metrics)
+
+    def _load_models(self) -> None:
+        """Map every model listed in the store manifest."""
+        manifest_path = self._model_dir / MANIFEST_FILE
+        if not manifest_path.exists():
+            return
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("format") != STORE_FORMAT:
+            raise ValueError(f"Unsupported model store format {manifest.get('format')!r}")
+
+        for name, entry in manifest["models"].items():
+            order = entry.get("feature_order")
+            self._feature_orders[name] = np.array(order) if order is not None else None
+            self._models[name] = self._load_evaluator(name, entry)
+
+    def _load_evaluator(self, name: str, entry: Dict[str, Any]) -> Any:
+        """Rebuild one evaluator from its manifest entry."""
+        classes = np.array(entry["classes"])
+        kind = entry["kind"]
+        if kind == "linear":
+            return LinearEvaluator(self._array(name, "coef"), self._array(name, "intercept"), classes)
+        if kind == "forest":
+            # Without the original model every batch size uses the flattened trees.
+            return ForestEvaluator(
+                feature=self._array(name, "feature"),
+                threshold=self._array(name, "threshold"),
+                children=self._array(name, "children"),
+                leaf_proba=self._array(name, "leaf_proba"),
+                roots=self._array(name, "roots"),
+                max_depth=entry["max_depth"],
+                classes=classes
+            )
+        if kind == "booster":
+            import xgboost
+
+            return BoosterEvaluator(
+                feature=self._array(name, "feature"),
+                threshold=self._array(name, "threshold"),
+                children=self._array(name, "children"),
+                leaf_value=self._array(name, "leaf_value"),
+                roots=self._array(name, "roots"),
+                max_depth=entry["max_depth"],
+                base_margin=entry["base_margin"],
+                classes=classes,
+                booster=xgboost.Booster(model_file=str(self._model_dir / f"{name}.ubj")),
+                iteration_range=tuple(entry["iteration_range"])
+            )
+        raise ValueError(f"Unknown model kind {kind!r} for model {name}")
+
+    def _array(self, name: str, field: str) -> np.ndarray:
+        """Map one stored array read-only."""
+        return np.asarray(np.load(self._model_dir / f"{name}.{field}.npy", mmap_mode="r"))
+
+    @staticmethod
+    def export(store_dir: Path, model_dir: Optional[Path] = None) -> Dict[str, Any]:
+        """Compile the pickled models and write them to a store directory."""
+        store_dir = Path(store_dir)
+        store_dir.mkdir(parents=True, exist_ok=True)
+        repository = JoblibModelRepository(model_dir, compiled=True)
+        manifest: Dict[str, Any] = {"format": STORE_FORMAT, "models": {}}
+
+        def save(name: str, field: str, array: np.ndarray) -> None:
+            _replace_file(store_dir / f"{name}.{field}.npy", lambda handle: np.save(handle, array))
+
+        for name, evaluator in repository._models.items():
+            order = repository._feature_orders[name]
+            entry: Dict[str, Any] = {
+                "classes": evaluator.classes.tolist(),
+                "feature_order": order.tolist() if order is not None else None,
+            }
+            if isinstance(evaluator, LinearEvaluator):
+                entry["kind"] = "linear"
+                save(name, "coef", evaluator.coef.T)
+                save(name, "intercept", evaluator.intercept)
+            elif isinstance(evaluator, ForestEvaluator):
+                entry["kind"] = "forest"
+                entry["max_depth"] = evaluator.max_depth
+                for field in ("feature", "threshold", "children", "leaf_proba", "roots"):
+                    save(name, field, getattr(evaluator, field))
+            elif isinstance(evaluator, BoosterEvaluator):
+                entry["kind"] = "booster"
+                entry["max_depth"] = evaluator.max_depth
+                entry["base_margin"] = float(evaluator.base_margin)
+                entry["iteration_range"] = list(evaluator.iteration_range)
+                for field in ("feature", "threshold", "children", "leaf_value", "roots"):
+                    save(name, field, getattr(evaluator, field))
+                raw = evaluator.booster.save_raw(raw_format="ubj")
+                _replace_file(store_dir / f"{name}.ubj", lambda handle: handle.write(raw))
+            else:
+                raise ValueError(f"Model {name} has no compiled form and cannot be stored")
+            manifest["models"][name] = entry
+
+        # Written last so a reader never sees a manifest pointing at missing files.
+        _replace_file(
+            store_dir / MANIFEST_FILE,
+            lambda handle: handle.write(json.dumps(manifest, indent=2).encode())
+        )
+        return manifest
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Manage the memory-mapped model store.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export_parser = subcommands.add_parser("export", help="Compile the .pkl models into a store directory")
+    export_parser.add_argument("store_dir", type=Path)
+    export_parser.add_argument("--model-dir", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    manifest = MmapModelRepository.export(args.store_dir, args.model_dir)
+    print(f"Exported {', '.join(manifest['models'])} to {args.store_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
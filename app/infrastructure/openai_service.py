@@ -7,34 +7,168 @@ medical recommendations using OpenAI's API.
 
 import os
 import asyncio
-from openai import OpenAI
-from dotenv import load_dotenv
-from ..domain.repositories import RecommendationService
+import random
+import time
+from typing import Any, Dict, Optional, Tuple
+from ..domain.repositories import RecommendationService, RecommendationUnavailableError
+from .cache import AsyncTTLCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
 
-load_dotenv()
+
+def _retryable_errors() -> Tuple[type, ...]:
+    """Return the OpenAI errors worth retrying."""
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+    return (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+def _unavailable_errors() -> Tuple[type, ...]:
+    """Return the errors that mean OpenAI cannot answer right now."""
+    import httpx
+    from openai import OpenAIError
+
+    return (OpenAIError, httpx.HTTPError, CircuitOpenError)
 
 
 class OpenAIRecommendationService(RecommendationService):
     """OpenAI-based recommendation service."""
-    
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    
+
+    MODEL = "gpt-4o"
+    MAX_TOKENS = 300
+    SYSTEM_PROMPT = "Eres un asistente médico experto en hipertensión."
+
+    def __init__(
+        self,
+        cache: Optional[AsyncTTLCache] = None,
+        max_concurrency: int = 16,
+        timeout: float = 30.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        max_connections: int = 32,
+        metrics: Optional[Any] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None
+    ):
+        # The SDK takes a third of a second to import, so it is only loaded
+        # when the service is created during startup, not with app.main.
+        import httpx
+        from dotenv import load_dotenv
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        load_dotenv()
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=timeout,
+            # Retries are handled here so they respect the concurrency limit.
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_connections
+                ),
+                timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0))
+            )
+        )
+        self.cache = cache if cache is not None else AsyncTTLCache()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.metrics = metrics
+        self.circuit_breaker = circuit_breaker
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
     async def generate_recommendation(self, prediction: str) -> str:
         """Generate recommendation based on prediction."""
         prompt = (
             f"En base a la siguiente predicción sobre el riesgo de hipertensión: '{prediction}', "
             "¿qué me podrías recomendar? Por favor responde en un párrafo breve y completo."
         )
-        
-        response = await asyncio.to_thread(
-            self.client.chat.completions.create,
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "Eres un asistente médico experto en hipertensión."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300
+        return await self._recommend(prompt)
+
+    async def generate_consensus_recommendation(self, predictions: Dict[str, str]) -> str:
+        """Generate one recommendation from the predictions of every model."""
+        labels = set(predictions.values())
+        if len(labels) == 1:
+            # Unanimous models share the cached single-prediction recommendation.
+            return await self.generate_recommendation(labels.pop())
+
+        summary = ", ".join(f"{model}: '{label}'" for model, label in sorted(predictions.items()))
+        prompt = (
+            "Varios modelos predijeron el riesgo de hipertensión de un paciente y no coinciden "
+            f"({summary}). Teniendo en cuenta todas las predicciones, ¿qué me podrías recomendar? "
+            "Por favor responde en un párrafo breve y completo."
         )
-        
-        return response.choices[0].message.content.strip()
\ No newline at end of file
+        return await self._recommend(prompt)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Return recommendation cache counters."""
+        return self.cache.stats()
+
+    async def warm_up(self) -> None:
+        """Open a pooled connection to the API before the first completion needs it."""
+        # Listing models costs no tokens but does the DNS, TCP and TLS handshakes.
+        await self.client.models.list()
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections."""
+        await self.client.close()
+
+    async def _recommend(self, prompt: str) -> str:
+        """Return the cached completion for a prompt, requesting it at most once at a time."""
+        key = (self.MODEL, self.MAX_TOKENS, self.SYSTEM_PROMPT, prompt)
+        start = time.perf_counter_ns()
+        try:
+            recommendation = await self.cache.get_or_load(key, lambda: self._complete(prompt))
+        except _unavailable_errors() as exc:
+            raise RecommendationUnavailableError(f"{type(exc).__name__}: {exc}") from exc
+        if self.metrics is not None:
+            self.metrics.recommendation.observe_ns(time.perf_counter_ns() - start)
+        return recommendation
+
+    async def _complete(self, prompt: str) -> str:
+        """Ask the model for a completion, unless the circuit is open."""
+        if self.circuit_breaker is None:
+            return await self._complete_with_retries(prompt)
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("OpenAI circuit is open")
+        try:
+            recommendation = await self._complete_with_retries(prompt)
+        except BaseException:
+            # Cancellation counts too, so a cancelled trial call cannot hold the circuit half open.
+            self.circuit_breaker.record_failure()
+            raise
+        self.circuit_breaker.record_success()
+        return recommendation
+
+    async def _complete_with_retries(self, prompt: str) -> str:
+        """Ask the model for a completion, retrying transient failures."""
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    response = await self._create_completion(prompt)
+                return response.choices[0].message.content.strip()
+            except _retryable_errors():
+                if attempt >= self.max_retries:
+                    raise
+                # Full jitter keeps retries from many requests from lining up.
+                await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+                attempt += 1
+
+    async def _create_completion(self, prompt: str) -> Any:
+        """Send one completion request, timing it when metrics are enabled."""
+        start = time.perf_counter_ns()
+        outcome = "error"
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.MODEL,
+                messages=[
+                    {"role": "system", "content": self.SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=self.MAX_TOKENS
+            )
+            outcome = "ok"
+            return response
+        finally:
+            if self.metrics is not None:
+                self.metrics.openai_request.labels(outcome).observe_ns(time.perf_counter_ns() - start)
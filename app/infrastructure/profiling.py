@@ -0,0 +1,117 @@
+"""
+On-demand request profiling.
+
+This module profiles single requests with ``cProfile`` and writes each
+profile to a directory as a ``.prof`` file, readable with ``pstats`` or
+snakeviz. Only one request is profiled at a time: the profiler hooks the
+whole event loop thread, so concurrent requests share its call tree, and
+a second profiler would replace the first.
+
+cProfile only sees the thread it runs on, so inference submitted to the
+inference executor while a request is profiled runs under a profiler of
+its own in the worker thread or process; its stats come back with the
+result and are merged into the request's profile. Merging and writing
+the profile happen on a worker thread, so a large profile does not
+stall the event loop.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import cProfile
+import pstats
+import random
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+# Stats collected off the event loop thread for the request being profiled, if any.
+_worker_stats: contextvars.ContextVar[Optional[List[Dict]]] = contextvars.ContextVar(
+    "profile_worker_stats", default=None
+)
+
+
+class _Stats:
+    """Raw profiler stats in the shape ``pstats.Stats.add`` takes."""
+
+    def __init__(self, stats: Dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        """Nothing to do, the stats are complete."""
+
+
+def is_profiling() -> bool:
+    """Tell whether the current request is being profiled."""
+    return _worker_stats.get() is not None
+
+
+def add_worker_stats(stats: Dict) -> None:
+    """Merge stats collected in a worker into the current request's profile."""
+    collected = _worker_stats.get()
+    if collected is not None:
+        collected.append(stats)
+
+
+def profiled_call(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Dict]:
+    """Call a function under a profiler of its own and return its result and the stats.
+
+    Runs in executor workers; module-level so that process pools can pickle it.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = fn(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+class RequestProfiler:
+    """Profiles requests chosen by a header or by sampling."""
+
+    def __init__(
+        self,
+        profile_dir: Path,
+        sample_rate: float = 0.0,
+        random_source: Callable[[], float] = random.random
+    ):
+        self.profile_dir = Path(profile_dir)
+        self.sample_rate = sample_rate
+        self._random = random_source
+        self._active = False
+        self.profiles = 0
+
+    def should_profile(self, requested: bool) -> bool:
+        """Tell whether to profile a request, asked for or picked by sampling."""
+        if self._active:
+            return False
+        return requested or (self.sample_rate > 0 and self._random() < self.sample_rate)
+
+    @contextlib.asynccontextmanager
+    async def profile(self, name: str) -> AsyncIterator[str]:
+        """Profile the enclosed code, yielding the id its profile file is named after."""
+        self._active = True
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+        worker_stats: List[Dict] = []
+        token = _worker_stats.set(worker_stats)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profile_id
+        finally:
+            profiler.disable()
+            _worker_stats.reset(token)
+            self._active = False
+            self.profiles += 1
+            await asyncio.to_thread(self._write, profile_id, profiler, worker_stats)
+
+    def _write(self, profile_id: str, profiler: cProfile.Profile, worker_stats: List[Dict]) -> None:
+        """Merge the worker stats into the profile and write it to the profile directory."""
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        stats = pstats.Stats(profiler)
+        for collected in worker_stats:
+            stats.add(_Stats(collected))
+        stats.dump_stats(self.profile_dir / f"{profile_id}.prof")
@@ -0,0 +1,146 @@
+"""
+Background recommendation jobs.
+
+This module runs recommendation work after the predictions have been
+returned: jobs wait in a bounded queue, a fixed pool of workers drains
+it, so a burst of requests turns into steady upstream load, and finished
+jobs are kept for a while so clients can collect their results.
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from .cache import AsyncTTLCache
+from ..domain.entities import HypertensionAssessment, RecommendationJob
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised instead of queueing a job when the queue is full."""
+
+
+class RecommendationJobQueue:
+    """Bounded queue of recommendation jobs drained by a fixed pool of workers."""
+
+    def __init__(
+        self,
+        workers: int = 4,
+        max_queue_size: int = 1000,
+        ttl: float = 3600.0,
+        max_results: int = 10000,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Jobs not finished yet; finished ones move to the expiring results.
+        self._jobs: Dict[str, RecommendationJob] = {}
+        self._results = AsyncTTLCache(maxsize=max_results, ttl=ttl, clock=clock)
+        # Places held for jobs whose work is still being prepared.
+        self._reserved = 0
+        self.done = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def running(self) -> int:
+        """Jobs a worker is currently running."""
+        return len(self._jobs) - self.queue_depth
+
+    def reserve(self) -> None:
+        """Hold a place in the queue for a job submitted later with ``reserved=True``.
+
+        Lets callers refuse work before preparing it, when the queue is full.
+        A reservation that is not submitted must be given back with ``release``.
+        """
+        self._check_capacity()
+        self._reserved += 1
+
+    def release(self) -> None:
+        """Give back a place held by ``reserve`` without submitting a job."""
+        self._reserved -= 1
+
+    def submit(
+        self,
+        work: Callable[[], Awaitable[HypertensionAssessment]],
+        reserved: bool = False
+    ) -> RecommendationJob:
+        """Queue work that completes an assessment and return its job.
+
+        With ``reserved=True`` the job takes the place held by ``reserve``.
+        """
+        if reserved:
+            self.release()
+            if self._queue is None:
+                self._start()
+        else:
+            self._check_capacity()
+        job = RecommendationJob(job_id=uuid.uuid4().hex)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait((job, work))
+        return job
+
+    def get(self, job_id: str) -> Optional[RecommendationJob]:
+        """Return a pending or finished job, None once it has expired."""
+        job = self._jobs.get(job_id)
+        return job if job is not None else self._results.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Return queue and outcome counters."""
+        return {
+            "queued": self.queue_depth,
+            "running": self.running,
+            "done": self.done,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    async def aclose(self) -> None:
+        """Stop the workers; jobs still queued are dropped."""
+        tasks, self._tasks, self._queue = self._tasks, [], None
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def _check_capacity(self) -> None:
+        """Raise ``JobQueueFullError`` when queued and reserved jobs fill the queue."""
+        if self._queue is None:
+            self._start()
+        if self._queue.qsize() + self._reserved >= self.max_queue_size:
+            self.rejected += 1
+            raise JobQueueFullError(f"{self.max_queue_size} recommendation jobs are already waiting")
+
+    def _start(self) -> None:
+        """Create the queue and the workers on the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._tasks = [asyncio.ensure_future(self._work(self._queue)) for _ in range(self.workers)]
+
+    async def _work(self, queue: "asyncio.Queue[Tuple[RecommendationJob, Callable[[], Awaitable[Any]]]]") -> None:
+        """Run queued jobs one at a time, forever."""
+        while True:
+            job, work = await queue.get()
+            job.status = "running"
+            try:
+                job.assessment = await work()
+                job.status = "done"
+                self.done += 1
+            except Exception as exc:
+                logger.exception("Recommendation job %s failed", job.job_id)
+                job.error = str(exc) or type(exc).__name__
+                job.status = "failed"
+                self.failed += 1
+            self._jobs.pop(job.job_id, None)
+            self._results.set(job.job_id, job)
+            queue.task_done()
@@ -0,0 +1,153 @@
+"""
+Shadow scoring of candidate models.
+
+This module loads candidate versions of the production models and scores
+them on the features of live requests in the background, counting how
+often each candidate agrees with the production model of the same name.
+Requests only hand their features over; when the queue is full the work
+is dropped, so the live path never waits on a candidate.
+"""
+
+import asyncio
+import contextlib
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from ..domain.repositories import ModelRepository
+from .ml_models import JoblibModelRepository, MODEL_FILES
+
+logger = logging.getLogger(__name__)
+
+
+def load_candidates(candidate_dir: Path, compiled: bool = False) -> Dict[str, ModelRepository]:
+    """Load every candidate version, one subdirectory of model files per version."""
+    candidate_dir = Path(candidate_dir)
+    if not candidate_dir.is_dir():
+        return {}
+    candidates = {}
+    for version_dir in sorted(candidate_dir.iterdir()):
+        if version_dir.is_dir() and any((version_dir / filename).exists() for filename in MODEL_FILES.values()):
+            candidates[version_dir.name] = JoblibModelRepository(version_dir, compiled=compiled)
+    return candidates
+
+
+class _Agreement:
+    """Running comparison of one candidate model with its production model."""
+
+    def __init__(self):
+        self.rows = 0
+        self.agreements = 0
+        self.candidate_positive = 0
+        self.production_positive = 0
+
+    def add(self, candidate: np.ndarray, production: np.ndarray) -> None:
+        """Count a batch of paired predictions."""
+        self.rows += len(candidate)
+        self.agreements += int(np.count_nonzero(candidate == production))
+        self.candidate_positive += int(np.count_nonzero(candidate))
+        self.production_positive += int(np.count_nonzero(production))
+
+    def as_dict(self) -> Dict[str, float]:
+        """Return the counters and the share of rows where both models agree."""
+        return {
+            "rows": self.rows,
+            "agreements": self.agreements,
+            "agreement_rate": self.agreements / self.rows if self.rows else 0.0,
+            "candidate_positive": self.candidate_positive,
+            "production_positive": self.production_positive,
+        }
+
+
+class ShadowScorer:
+    """Scores candidate models on live traffic off the request path."""
+
+    def __init__(
+        self,
+        candidates: Dict[str, ModelRepository],
+        max_queue_size: int = 1000,
+        max_batch_rows: int = 1024
+    ):
+        self.candidates = candidates
+        self.max_queue_size = max_queue_size
+        self.max_batch_rows = max_batch_rows
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._agreement: Dict[Tuple[str, str], _Agreement] = {}
+        self.dropped = 0
+        self.failures = 0
+
+    def submit(self, features: np.ndarray, production: Dict[str, np.ndarray]) -> bool:
+        """Queue a feature matrix and the production predictions for it, without waiting.
+
+        Returns False when the work was dropped because the queue is full.
+        """
+        if not self.candidates:
+            return False
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = asyncio.ensure_future(self._work(self._queue))
+        try:
+            self._queue.put_nowait((features, production))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    def stats(self) -> Dict[str, object]:
+        """Return the queue counters and the agreement of every candidate model."""
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "dropped": self.dropped,
+            "failures": self.failures,
+            "candidates": [
+                {"version": version, "model": model, **agreement.as_dict()}
+                for (version, model), agreement in sorted(self._agreement.items())
+            ],
+        }
+
+    async def aclose(self) -> None:
+        """Stop the worker; queued work is dropped."""
+        task, self._task, self._queue = self._task, None, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def _work(self, queue: asyncio.Queue) -> None:
+        """Score whatever is queued in batches, forever."""
+        while True:
+            items = [await queue.get()]
+            rows = len(items[0][0])
+            while rows < self.max_batch_rows and not queue.empty():
+                items.append(queue.get_nowait())
+                rows += len(items[-1][0])
+            try:
+                # Candidates run in a thread so that scoring them never blocks the event loop.
+                scored = await asyncio.to_thread(self._score, items)
+            except Exception:
+                self.failures += 1
+                logger.exception("Shadow scoring failed")
+                scored = []
+            for key, candidate, production in scored:
+                if key not in self._agreement:
+                    self._agreement[key] = _Agreement()
+                self._agreement[key].add(candidate, production)
+            for _ in items:
+                queue.task_done()
+
+    def _score(
+        self,
+        items: List[Tuple[np.ndarray, Dict[str, np.ndarray]]]
+    ) -> List[Tuple[Tuple[str, str], np.ndarray, np.ndarray]]:
+        """Predict a batch with every candidate, paired with the production predictions."""
+        features = np.concatenate([item[0] for item in items])
+        scored = []
+        for version, repository in self.candidates.items():
+            for model in repository.get_available_models():
+                if any(model not in outputs for _, outputs in items):
+                    continue
+                production = np.concatenate([np.asarray(item[1][model]).reshape(-1) for item in items])
+                candidate = np.asarray(repository.predict_batch(model, features)).reshape(-1)
+                scored.append(((version, model), candidate, production))
+        return scored
@@ -1,11 +1,25 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.presentation.routes import router
+from contextlib import asynccontextmanager
+from app.startup_report import startup_report
+
+with startup_report.phase("import app.main"):
+    from fastapi import FastAPI
+    from fastapi.middleware.cors import CORSMiddleware
+    from app.presentation.middleware import MetricsMiddleware
+    from app.presentation.routes import router
+    from app.presentation import dependencies
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await dependencies.startup()
+    yield
+    await dependencies.shutdown()
 
 app = FastAPI(
     title="API de Predicción de Hipertensión",
     version="1.0.0",
-    description="API for hypertension risk prediction using machine learning models"
+    description="API for hypertension risk prediction using machine learning models",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -16,4 +30,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware, get_metrics=dependencies.get_metrics)
+
 app.include_router(router)
@@ -0,0 +1,434 @@
+"""
+Dependency wiring for the presentation layer.
+
+This module owns the process-wide instances shared by every request
+(model registry, recommendation service) and the FastAPI dependency
+functions that hand them to the routes.
+"""
+
+import asyncio
+import contextlib
+import gc
+import logging
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, Optional
+import numpy as np
+from ..config import get_settings
+from ..startup_report import startup_report
+from ..application.use_cases import HypertensionPredictionUseCase, InferenceOptions
+from ..domain.repositories import ModelRepository, RecommendationService
+from ..infrastructure.admission import AdmissionLimiter
+from ..infrastructure.cache import AsyncTTLCache
+from ..infrastructure.circuit_breaker import CircuitBreaker
+from ..infrastructure.fallback_recommendations import FallbackRecommendationService
+from ..infrastructure.audit_log import AuditLog
+from ..infrastructure.inference_executor import InferenceExecutor
+from ..infrastructure.metrics import PredictionMetrics
+from ..infrastructure.micro_batching import MicroBatcher
+from ..infrastructure.ml_models import JoblibModelRepository, MODEL_DIR
+from ..infrastructure.model_registry import ModelRegistry
+from ..infrastructure.model_store import MmapModelRepository
+from ..infrastructure.openai_service import OpenAIRecommendationService
+from ..infrastructure.profiling import RequestProfiler
+from ..infrastructure.recommendation_jobs import RecommendationJobQueue
+from ..infrastructure.shadow_scoring import ShadowScorer, load_candidates
+
+logger = logging.getLogger(__name__)
+
+_model_registry: Optional[ModelRegistry] = None
+_recommendation_service: Optional[RecommendationService] = None
+_inference_executor: Optional[InferenceExecutor] = None
+_micro_batcher: Optional[MicroBatcher] = None
+_metrics: Optional[PredictionMetrics] = None
+_prediction_cache: Optional[AsyncTTLCache] = None
+_idempotency_store: Optional[AsyncTTLCache] = None
+_recommendation_jobs: Optional[RecommendationJobQueue] = None
+_shadow_scorer: Optional[ShadowScorer] = None
+_admission_limiters: Dict[str, AdmissionLimiter] = {}
+_profiler: Optional[RequestProfiler] = None
+_audit_log: Optional[AuditLog] = None
+# Set once startup, warm-up included, has finished.
+_started = False
+_background_tasks: list = []
+
+
+def _model_dir() -> Path:
+    """Return the directory the models are loaded from."""
+    settings = get_settings()
+    if settings.model_store:
+        return Path(settings.model_store)
+    return Path(settings.model_dir) if settings.model_dir else MODEL_DIR
+
+
+def _repository_factory() -> Callable[[], ModelRepository]:
+    """Return a picklable callable that loads the configured repository."""
+    settings = get_settings()
+    if settings.model_store:
+        return partial(MmapModelRepository, _model_dir())
+    return partial(JoblibModelRepository, _model_dir(), compiled=settings.compiled_inference)
+
+
+def get_model_registry() -> ModelRegistry:
+    """Return the process-wide model registry."""
+    global _model_registry
+    if _model_registry is None:
+        loader = _repository_factory()
+        metrics = get_metrics()
+        if metrics is not None:
+            # Only in-process repositories record inference time; process workers cannot share it.
+            loader = partial(loader, metrics=metrics)
+        _model_registry = ModelRegistry(loader, _model_dir())
+        executor = get_inference_executor()
+        if executor is not None:
+            _model_registry.add_reload_listener(executor.restart)
+    return _model_registry
+
+
+def get_inference_executor() -> Optional[InferenceExecutor]:
+    """Return the process-wide inference executor, if one is configured."""
+    global _inference_executor
+    settings = get_settings()
+    if _inference_executor is None and settings.inference_executor != "none":
+        _inference_executor = InferenceExecutor(
+            kind=settings.inference_executor,
+            max_workers=settings.inference_workers,
+            repository_factory=_repository_factory()
+        )
+    return _inference_executor
+
+
+def get_micro_batcher() -> Optional[MicroBatcher]:
+    """Return the process-wide request coalescer, if micro-batching is enabled."""
+    global _micro_batcher
+    settings = get_settings()
+    if _micro_batcher is None and settings.micro_batch_enabled:
+        _micro_batcher = MicroBatcher(
+            window=settings.micro_batch_window_ms / 1000.0,
+            max_batch_size=settings.micro_batch_max_size,
+            executor=get_inference_executor()
+        )
+    return _micro_batcher
+
+
+def get_recommendation_service() -> RecommendationService:
+    """Return the process-wide recommendation service."""
+    global _recommendation_service
+    if _recommendation_service is None:
+        settings = get_settings()
+        _recommendation_service = OpenAIRecommendationService(
+            cache=AsyncTTLCache(
+                maxsize=settings.recommendation_cache_size,
+                ttl=settings.recommendation_cache_ttl
+            ),
+            max_concurrency=settings.openai_max_concurrency,
+            timeout=settings.openai_timeout,
+            max_retries=settings.openai_max_retries,
+            max_connections=settings.openai_max_connections,
+            metrics=get_metrics(),
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=settings.openai_circuit_failures,
+                reset_timeout=settings.openai_circuit_reset
+            ) if settings.openai_circuit_failures > 0 else None
+        )
+    return _recommendation_service
+
+
+def get_prediction_cache() -> Optional[AsyncTTLCache]:
+    """Return the process-wide prediction result cache, if enabled."""
+    global _prediction_cache
+    settings = get_settings()
+    if _prediction_cache is None and settings.prediction_cache_size > 0:
+        _prediction_cache = AsyncTTLCache(
+            maxsize=settings.prediction_cache_size,
+            ttl=settings.prediction_cache_ttl
+        )
+    return _prediction_cache
+
+
+def get_idempotency_store() -> Optional[AsyncTTLCache]:
+    """Return the process-wide store of responses by idempotency key, if enabled."""
+    global _idempotency_store
+    settings = get_settings()
+    if _idempotency_store is None and settings.idempotency_cache_size > 0:
+        _idempotency_store = AsyncTTLCache(
+            maxsize=settings.idempotency_cache_size,
+            ttl=settings.idempotency_ttl
+        )
+    return _idempotency_store
+
+
+def get_recommendation_jobs() -> Optional[RecommendationJobQueue]:
+    """Return the process-wide queue of deferred recommendation jobs, if enabled."""
+    global _recommendation_jobs
+    settings = get_settings()
+    if _recommendation_jobs is None and settings.recommendation_job_workers > 0:
+        _recommendation_jobs = RecommendationJobQueue(
+            workers=settings.recommendation_job_workers,
+            max_queue_size=settings.recommendation_job_queue_size,
+            ttl=settings.recommendation_job_ttl,
+            max_results=settings.recommendation_job_results
+        )
+    return _recommendation_jobs
+
+
+def get_shadow_scorer() -> Optional[ShadowScorer]:
+    """Return the process-wide shadow scorer of candidate models, if configured."""
+    global _shadow_scorer
+    settings = get_settings()
+    if _shadow_scorer is None and settings.shadow_model_dir:
+        _shadow_scorer = ShadowScorer(
+            load_candidates(Path(settings.shadow_model_dir), compiled=settings.compiled_inference),
+            max_queue_size=settings.shadow_queue_size
+        )
+    return _shadow_scorer
+
+
+def get_admission_limiter(lane: str) -> Optional[AdmissionLimiter]:
+    """Return the process-wide admission limiter of a /predict lane, if enabled.
+
+    ``recommendations`` covers requests waiting on recommendations and
+    ``predictions`` those that skip them, which get their own, larger cap.
+    """
+    settings = get_settings()
+    max_in_flight = (
+        settings.admission_max_in_flight if lane == "recommendations"
+        else settings.admission_max_in_flight_predictions
+    )
+    if lane not in _admission_limiters and max_in_flight > 0:
+        _admission_limiters[lane] = AdmissionLimiter(
+            max_in_flight=max_in_flight,
+            max_waiting=settings.admission_max_waiting,
+            wait_timeout=settings.admission_wait_timeout
+        )
+    return _admission_limiters.get(lane)
+
+
+def get_profiler() -> Optional[RequestProfiler]:
+    """Return the process-wide request profiler, if profiling is enabled."""
+    global _profiler
+    settings = get_settings()
+    if _profiler is None and settings.profiling_enabled:
+        _profiler = RequestProfiler(Path(settings.profiling_dir), sample_rate=settings.profiling_sample_rate)
+    return _profiler
+
+
+def get_audit_log() -> Optional[AuditLog]:
+    """Return the process-wide prediction audit log, if a path is configured."""
+    global _audit_log
+    settings = get_settings()
+    if _audit_log is None and settings.audit_log_path:
+        _audit_log = AuditLog(
+            Path(settings.audit_log_path),
+            max_bytes=settings.audit_log_max_bytes,
+            backup_count=settings.audit_log_backups,
+            max_queue_size=settings.audit_log_queue_size,
+            overflow=settings.audit_log_overflow,
+            flush_interval=settings.audit_log_flush_interval
+        )
+    return _audit_log
+
+
+def get_metrics() -> Optional[PredictionMetrics]:
+    """Return the process-wide metrics, if metrics are enabled."""
+    global _metrics
+    if _metrics is None and get_settings().metrics_enabled:
+        _metrics = PredictionMetrics()
+        _metrics.add_collector(partial(_collect_metrics, _metrics))
+    return _metrics
+
+
+def _collect_metrics(metrics: PredictionMetrics) -> None:
+    """Copy the state of the shared instances into gauges before rendering."""
+    if _inference_executor is not None:
+        metrics.inference_in_flight.set(_inference_executor.in_flight)
+        metrics.inference_queue_depth.set(_inference_executor.queue_depth)
+    if isinstance(_recommendation_service, OpenAIRecommendationService):
+        stats = _recommendation_service.cache_stats()
+        for result in ("hits", "misses", "coalesced"):
+            metrics.recommendation_cache.labels(result).set(stats[result])
+        metrics.recommendation_cache_size.set(stats["size"])
+        breaker = _recommendation_service.circuit_breaker
+        metrics.openai_circuit_open.set(int(breaker is not None and breaker.state == "open"))
+    if _prediction_cache is not None:
+        stats = _prediction_cache.stats()
+        for result in ("hits", "misses", "coalesced"):
+            metrics.prediction_cache.labels(result).set(stats[result])
+    if _micro_batcher is not None:
+        stats = _micro_batcher.stats()
+        metrics.micro_batches.labels().set(stats["batches"])
+        metrics.micro_batch_rows.labels().set(stats["rows"])
+    if _recommendation_jobs is not None:
+        stats = _recommendation_jobs.stats()
+        for outcome in ("done", "failed", "rejected"):
+            metrics.recommendation_jobs.labels(outcome).set(stats[outcome])
+        metrics.recommendation_job_queue_depth.set(stats["queued"])
+    for lane, limiter in _admission_limiters.items():
+        stats = limiter.stats()
+        metrics.admission_in_flight.labels(lane).set(stats["in_flight"])
+        metrics.admission_waiting.labels(lane).set(stats["waiting"])
+        metrics.admission_rejected.labels(lane).set(stats["rejected"])
+    if _shadow_scorer is not None:
+        stats = _shadow_scorer.stats()
+        for candidate in stats["candidates"]:
+            metrics.shadow_rows.labels(candidate["version"], candidate["model"]).set(candidate["rows"])
+            metrics.shadow_agreements.labels(candidate["version"], candidate["model"]).set(candidate["agreements"])
+        metrics.shadow_dropped.set(stats["dropped"])
+    if _audit_log is not None:
+        stats = _audit_log.stats()
+        metrics.audit_log_written.set(stats["written"])
+        metrics.audit_log_dropped.set(stats["dropped"])
+        metrics.audit_log_queue_depth.set(stats["queued"])
+    if _model_registry is not None:
+        metrics.model_version.set(_model_registry.version)
+
+
+def get_prediction_use_case() -> HypertensionPredictionUseCase:
+    """Create and return prediction use case with dependencies."""
+    registry = get_model_registry()
+    # Read before the repository: a reload in between leaves the key older than the models
+    # read, which only costs a cache miss. The other order could cache old predictions
+    # under the new version.
+    cache_version = registry.version
+    model_repo = registry.repository
+    recommendation_service = get_recommendation_service()
+    settings = get_settings()
+    return HypertensionPredictionUseCase(
+        model_repo,
+        recommendation_service,
+        inference=InferenceOptions(
+            executor=get_inference_executor(),
+            micro_batcher=get_micro_batcher(),
+            feature_dtype=np.dtype(settings.feature_dtype)
+        ),
+        metrics=get_metrics(),
+        result_cache=get_prediction_cache(),
+        cache_version=cache_version,
+        request_deadline=settings.request_deadline if settings.request_deadline > 0 else None,
+        fallback_service=FallbackRecommendationService() if settings.recommendation_fallback else None,
+        recommendation_jobs=get_recommendation_jobs(),
+        shadow_scorer=get_shadow_scorer(),
+        audit_log=get_audit_log()
+    )
+
+
+def get_prediction_use_case_factory() -> Callable[[], HypertensionPredictionUseCase]:
+    """Return the use case factory, for connections that outlive a model reload."""
+    return get_prediction_use_case
+
+
+def preload() -> None:
+    """Load the models before the server forks its workers.
+
+    Run in the master process (gunicorn's ``when_ready`` hook) so forked
+    workers share the loaded model pages copy-on-write instead of each
+    loading their own copy.
+    """
+    get_model_registry().repository
+    # Keep the garbage collector from touching, and so copying, preloaded objects.
+    gc.collect()
+    gc.freeze()
+
+
+def preload_if_enabled() -> None:
+    """Preload the models when ``PRELOAD_MODELS`` is set."""
+    if get_settings().preload_models:
+        with startup_report.phase("preload models"):
+            preload()
+
+
+def is_ready() -> bool:
+    """Tell whether startup has finished and there are models to serve with."""
+    if not _started or _model_registry is None or not _model_registry.is_loaded:
+        return False
+    return bool(_model_registry.repository.get_available_models())
+
+
+async def warm_up() -> None:
+    """Run synthetic inference through every model and open the OpenAI connection.
+
+    A failed connection is only logged, as recommendations have their own
+    fallback; a failed prediction is raised.
+    """
+    service = get_recommendation_service()
+    if isinstance(service, OpenAIRecommendationService):
+        connection = asyncio.ensure_future(service.warm_up())
+    else:
+        connection = None
+    try:
+        models = await get_prediction_use_case().warm_up()
+        logger.info("Warmed up models %s", ", ".join(models) or "(none)")
+    finally:
+        if connection is not None:
+            try:
+                await connection
+            except Exception as exc:
+                logger.warning("Could not open the OpenAI connection during warm-up: %s", exc)
+
+
+async def startup() -> None:
+    """Load shared dependencies, warm them up and start background tasks."""
+    global _started
+    settings = get_settings()
+    registry = get_model_registry()
+    if not registry.is_loaded:
+        with startup_report.phase("load models"):
+            await asyncio.to_thread(registry.reload)
+    with startup_report.phase("create recommendation service"):
+        get_recommendation_service()
+    if settings.shadow_model_dir:
+        with startup_report.phase("load shadow models"):
+            await asyncio.to_thread(get_shadow_scorer)
+    if settings.warmup_enabled:
+        with startup_report.phase("warm up"):
+            await warm_up()
+    startup_report.log()
+    _started = True
+    if settings.model_reload_interval > 0:
+        _background_tasks.append(
+            asyncio.create_task(registry.watch(settings.model_reload_interval))
+        )
+
+
+async def shutdown() -> None:
+    """Stop background tasks and release shared dependencies."""
+    while _background_tasks:
+        task = _background_tasks.pop()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    if _recommendation_jobs is not None:
+        await _recommendation_jobs.aclose()
+    if _shadow_scorer is not None:
+        await _shadow_scorer.aclose()
+    if isinstance(_recommendation_service, OpenAIRecommendationService):
+        await _recommendation_service.aclose()
+    if _audit_log is not None:
+        # Last, so that it also gets the outcome of the jobs cancelled above. Jobs that were
+        # still queued never ran; only their predictions are on record.
+        await asyncio.to_thread(_audit_log.close)
+    reset_dependencies()
+
+
+def reset_dependencies() -> None:
+    """Drop the shared instances so the next request rebuilds them."""
+    global _model_registry, _recommendation_service, _inference_executor, _micro_batcher, _metrics
+    global _prediction_cache, _idempotency_store, _recommendation_jobs, _shadow_scorer, _profiler, _started
+    global _audit_log
+    if _inference_executor is not None:
+        _inference_executor.shutdown(wait=False)
+    if _audit_log is not None:
+        _audit_log.close(timeout=0)
+    _model_registry = None
+    _recommendation_service = None
+    _inference_executor = None
+    _micro_batcher = None
+    _metrics = None
+    _prediction_cache = None
+    _idempotency_store = None
+    _recommendation_jobs = None
+    _shadow_scorer = None
+    _admission_limiters.clear()
+    _profiler = None
+    _audit_log = None
+    _started = False
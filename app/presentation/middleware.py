@@ -0,0 +1,48 @@
+"""
+HTTP middleware.
+
+This module records request counts, latencies, in-flight requests and
+server errors for every HTTP request. It is a plain ASGI middleware
+rather than a ``BaseHTTPMiddleware`` so it adds no extra task or
+response streaming to the request path.
+"""
+
+import time
+from typing import Any, Callable
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording HTTP metrics."""
+
+    def __init__(self, app: Any, get_metrics: Callable[[], Any]):
+        self.app = app
+        self.get_metrics = get_metrics
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        metrics = self.get_metrics() if scope["type"] == "http" else None
+        if metrics is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter_ns()
+        metrics.http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.http_requests_in_flight.dec()
+            # The route template, not the raw path, keeps label cardinality bounded.
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            method = scope["method"]
+            metrics.http_request_duration.labels(method, path).observe_ns(time.perf_counter_ns() - start)
+            metrics.http_requests.labels(method, path, str(status)).inc()
+            if status >= 500:
+                metrics.http_request_errors.labels(method, path).inc()
@@ -5,39 +5,74 @@ This module defines the FastAPI routes and handles HTTP requests
 for the hypertension prediction service.
 """
 
-from fastapi import APIRouter, Depends
-from .schemas import PatientDataRequest, HypertensionRiskResponse, PredictionResponse
-from ..domain.entities import PatientData
+import asyncio
+import contextlib
+import hmac
+import json
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import ValidationError
+from .schemas import (
+    PatientDataRequest, HypertensionRiskResponse, PredictionResponse, ModelReloadResponse,
+    BatchPredictionRequest, BatchPredictionResponse, PatientReading, RecommendationMode,
+    DeferredRiskResponse, RecommendationJobResponse, ShadowModelStats, ShadowStatsResponse, HealthResponse
+)
+from .serialization import (
+    JSON, NPY, ARROW, MSGPACK, media_type, negotiate, parse_batch_request, patient_columns,
+    decode_columns, dumps, encode_assessments_json, encode_columnar
+)
+from .dependencies import (
+    get_prediction_use_case, get_prediction_use_case_factory, get_model_registry, get_metrics,
+    get_idempotency_store, get_recommendation_jobs, get_shadow_scorer, get_admission_limiter,
+    get_profiler, is_ready
+)
+from ..config import get_settings
+from ..domain.entities import PatientData, HypertensionAssessment, AssessmentEvent
 from ..application.use_cases import HypertensionPredictionUseCase
-from ..infrastructure.ml_models import JoblibModelRepository
-from ..infrastructure.openai_service import OpenAIRecommendationService
+from ..infrastructure.admission import AdmissionRejected
+from ..infrastructure.cache import AsyncTTLCache
+from ..infrastructure.metrics import CONTENT_TYPE, PredictionMetrics
+from ..infrastructure.model_registry import ModelRegistry
+from ..infrastructure.recommendation_jobs import JobQueueFullError, RecommendationJobQueue
+from ..infrastructure.shadow_scoring import ShadowScorer
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Dependency injection
-def get_prediction_use_case() -> HypertensionPredictionUseCase:
-    """Create and return prediction use case with dependencies."""
-    model_repo = JoblibModelRepository()
-    recommendation_service = OpenAIRecommendationService()
-    return HypertensionPredictionUseCase(model_repo, recommendation_service)
+# Seconds a shed request is asked to wait before retrying.
+RETRY_AFTER = "1"
 
 
-@router.post("/predict", response_model=HypertensionRiskResponse)
-async def predict_hypertension_risk(
-    request: PatientDataRequest,
-    use_case: HypertensionPredictionUseCase = Depends(get_prediction_use_case)
-) -> HypertensionRiskResponse:
-    """Predict hypertension risk for a patient."""
-    patient_data = PatientData(
+def _matches_admin_token(value: Optional[str], admin_token: str) -> bool:
+    """Compare a sent token with the configured one in constant time."""
+    return value is not None and hmac.compare_digest(value.encode("utf-8"), admin_token.encode("utf-8"))
+
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """Reject admin calls without the configured token, and all of them when none is configured."""
+    admin_token = get_settings().admin_token
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not _matches_admin_token(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def _to_patient_data(request: PatientDataRequest) -> PatientData:
+    """Map a request DTO to the domain entity."""
+    return PatientData(
         peso=request.peso,
         estatura=request.estatura,
         actividad_total=request.actividad_total,
         tension_arterial=request.tension_arterial,
         edad=request.edad
     )
-    
-    assessment = await use_case.predict_hypertension_risk(patient_data)
-    
+
+
+def _to_response(assessment: HypertensionAssessment) -> HypertensionRiskResponse:
+    """Map a domain assessment to the response DTO."""
     predictions = [
         PredictionResponse(
             modelo=pred.modelo,
@@ -46,5 +81,500 @@ async def predict_hypertension_risk(
         )
         for pred in assessment.predictions
     ]
-    
-    return HypertensionRiskResponse(riesgo_hipertension=predictions)
\ No newline at end of file
+
+    return HypertensionRiskResponse(
+        riesgo_hipertension=predictions,
+        recomendacion=assessment.recomendacion,
+        degradado=assessment.degradado
+    )
+
+
+def _admission_lane(recommendation_mode: str, deferred: bool = False) -> str:
+    """Return the admission lane of a request."""
+    # Requests that do not wait on recommendations are cheap, so they get their own, larger cap.
+    return "predictions" if recommendation_mode == "none" or deferred else "recommendations"
+
+
+@contextlib.asynccontextmanager
+async def _admission(lane: str) -> AsyncIterator[None]:
+    """Hold an admission slot of a lane, raising AdmissionRejected when it is full."""
+    limiter = get_admission_limiter(lane)
+    if limiter is None:
+        yield
+        return
+    await limiter.acquire()
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def _shed(exc: AdmissionRejected) -> HTTPException:
+    """Map a rejected admission to a 503 asking the client to retry."""
+    return HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": RETRY_AFTER})
+
+
+async def admit_prediction(
+    recommendation_mode: RecommendationMode = Query(default="per_model"),
+    deferred: bool = Query(default=False)
+) -> AsyncIterator[None]:
+    """Hold an admission slot for the request, or shed it with a 503."""
+    try:
+        async with _admission(_admission_lane(recommendation_mode, deferred)):
+            yield
+    except AdmissionRejected as exc:
+        raise _shed(exc) from exc
+
+
+async def admit_batch() -> AsyncIterator[None]:
+    """Hold a predictions slot for a batch request, or shed it with a 503."""
+    # A batch asks for one recommendation per distinct label at most, so it is not a recommendations request.
+    try:
+        async with _admission("predictions"):
+            yield
+    except AdmissionRejected as exc:
+        raise _shed(exc) from exc
+
+
+async def profile_request(request: Request, response: Response) -> AsyncIterator[None]:
+    """Profile the request if profiling is enabled and it asks for it or is sampled.
+
+    An ``X-Profile`` header asks for a profile, and is only honoured with
+    the ``ADMIN_TOKEN`` in ``X-Admin-Token``; without a configured token
+    requests are only profiled by sampling. The profile id is returned in
+    ``X-Profile-Id``.
+    """
+    profiler = get_profiler()
+    if profiler is None:
+        yield
+        return
+    admin_token = get_settings().admin_token
+    requested = (
+        "x-profile" in request.headers
+        and bool(admin_token)
+        and _matches_admin_token(request.headers.get("x-admin-token"), admin_token)
+    )
+    if not profiler.should_profile(requested):
+        yield
+        return
+    async with profiler.profile("predict") as profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+        yield
+
+
+@router.post(
+    "/predict",
+    response_model=HypertensionRiskResponse,
+    dependencies=[Depends(admit_prediction), Depends(profile_request)],
+    responses={202: {"model": DeferredRiskResponse, "description": "Recommendations deferred to a job"}}
+)
+async def predict_hypertension_risk(
+    request: PatientDataRequest,
+    response: Response,
+    use_case: HypertensionPredictionUseCase = Depends(get_prediction_use_case),
+    idempotency_store: Optional[AsyncTTLCache] = Depends(get_idempotency_store),
+    recommendation_jobs: Optional[RecommendationJobQueue] = Depends(get_recommendation_jobs),
+    idempotency_key: Optional[str] = Header(default=None, max_length=255),
+    recommendation_mode: RecommendationMode = Query(default="per_model"),
+    deferred: bool = Query(default=False)
+) -> Union[HypertensionRiskResponse, Response]:
+    """Predict hypertension risk for a patient.
+
+    ``recommendation_mode`` chooses one recommendation per model
+    (``per_model``), one shared recommendation (``consensus``) or none.
+    With ``deferred=true`` the predictions are returned at once with a
+    ``job_id`` to collect the recommendations from ``/jobs/{job_id}``.
+    With an ``Idempotency-Key`` header, a retry of the same request gets
+    the stored response instead of a new computation.
+    """
+    if deferred and recommendation_jobs is None:
+        raise HTTPException(status_code=400, detail="Deferred recommendations are disabled")
+
+    async def predict() -> HypertensionRiskResponse:
+        patient_data = _to_patient_data(request)
+
+        if deferred:
+            return await _predict_deferred(use_case, patient_data, recommendation_mode)
+
+        assessment = await use_case.predict_hypertension_risk(patient_data, recommendation_mode)
+
+        return _to_response(assessment)
+
+    if idempotency_key is None or idempotency_store is None:
+        return _deferred_response(await predict(), response)
+
+    fingerprint = (recommendation_mode, deferred, request.model_dump_json())
+    replayed = True
+
+    async def predict_once():
+        nonlocal replayed
+        replayed = False
+        return fingerprint, await predict()
+
+    stored_fingerprint, result = await idempotency_store.get_or_load(idempotency_key, predict_once)
+    if stored_fingerprint != fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return _deferred_response(result, response)
+
+
+async def _predict_deferred(
+    use_case: HypertensionPredictionUseCase,
+    patient_data: PatientData,
+    recommendation_mode: str
+) -> DeferredRiskResponse:
+    """Predict now and queue the recommendations as a job."""
+    try:
+        assessment, job = await use_case.predict_hypertension_risk_deferred(patient_data, recommendation_mode)
+    except JobQueueFullError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": RETRY_AFTER}) from exc
+    return DeferredRiskResponse(
+        **_to_response(assessment).model_dump(),
+        job_id=job.job_id if job is not None else None
+    )
+
+
+def _deferred_response(
+    result: HypertensionRiskResponse,
+    response: Response
+) -> Union[HypertensionRiskResponse, Response]:
+    """Send a deferred result with its job id, which the /predict response model would drop."""
+    if not isinstance(result, DeferredRiskResponse):
+        return result
+    headers = dict(response.headers)
+    status_code = 200
+    if result.job_id is not None:
+        status_code = 202
+        headers["Location"] = f"/jobs/{result.job_id}"
+    return JSONResponse(result.model_dump(), status_code=status_code, headers=headers)
+
+
+@router.get("/jobs/{job_id}", response_model=RecommendationJobResponse)
+async def get_recommendation_job(
+    job_id: str,
+    recommendation_jobs: Optional[RecommendationJobQueue] = Depends(get_recommendation_jobs)
+) -> RecommendationJobResponse:
+    """Return a deferred recommendation job, with the complete assessment once it is done."""
+    job = recommendation_jobs.get(job_id) if recommendation_jobs is not None else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return RecommendationJobResponse(
+        job_id=job.job_id,
+        estado=job.status,
+        resultado=_to_response(job.assessment) if job.assessment is not None else None,
+        error=job.error
+    )
+
+
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+
+
+def _event_payload(event: AssessmentEvent) -> Dict[str, Any]:
+    """Map a streamed assessment event to its JSON payload."""
+    if event.event == "predictions":
+        return {"riesgo_hipertension": [
+            {"modelo": pred.modelo, "prediccion": pred.prediccion, "respuesta": None}
+            for pred in event.predictions
+        ]}
+    if event.event == "recommendation":
+        pred = event.predictions[0]
+        return {
+            "modelo": pred.modelo, "prediccion": pred.prediccion, "respuesta": pred.respuesta,
+            "degradado": event.degradado
+        }
+    if event.event == "consensus":
+        return {"recomendacion": event.recomendacion, "degradado": event.degradado}
+    return {"degradado": event.degradado}
+
+
+def _format_event(name: str, payload: Dict[str, Any], response_type: str) -> bytes:
+    """Frame one event as a server-sent event or an NDJSON line."""
+    if response_type == EVENT_STREAM:
+        return b"event: " + name.encode("ascii") + b"\ndata: " + dumps(payload) + b"\n\n"
+    return dumps({"event": name, **payload}) + b"\n"
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """Streaming response that runs its cleanup however sending ends.
+
+    A background task only runs after a complete send; this also covers a
+    client that disconnects, or a send that fails before the body starts.
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], cleanup: contextlib.AsyncExitStack, **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self._cleanup = cleanup
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self._cleanup.aclose()
+
+
+@router.post("/predict/stream", responses={200: {"content": {NDJSON: {}, EVENT_STREAM: {}}}})
+async def predict_hypertension_risk_stream(
+    request: PatientDataRequest,
+    use_case: HypertensionPredictionUseCase = Depends(get_prediction_use_case),
+    recommendation_mode: RecommendationMode = Query(default="per_model"),
+    accept: Optional[str] = Header(default=None)
+) -> StreamingResponse:
+    """Predict hypertension risk for a patient, streaming results as they complete.
+
+    Sends the predictions of every model right away, then each
+    recommendation as it arrives, then ``done``. ``Accept:
+    text/event-stream`` frames them as server-sent events, anything else
+    as newline-delimited JSON.
+    """
+    response_type = EVENT_STREAM if accept and EVENT_STREAM in accept else NDJSON
+    # Dependencies exit before a streamed body is sent, so the admission slot is held by the body.
+    cleanup = contextlib.AsyncExitStack()
+    try:
+        await cleanup.enter_async_context(_admission(_admission_lane(recommendation_mode)))
+    except AdmissionRejected as exc:
+        raise _shed(exc) from exc
+    try:
+        events = use_case.stream_hypertension_risk(_to_patient_data(request), recommendation_mode)
+        # Closing the events cancels the recommendations still pending.
+        cleanup.push_async_callback(events.aclose)
+        # The predictions are awaited here so that a failing model is still an HTTP error.
+        first = await events.__anext__()
+
+        async def body() -> AsyncIterator[bytes]:
+            try:
+                yield _format_event(first.event, _event_payload(first), response_type)
+                async for event in events:
+                    yield _format_event(event.event, _event_payload(event), response_type)
+            except Exception:
+                logger.exception("Streaming recommendations failed")
+                yield _format_event("error", {"detail": "Recommendation failed"}, response_type)
+
+        return _ClosingStreamingResponse(
+            body(),
+            cleanup,
+            media_type=response_type,
+            # Keeps proxies from buffering the stream.
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    except BaseException:
+        await cleanup.aclose()
+        raise
+
+
+_BINARY_BODY = {"schema": {"type": "string", "format": "binary"}}
+
+# The body is read by hand to support several media types, so it is documented here.
+_BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            JSON: {"schema": {
+                key: value
+                for key, value in BatchPredictionRequest.model_json_schema(
+                    ref_template="#/components/schemas/{model}"
+                ).items()
+                if key != "$defs"
+            }},
+            NPY: _BINARY_BODY,
+            ARROW: _BINARY_BODY,
+            MSGPACK: _BINARY_BODY,
+        }
+    }
+}
+
+
+@router.post(
+    "/predict/batch",
+    response_model=BatchPredictionResponse,
+    dependencies=[Depends(admit_batch)],
+    openapi_extra=_BATCH_REQUEST_BODY
+)
+async def predict_hypertension_risk_batch(
+    request: Request,
+    use_case: HypertensionPredictionUseCase = Depends(get_prediction_use_case),
+    recommendation_mode: RecommendationMode = Query(default="per_model"),
+    accept: Optional[str] = Header(default=None)
+) -> Response:
+    """Predict hypertension risk for many patients in one vectorized pass.
+
+    The body is JSON or, chosen by ``Content-Type``, one column per
+    patient field as ``.npy``, Arrow or msgpack; ``Accept`` chooses the
+    response format the same way. Columnar bodies and responses skip
+    per-patient objects entirely.
+    """
+    response_type = negotiate(accept)
+    content_type = media_type(request.headers.get("content-type"))
+    body = await request.body()
+
+    if content_type == JSON:
+        batch = parse_batch_request(body)
+        if response_type == JSON:
+            patients = [_to_patient_data(patient) for patient in batch.pacientes]
+
+            assessments = await use_case.predict_batch(patients, recommendation_mode)
+
+            return encode_assessments_json(assessments)
+        columns = patient_columns(batch.pacientes)
+    else:
+        columns = decode_columns(body, content_type)
+
+    if response_type == NPY:
+        # A .npy response only holds the prediction matrix.
+        recommendation_mode = "none"
+    assessment = await use_case.predict_columns(columns, recommendation_mode)
+    return encode_columnar(assessment, response_type)
+
+
+def _reading_id(message: str) -> Any:
+    """Recover the id of a reading that failed validation, if it has one."""
+    try:
+        data = json.loads(message)
+    except ValueError:
+        return None
+    return data.get("id") if isinstance(data, dict) else None
+
+
+@router.websocket("/ws/predict")
+async def predict_hypertension_risk_websocket(
+    websocket: WebSocket,
+    use_case_factory: Callable[[], HypertensionPredictionUseCase] = Depends(get_prediction_use_case_factory),
+    recommendation_mode: RecommendationMode = Query(default="per_model")
+) -> None:
+    """Predict a stream of patient readings over one connection.
+
+    Each text message is a ``/predict`` body with an optional ``id``, and
+    each reply is the ``/predict`` response with the same ``id``, or an
+    ``error``. Readings are predicted concurrently and replies are sent as
+    they finish, so clients can pipeline without waiting. At most
+    ``WEBSOCKET_MAX_IN_FLIGHT`` readings per connection are in progress;
+    beyond that no more messages are read until one finishes.
+    """
+    await websocket.accept()
+    in_flight = asyncio.Semaphore(get_settings().websocket_max_in_flight)
+    send_lock = asyncio.Lock()
+    tasks: Set[asyncio.Task] = set()
+
+    async def reply(message: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_text(dumps(message).decode("utf-8"))
+
+    async def predict(reading: PatientReading) -> None:
+        try:
+            # Each reading is admitted like a /predict request, so connections cannot bypass the cap.
+            async with _admission(_admission_lane(recommendation_mode)):
+                # A use case per reading, so a model reload reaches open connections.
+                assessment = await use_case_factory().predict_hypertension_risk(
+                    _to_patient_data(reading), recommendation_mode
+                )
+            message = {"id": reading.id, **_to_response(assessment).model_dump()}
+        except AdmissionRejected as exc:
+            message = {"id": reading.id, "error": str(exc)}
+        except Exception:
+            logger.exception("WebSocket prediction failed")
+            message = {"id": reading.id, "error": "Prediction failed"}
+        finally:
+            in_flight.release()
+        try:
+            await reply(message)
+        except (WebSocketDisconnect, RuntimeError):
+            # The client went away; the receive loop sees the disconnect.
+            pass
+
+    try:
+        while True:
+            await in_flight.acquire()
+            message = await websocket.receive_text()
+            try:
+                reading = PatientReading.model_validate_json(message)
+            except ValidationError as exc:
+                in_flight.release()
+                await reply({
+                    "id": _reading_id(message),
+                    "error": exc.errors(include_url=False, include_context=False, include_input=False)
+                })
+                continue
+            task = asyncio.create_task(predict(reading))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@router.post(
+    "/admin/models/reload",
+    response_model=ModelReloadResponse,
+    dependencies=[Depends(verify_admin_token)]
+)
+async def reload_models(
+    registry: ModelRegistry = Depends(get_model_registry)
+) -> ModelReloadResponse:
+    """Reload the models from disk without interrupting in-flight requests."""
+    version = await asyncio.to_thread(registry.reload)
+    return ModelReloadResponse(
+        version=version,
+        modelos=registry.repository.get_available_models()
+    )
+
+
+@router.get(
+    "/admin/shadow/stats",
+    response_model=ShadowStatsResponse,
+    dependencies=[Depends(verify_admin_token)]
+)
+async def shadow_stats(
+    shadow_scorer: Optional[ShadowScorer] = Depends(get_shadow_scorer)
+) -> ShadowStatsResponse:
+    """Return how often each candidate model agrees with production on live traffic."""
+    if shadow_scorer is None:
+        raise HTTPException(status_code=404, detail="Shadow scoring is disabled")
+    stats = shadow_scorer.stats()
+    return ShadowStatsResponse(
+        candidatos=[
+            ShadowModelStats(
+                version=candidate["version"],
+                modelo=candidate["model"],
+                filas=candidate["rows"],
+                coincidencias=candidate["agreements"],
+                tasa_coincidencia=candidate["agreement_rate"],
+                positivos_candidato=candidate["candidate_positive"],
+                positivos_produccion=candidate["production_positive"]
+            )
+            for candidate in stats["candidates"]
+        ],
+        en_cola=stats["queued"],
+        descartadas=stats["dropped"],
+        fallos=stats["failures"]
+    )
+
+
+@router.get("/health/live", response_model=HealthResponse)
+async def liveness() -> HealthResponse:
+    """Tell that the process is up and serving its event loop."""
+    return HealthResponse(estado="ok")
+
+
+@router.get(
+    "/health/ready",
+    response_model=HealthResponse,
+    responses={503: {"model": HealthResponse, "description": "Not ready to receive traffic"}}
+)
+async def readiness() -> Union[HealthResponse, Response]:
+    """Tell whether startup and warm-up have finished and models are available."""
+    if not is_ready():
+        return JSONResponse(HealthResponse(estado="not_ready").model_dump(), status_code=503)
+    return HealthResponse(estado="ready", modelos=get_model_registry().repository.get_available_models())
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(
+    metrics: Optional[PredictionMetrics] = Depends(get_metrics)
+) -> Response:
+    """Expose the service metrics in the Prometheus text format."""
+    if metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
@@ -5,26 +5,92 @@ This module defines the data transfer objects (DTOs) used
 for API request and response serialization.
 """
 
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Union
+
+MAX_BATCH_SIZE = 10000
+
+RecommendationMode = Literal["per_model", "consensus", "none"]
 
 
 class PatientDataRequest(BaseModel):
     """Request schema for patient data."""
     peso: float
-    estatura: float
+    # Columnar batches get the same checks in serialization._validate_columns.
+    estatura: float = Field(gt=0)
     actividad_total: float
     tension_arterial: float
     edad: int
 
 
+class PatientReading(PatientDataRequest):
+    """WebSocket message with one patient reading."""
+    id: Optional[Union[int, str]] = None
+
+
 class PredictionResponse(BaseModel):
     """Response schema for individual prediction."""
     modelo: str
     prediccion: str
-    respuesta: str
+    respuesta: Optional[str] = None
 
 
 class HypertensionRiskResponse(BaseModel):
     """Response schema for hypertension risk assessment."""
-    riesgo_hipertension: List[PredictionResponse]
\ No newline at end of file
+    riesgo_hipertension: List[PredictionResponse]
+    recomendacion: Optional[str] = None
+    degradado: bool = False
+
+
+class DeferredRiskResponse(HypertensionRiskResponse):
+    """Response schema for predictions whose recommendations are still being produced."""
+    job_id: Optional[str] = None
+
+
+class RecommendationJobResponse(BaseModel):
+    """Response schema for a deferred recommendation job."""
+    job_id: str
+    estado: Literal["pending", "running", "done", "failed"]
+    resultado: Optional[HypertensionRiskResponse] = None
+    error: Optional[str] = None
+
+
+class BatchPredictionRequest(BaseModel):
+    """Request schema for a batch of patients."""
+    pacientes: List[PatientDataRequest] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+
+class BatchPredictionResponse(BaseModel):
+    """Response schema for a batch of risk assessments, in request order."""
+    resultados: List[HypertensionRiskResponse]
+
+
+class ModelReloadResponse(BaseModel):
+    """Response schema for a model reload."""
+    version: int
+    modelos: List[str]
+
+
+class ShadowModelStats(BaseModel):
+    """Agreement of one candidate model with the production model of the same name."""
+    version: str
+    modelo: str
+    filas: int
+    coincidencias: int
+    tasa_coincidencia: float
+    positivos_candidato: int
+    positivos_produccion: int
+
+
+class ShadowStatsResponse(BaseModel):
+    """Response schema for the shadow scoring counters."""
+    candidatos: List[ShadowModelStats]
+    en_cola: int
+    descartadas: int
+    fallos: int
+
+
+class HealthResponse(BaseModel):
+    """Response schema for the health probes."""
+    estado: Literal["ok", "ready", "not_ready"]
+    modelos: List[str] = []
@@ -0,0 +1,266 @@
+"""
+Request and response encodings for batch predictions.
+
+This module decodes columnar request bodies (NumPy ``.npy``, Arrow IPC
+streams and msgpack) into one array per patient field, and encodes batch
+results as JSON, ``.npy``, Arrow or msgpack straight from the domain
+objects, without building a response model per patient. Arrow and
+msgpack need the optional ``pyarrow`` and ``msgpack`` packages.
+"""
+
+import importlib
+import importlib.util
+import io
+import json
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from fastapi import HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response
+from pydantic import ValidationError
+from .schemas import BatchPredictionRequest, PatientDataRequest, MAX_BATCH_SIZE
+from ..domain.entities import ColumnarAssessment, HypertensionAssessment, PATIENT_FIELDS
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+JSON = "application/json"
+NPY = "application/x-npy"
+ARROW = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+
+MEDIA_TYPES = (JSON, NPY, ARROW, MSGPACK)
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+# Optional package each media type needs.
+_REQUIRES = {ARROW: "pyarrow", MSGPACK: "msgpack"}
+
+PREDICTION_LABELS = np.array(["No", "Sí"], dtype=object)
+
+
+def media_type(content_type: Optional[str]) -> str:
+    """Return the bare media type of a Content-Type header, JSON when absent."""
+    if not content_type:
+        return JSON
+    value = content_type.split(";", 1)[0].strip().lower()
+    return _ALIASES.get(value, value)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Pick the response media type from an Accept header."""
+    if not accept:
+        return JSON
+    candidates = []
+    for position, item in enumerate(accept.split(",")):
+        value, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        candidates.append((-quality, position, media_type(value)))
+    for negative_quality, _, value in sorted(candidates):
+        if negative_quality >= 0:
+            break
+        if value in ("*/*", "application/*"):
+            return JSON
+        if value in MEDIA_TYPES and _is_available(value):
+            return value
+    raise HTTPException(status_code=406, detail=f"Supported response types: {', '.join(MEDIA_TYPES)}")
+
+
+def parse_batch_request(body: bytes) -> BatchPredictionRequest:
+    """Validate a JSON batch body directly from bytes."""
+    try:
+        return BatchPredictionRequest.model_validate_json(body)
+    except ValidationError as exc:
+        raise RequestValidationError(exc.errors(include_url=False), body=body) from exc
+
+
+def patient_columns(patients: Sequence[PatientDataRequest]) -> Dict[str, np.ndarray]:
+    """Turn validated JSON patients into one array per patient field."""
+    matrix = np.array([[getattr(patient, field) for field in PATIENT_FIELDS] for patient in patients], dtype=np.float64)
+    return {field: matrix[:, index] for index, field in enumerate(PATIENT_FIELDS)}
+
+
+def decode_columns(body: bytes, content_type: str) -> Dict[str, np.ndarray]:
+    """Decode a columnar body into one validated float array per patient field."""
+    try:
+        if content_type == NPY:
+            columns = _decode_npy(body)
+        elif content_type == ARROW:
+            columns = _decode_arrow(body)
+        elif content_type == MSGPACK:
+            columns = _decode_msgpack(body)
+        else:
+            raise HTTPException(
+                status_code=415, detail=f"Supported request types: {', '.join(MEDIA_TYPES)}"
+            )
+    except (ValueError, TypeError, KeyError) as exc:
+        raise HTTPException(status_code=422, detail=f"Invalid {content_type} body: {exc}") from exc
+    _validate_columns(columns)
+    return columns
+
+
+def _decode_npy(body: bytes) -> Dict[str, np.ndarray]:
+    """Read a 2-D array with one column per patient field."""
+    matrix = np.load(io.BytesIO(body), allow_pickle=False)
+    if matrix.ndim != 2 or matrix.shape[1] != len(PATIENT_FIELDS):
+        raise ValueError(f"expected an array of shape (rows, {len(PATIENT_FIELDS)}), got {matrix.shape}")
+    matrix = matrix.astype(np.float64, copy=False)
+    return {field: matrix[:, index] for index, field in enumerate(PATIENT_FIELDS)}
+
+
+def _decode_arrow(body: bytes) -> Dict[str, np.ndarray]:
+    """Read an Arrow IPC stream with one column per patient field."""
+    ipc = _import_optional("pyarrow.ipc", ARROW)
+    table = ipc.open_stream(body).read_all()
+    return {
+        field: table.column(field).to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+        for field in PATIENT_FIELDS
+    }
+
+
+def _decode_msgpack(body: bytes) -> Dict[str, np.ndarray]:
+    """Read a msgpack map of patient field to list of values."""
+    msgpack = _import_optional("msgpack", MSGPACK)
+    data = msgpack.unpackb(body)
+    return {field: np.asarray(data[field], dtype=np.float64) for field in PATIENT_FIELDS}
+
+
+def _validate_columns(columns: Dict[str, np.ndarray]) -> None:
+    """Apply the checks the JSON schema and the feature builder rely on."""
+    lengths = {len(column) if column.ndim == 1 else -1 for column in columns.values()}
+    if len(lengths) != 1 or -1 in lengths:
+        raise HTTPException(status_code=422, detail="Every patient field must be a column of the same length")
+    rows = lengths.pop()
+    if not 1 <= rows <= MAX_BATCH_SIZE:
+        raise HTTPException(status_code=422, detail=f"Expected between 1 and {MAX_BATCH_SIZE} rows, got {rows}")
+    for field, column in columns.items():
+        if not np.isfinite(column).all():
+            raise HTTPException(status_code=422, detail=f"{field} has missing or non-finite values")
+    if (columns["estatura"] <= 0).any():
+        raise HTTPException(status_code=422, detail="estatura must be positive")
+    # PatientDataRequest.edad is an int, which accepts 30.0 but not 30.7.
+    if (columns["edad"] != np.trunc(columns["edad"])).any():
+        raise HTTPException(status_code=422, detail="edad must be a whole number")
+
+
+def _is_available(content_type: str) -> bool:
+    """Tell whether the optional package a media type needs is installed."""
+    package = _REQUIRES.get(content_type)
+    return package is None or importlib.util.find_spec(package) is not None
+
+
+def _import_optional(module: str, content_type: str) -> Any:
+    """Import the optional package a request media type needs."""
+    try:
+        return importlib.import_module(module)
+    except ImportError as exc:
+        raise HTTPException(
+            status_code=415, detail=f"{content_type} is not available: pip install {_REQUIRES[content_type]}"
+        ) from exc
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_assessments_json(assessments: List[HypertensionAssessment]) -> Response:
+    """Encode assessments with the BatchPredictionResponse layout, without building its models."""
+    return Response(
+        dumps({"resultados": [
+            {
+                "riesgo_hipertension": [
+                    {"modelo": pred.modelo, "prediccion": pred.prediccion, "respuesta": pred.respuesta}
+                    for pred in assessment.predictions
+                ],
+                "recomendacion": assessment.recomendacion,
+                "degradado": assessment.degradado
+            }
+            for assessment in assessments
+        ]}),
+        media_type=JSON
+    )
+
+
+def encode_columnar(assessment: ColumnarAssessment, response_type: str) -> Response:
+    """Encode a columnar assessment in the negotiated media type."""
+    if response_type == JSON:
+        return Response(dumps(_columnar_json(assessment)), media_type=JSON)
+    if response_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, _prediction_matrix(assessment), allow_pickle=False)
+        return Response(
+            buffer.getvalue(),
+            media_type=NPY,
+            headers={"X-Columns": ",".join(f"prediccion_{model}" for model in assessment.models)}
+        )
+    columns = _output_columns(assessment)
+    if response_type == ARROW:
+        pyarrow = _import_optional("pyarrow", ARROW)
+        ipc = _import_optional("pyarrow.ipc", ARROW)
+        table = pyarrow.table({
+            name: pyarrow.array(column, type=pyarrow.string()) if column.dtype == object else column
+            for name, column in columns.items()
+        })
+        sink = pyarrow.BufferOutputStream()
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return Response(sink.getvalue().to_pybytes(), media_type=ARROW)
+    msgpack = _import_optional("msgpack", MSGPACK)
+    return Response(
+        msgpack.packb({name: column.tolist() for name, column in columns.items()}),
+        media_type=MSGPACK
+    )
+
+
+def _prediction_matrix(assessment: ColumnarAssessment) -> np.ndarray:
+    """Stack the predictions as an int8 matrix with one column per model."""
+    if not assessment.models:
+        return np.empty((0, 0), dtype=np.int8)
+    return np.column_stack([assessment.predictions[model] for model in assessment.models])
+
+
+def _output_columns(assessment: ColumnarAssessment) -> Dict[str, np.ndarray]:
+    """Name the output columns like the bulk scoring files."""
+    columns = {f"prediccion_{model}": assessment.predictions[model] for model in assessment.models}
+    if assessment.respuestas is not None:
+        columns.update({f"respuesta_{model}": assessment.respuestas[model] for model in assessment.models})
+    if assessment.recomendaciones is not None:
+        columns["recomendacion"] = assessment.recomendaciones
+    if assessment.degradado is not None:
+        columns["degradado"] = assessment.degradado
+    return columns
+
+
+def _columnar_json(assessment: ColumnarAssessment) -> Dict[str, Any]:
+    """Lay out a columnar assessment like BatchPredictionResponse."""
+    rows = len(assessment)
+    labels = [PREDICTION_LABELS[assessment.predictions[model]].tolist() for model in assessment.models]
+    respuestas = (
+        [assessment.respuestas[model].tolist() for model in assessment.models]
+        if assessment.respuestas is not None else [[None] * rows for _ in assessment.models]
+    )
+    recomendaciones = (
+        assessment.recomendaciones.tolist() if assessment.recomendaciones is not None else [None] * rows
+    )
+    degradado = assessment.degradado.tolist() if assessment.degradado is not None else [False] * rows
+    return {"resultados": [
+        {
+            "riesgo_hipertension": [
+                {"modelo": model, "prediccion": labels[index][row], "respuesta": respuestas[index][row]}
+                for index, model in enumerate(assessment.models)
+            ],
+            "recomendacion": recomendaciones[row],
+            "degradado": degradado[row]
+        }
+        for row in range(rows)
+    ]}
@@ -0,0 +1,86 @@
+"""
+Startup timing report.
+
+This module times the phases of process startup (importing the
+application, loading the models, creating the recommendation client)
+and records which heavy third-party packages each phase imported, so a
+slow cold start can be traced to its cause from the boot log.
+"""
+
+import logging
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List
+
+# Logged through uvicorn's logger so the report appears next to its own
+# startup messages without any extra logging configuration.
+logger = logging.getLogger("uvicorn.error")
+
+# Packages whose import cost is worth reporting.
+HEAVY_MODULES = (
+    "numpy", "pydantic", "fastapi", "httpx", "openai", "dotenv",
+    "joblib", "sklearn", "xgboost", "pandas", "pyarrow",
+)
+
+
+@dataclass
+class StartupPhase:
+    """Duration of one startup phase and the heavy packages it imported."""
+    name: str
+    seconds: float
+    imported: List[str] = field(default_factory=list)
+
+
+class StartupReport:
+    """Collects startup phases and logs them as one summary."""
+
+    def __init__(self):
+        self.phases: List[StartupPhase] = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as a startup phase."""
+        already_imported = {module for module in HEAVY_MODULES if module in sys.modules}
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            imported = [
+                module for module in HEAVY_MODULES
+                if module in sys.modules and module not in already_imported
+            ]
+            self.phases.append(StartupPhase(name, time.perf_counter() - start, imported))
+
+    @property
+    def total_seconds(self) -> float:
+        """Time spent in all recorded phases."""
+        return sum(phase.seconds for phase in self.phases)
+
+    def summary(self) -> str:
+        """Describe every phase on one line."""
+        parts = []
+        for phase in self.phases:
+            part = f"{phase.name} {phase.seconds:.3f}s"
+            if phase.imported:
+                part += f" (imported {', '.join(phase.imported)})"
+            parts.append(part)
+        return f"{self.total_seconds:.3f}s total: " + "; ".join(parts)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the phases as a JSON-serializable dict."""
+        return {
+            "total_seconds": round(self.total_seconds, 6),
+            "phases": [
+                {"name": phase.name, "seconds": round(phase.seconds, 6), "imported": phase.imported}
+                for phase in self.phases
+            ]
+        }
+
+    def log(self) -> None:
+        """Log the summary at INFO level."""
+        logger.info("Startup finished in %s", self.summary())
+
+
+startup_report = StartupReport()
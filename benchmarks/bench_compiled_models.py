@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the compiled inference mode.
+
+Times every model's original ``predict`` against its compiled evaluator
+on the real model files and prints the cost per call in microseconds.
+
+Usage:
+    python benchmarks/bench_compiled_models.py [--rows 1 64 1000] [--repeat 200]
+"""
+
+import argparse
+import sys
+import timeit
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.infrastructure.ml_models import JoblibModelRepository  # noqa: E402
+
+
+def synthetic_features(rows: int, seed: int = 0) -> np.ndarray:
+    """Build a plausible feature matrix in FEATURE_NAMES order."""
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(17, 40, rows),
+        rng.uniform(0, 300, rows),
+        rng.uniform(90, 180, rows),
+        rng.uniform(45, 120, rows),
+        rng.integers(18, 90, rows)
+    ]).astype(np.float64)
+
+
+def time_call(fn, repeat: int) -> float:
+    """Return the best mean time of fn in microseconds."""
+    fn()
+    runs = timeit.repeat(fn, number=repeat, repeat=3)
+    return min(runs) / repeat * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 64, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        original = JoblibModelRepository()
+        compiled = JoblibModelRepository(compiled=True)
+
+    print(f"{'model':<6}{'rows':>7}{'original us':>14}{'compiled us':>14}{'speedup':>10}")
+    for model_name in original.get_available_models():
+        for rows in args.rows:
+            data = synthetic_features(rows)
+            repeat = max(1, args.repeat // max(1, rows // 64))
+            base = time_call(lambda: original.predict_batch(model_name, data), repeat)
+            fast = time_call(lambda: compiled.predict_batch(model_name, data), repeat)
+            print(f"{model_name:<6}{rows:>7}{base:>14.1f}{fast:>14.1f}{base / fast:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""
+Layered micro-benchmarks of the prediction path.
+
+This module builds one benchmark case per layer of ``/predict``: feature
+building, each model's inference, recommendation generation, the use
+case, response serialization and the HTTP routes through an in-process
+ASGI client. OpenAI is replaced by a local fake with configurable
+latency so the numbers measure this service, not the network.
+"""
+
+import asyncio
+import io
+import warnings
+from typing import List
+from unittest.mock import patch
+
+import httpx
+import numpy as np
+
+from app.application.use_cases import HypertensionPredictionUseCase, InferenceOptions
+from app.domain.entities import PatientData, PATIENT_FIELDS
+from app.domain.features import build_feature_matrix
+from app.infrastructure.cache import AsyncTTLCache
+from app.infrastructure.inference_executor import InferenceExecutor
+from app.infrastructure.metrics import PredictionMetrics
+from app.infrastructure.ml_models import JoblibModelRepository
+from app.infrastructure.openai_service import OpenAIRecommendationService
+from app.main import app
+from app.presentation.dependencies import get_prediction_use_case
+from app.presentation.routes import _to_response
+from app.presentation.schemas import BatchPredictionResponse
+from app.presentation.serialization import NPY, encode_assessments_json, encode_columnar
+from .fakes import FakeRecommendationService
+from .harness import BenchmarkCase
+
+LAYERS = ("metrics", "domain", "repository", "recommendation", "use_case", "serialization", "route")
+
+
+def synthetic_patients(rows: int, seed: int = 0) -> List[PatientData]:
+    """Build plausible patients."""
+    rng = np.random.default_rng(seed)
+    return [
+        PatientData(
+            peso=float(rng.uniform(45, 120)),
+            estatura=float(rng.uniform(1.45, 1.95)),
+            actividad_total=float(rng.uniform(0, 300)),
+            tension_arterial=float(rng.uniform(90, 180)),
+            edad=int(rng.integers(18, 90))
+        )
+        for _ in range(rows)
+    ]
+
+
+def _patient_columns(patients: List[PatientData]) -> dict:
+    """Build one array per patient field."""
+    return {field: np.array([getattr(p, field) for p in patients], dtype=np.float64) for field in PATIENT_FIELDS}
+
+
+def _npy_payload(patients: List[PatientData]) -> bytes:
+    """Serialize patients as a .npy request body."""
+    buffer = io.BytesIO()
+    np.save(buffer, np.column_stack(list(_patient_columns(patients).values())))
+    return buffer.getvalue()
+
+
+def _patient_payload(patient: PatientData) -> dict:
+    """Serialize a patient as the /predict request body."""
+    return {
+        "peso": patient.peso,
+        "estatura": patient.estatura,
+        "actividad_total": patient.actividad_total,
+        "tension_arterial": patient.tension_arterial,
+        "edad": patient.edad
+    }
+
+
+class _FakeCompletions:
+    """Stand-in for ``client.chat.completions`` backed by the fake service."""
+
+    def __init__(self, fake: FakeRecommendationService):
+        self._fake = fake
+
+    async def create(self, **kwargs):
+        content = await self._fake.generate_recommendation(kwargs["messages"][-1]["content"])
+        message = type("Message", (), {"content": content})
+        choice = type("Choice", (), {"message": message})
+        return type("Completion", (), {"choices": [choice]})
+
+
+def build_cases(rows: List[int], latency: float, layers: List[str]) -> List[BenchmarkCase]:
+    """Build the benchmark cases for the selected layers."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        repository = JoblibModelRepository()
+        compiled_repository = JoblibModelRepository(compiled=True)
+
+    params = {"latency_ms": latency * 1000}
+    cases: List[BenchmarkCase] = []
+    largest = max(rows)
+    patients = synthetic_patients(largest)
+    matrices = {n: build_feature_matrix(patients[:n]) for n in rows}
+
+    if "metrics" in layers:
+        histogram = PredictionMetrics().model_inference
+        cases.append(BenchmarkCase(
+            "Histogram.labels().observe_ns", "metrics", 1, lambda: histogram.labels("LOG").observe_ns(12345),
+            iterations=10000
+        ))
+
+    if "domain" in layers:
+        cases.append(BenchmarkCase("PatientData.to_feature_row", "domain", 1, patients[0].to_feature_row))
+        for n in rows:
+            cases.append(BenchmarkCase(
+                "build_feature_matrix", "domain", n, lambda n=n: build_feature_matrix(patients[:n])
+            ))
+
+    if "repository" in layers:
+        for mode, repo in (("pickle", repository), ("compiled", compiled_repository)):
+            for model_name in repo.get_available_models():
+                for n in rows:
+                    cases.append(BenchmarkCase(
+                        f"JoblibModelRepository.predict_batch[{model_name}]", "repository", n,
+                        lambda repo=repo, model_name=model_name, n=n: repo.predict_batch(model_name, matrices[n]),
+                        params={"mode": mode}
+                    ))
+
+    if "recommendation" in layers:
+        fake = FakeRecommendationService(latency)
+        cases.append(BenchmarkCase(
+            "FakeRecommendationService.generate_recommendation", "recommendation", 1,
+            lambda: fake.generate_recommendation("Sí"), is_async=True, params=params
+        ))
+        for label, cache in (("cached", AsyncTTLCache()), ("uncached", AsyncTTLCache(maxsize=0))):
+            with patch("openai.AsyncOpenAI"):
+                service = OpenAIRecommendationService(cache=cache)
+            service.client.chat.completions = _FakeCompletions(FakeRecommendationService(latency))
+            cases.append(BenchmarkCase(
+                "OpenAIRecommendationService.generate_recommendation", "recommendation", 1,
+                lambda service=service: service.generate_recommendation("Sí"), is_async=True,
+                params={**params, "cache": label}
+            ))
+
+    if "use_case" in layers:
+        executor = InferenceExecutor(kind="thread", max_workers=4)
+        for label, inference_executor in (("inline", None), ("thread", executor)):
+            use_case = HypertensionPredictionUseCase(
+                repository, FakeRecommendationService(latency), inference=InferenceOptions(executor=inference_executor)
+            )
+            cases.append(BenchmarkCase(
+                "HypertensionPredictionUseCase.predict_hypertension_risk", "use_case", 1,
+                lambda use_case=use_case: use_case.predict_hypertension_risk(patients[0]), is_async=True,
+                params={**params, "executor": label}
+            ))
+            for n in rows:
+                cases.append(BenchmarkCase(
+                    "HypertensionPredictionUseCase.predict_batch", "use_case", n,
+                    lambda use_case=use_case, n=n: use_case.predict_batch(patients[:n]), is_async=True,
+                    params={**params, "executor": label}
+                ))
+
+    if "serialization" in layers or "route" in layers:
+        use_case = HypertensionPredictionUseCase(repository, FakeRecommendationService(latency))
+
+    if "serialization" in layers:
+        assessments = asyncio.run(use_case.predict_batch(patients))
+        cases.append(BenchmarkCase(
+            "HypertensionRiskResponse.model_dump_json", "serialization", 1,
+            lambda: _to_response(assessments[0]).model_dump_json()
+        ))
+        for n in rows:
+            cases.append(BenchmarkCase(
+                "BatchPredictionResponse.model_dump_json", "serialization", n,
+                lambda n=n: BatchPredictionResponse(
+                    resultados=[_to_response(a) for a in assessments[:n]]
+                ).model_dump_json()
+            ))
+            cases.append(BenchmarkCase(
+                "encode_assessments_json", "serialization", n,
+                lambda n=n: encode_assessments_json(assessments[:n])
+            ))
+            columnar = asyncio.run(use_case.predict_columns(_patient_columns(patients[:n]), "none"))
+            cases.append(BenchmarkCase(
+                "encode_columnar", "serialization", n,
+                lambda columnar=columnar: encode_columnar(columnar, NPY), params={"format": "npy"}
+            ))
+
+    if "route" in layers:
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        single = _patient_payload(patients[0])
+        cases.append(BenchmarkCase(
+            "POST /predict", "route", 1, lambda: client.post("/predict", json=single), is_async=True, params=params
+        ))
+        for n in rows:
+            body = {"pacientes": [_patient_payload(p) for p in patients[:n]]}
+            cases.append(BenchmarkCase(
+                "POST /predict/batch", "route", n,
+                lambda body=body: client.post("/predict/batch", json=body), is_async=True, params=params
+            ))
+            npy = _npy_payload(patients[:n])
+            cases.append(BenchmarkCase(
+                "POST /predict/batch", "route", n,
+                lambda npy=npy: client.post(
+                    "/predict/batch", content=npy, headers={"Content-Type": NPY, "Accept": NPY}
+                ),
+                is_async=True, params={**params, "format": "npy"}
+            ))
+
+    return cases
@@ -0,0 +1,37 @@
+"""
+In-process stand-ins for external services.
+
+This module provides a recommendation service that replaces the OpenAI
+API in benchmarks, with a configurable latency instead of a network
+round trip.
+"""
+
+import asyncio
+from typing import Dict
+from app.domain.repositories import RecommendationService
+
+
+class FakeRecommendationService(RecommendationService):
+    """Recommendation service that answers locally after a fixed delay."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_recommendation(self, prediction: str) -> str:
+        """Return a canned recommendation after the configured latency."""
+        await self._respond()
+        return f"Recomendación para predicción '{prediction}'."
+
+    async def generate_consensus_recommendation(self, predictions: Dict[str, str]) -> str:
+        """Return a canned consensus recommendation after the configured latency."""
+        await self._respond()
+        return f"Recomendación para predicciones {sorted(predictions.items())}."
+
+    async def _respond(self) -> None:
+        """Count the call and wait like a remote service would."""
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
@@ -0,0 +1,109 @@
+"""
+Benchmark harness.
+
+This module times synchronous and asynchronous callables and turns the
+samples into result records that can be written as JSON and compared
+across commits.
+"""
+
+import asyncio
+import statistics
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+@dataclass
+class BenchmarkResult:
+    """Timing summary of one benchmark case."""
+    name: str
+    layer: str
+    rows: int
+    iterations: int
+    mean_us: float
+    p50_us: float
+    p95_us: float
+    min_us: float
+    per_row_us: float
+    params: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the result as a JSON-serializable dict."""
+        return asdict(self)
+
+
+@dataclass
+class BenchmarkCase:
+    """A named callable to time, synchronous or asynchronous."""
+    name: str
+    layer: str
+    rows: int
+    fn: Callable[[], Any]
+    is_async: bool = False
+    iterations: Optional[int] = None
+    params: Dict[str, Any] = field(default_factory=dict)
+
+
+def _summarize(case: BenchmarkCase, samples_ns: List[int]) -> BenchmarkResult:
+    """Build a result from per-call samples in nanoseconds."""
+    samples_us = sorted(sample / 1000 for sample in samples_ns)
+    mean_us = statistics.fmean(samples_us)
+    return BenchmarkResult(
+        name=case.name,
+        layer=case.layer,
+        rows=case.rows,
+        iterations=len(samples_us),
+        mean_us=round(mean_us, 3),
+        p50_us=round(samples_us[len(samples_us) // 2], 3),
+        p95_us=round(samples_us[min(len(samples_us) - 1, int(len(samples_us) * 0.95))], 3),
+        min_us=round(samples_us[0], 3),
+        per_row_us=round(mean_us / max(1, case.rows), 3),
+        params=case.params
+    )
+
+
+def _iterations_for(case: BenchmarkCase, default: int) -> int:
+    """Scale iterations down for large batches so every case takes similar time."""
+    if case.iterations is not None:
+        return case.iterations
+    return max(5, default // max(1, case.rows // 100))
+
+
+def run_sync(case: BenchmarkCase, iterations: int, warmup: int = 3) -> BenchmarkResult:
+    """Time a synchronous case."""
+    for _ in range(warmup):
+        case.fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        case.fn()
+        samples.append(time.perf_counter_ns() - start)
+    return _summarize(case, samples)
+
+
+async def run_async(case: BenchmarkCase, iterations: int, warmup: int = 3) -> BenchmarkResult:
+    """Time an asynchronous case on the running loop."""
+    fn: Callable[[], Awaitable[Any]] = case.fn
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        await fn()
+        samples.append(time.perf_counter_ns() - start)
+    return _summarize(case, samples)
+
+
+def run_cases(cases: List[BenchmarkCase], iterations: int) -> List[BenchmarkResult]:
+    """Run every case, async ones on a single event loop."""
+    async def run_all() -> List[BenchmarkResult]:
+        results = []
+        for case in cases:
+            count = _iterations_for(case, iterations)
+            if case.is_async:
+                results.append(await run_async(case, count))
+            else:
+                results.append(run_sync(case, count))
+        return results
+
+    return asyncio.run(run_all())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory report for a running server.
+
+Reads ``/proc/<pid>/smaps_rollup`` (Linux) for a server's master process
+and every worker it forked, and prints resident (RSS), proportional
+(PSS) and shared memory per process. PSS splits shared pages between the
+processes mapping them, so the PSS total is the real footprint of the
+whole server on the node.
+
+Usage:
+    python benchmarks/measure_worker_memory.py <master_pid> [--json]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_rollup(pid: int) -> Dict[str, int]:
+    """Return the smaps rollup of a process in KiB."""
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines():
+        key, _, rest = line.partition(":")
+        if key in FIELDS:
+            values[key] = int(rest.split()[0])
+    return values
+
+
+def child_pids(pid: int) -> List[int]:
+    """Return the direct children of a process."""
+    children = []
+    for task in Path(f"/proc/{pid}/task").iterdir():
+        children_file = task / "children"
+        if children_file.exists():
+            children.extend(int(child) for child in children_file.read_text().split())
+    return sorted(set(children))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pid", type=int, help="PID of the gunicorn/uvicorn master process")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable output")
+    args = parser.parse_args()
+
+    processes = {"master": args.pid}
+    processes.update({f"worker-{i}": pid for i, pid in enumerate(child_pids(args.pid), start=1)})
+    report = {name: {"pid": pid, **read_rollup(pid)} for name, pid in processes.items()}
+    totals = {field: sum(entry.get(field, 0) for entry in report.values()) for field in FIELDS}
+
+    if args.json:
+        print(json.dumps({"processes": report, "total_kib": totals}, indent=2))
+        return 0
+
+    print(f"{'process':<12}{'pid':>8}" + "".join(f"{field + ' MiB':>18}" for field in FIELDS))
+    for name, entry in report.items():
+        print(f"{name:<12}{entry['pid']:>8}" + "".join(f"{entry.get(f, 0) / 1024:>18.1f}" for f in FIELDS))
+    print(f"{'total':<12}{'':>8}" + "".join(f"{totals[f] / 1024:>18.1f}" for f in FIELDS))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
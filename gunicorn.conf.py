@@ -0,0 +1,15 @@
+"""
+Gunicorn settings.
+
+gunicorn reads this file from the working directory. With
+``PRELOAD_MODELS=1`` the models are loaded in the master process, after
+the settings are read and before the workers are forked, so the workers
+share them copy-on-write. Importing ``app.main`` itself never loads them.
+"""
+
+
+def when_ready(server):
+    """Preload the models in the master, before the first worker is forked."""
+    from app.presentation import dependencies
+
+    dependencies.preload_if_enabled()
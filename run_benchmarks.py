@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark runner script for the hypertension prediction API.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.bench_layers import LAYERS, build_cases
+from benchmarks.harness import run_cases
+
+
+def _git_commit(project_dir: Path) -> str:
+    """Return the current commit hash, or an empty string outside a checkout."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=project_dir, capture_output=True, text=True
+        )
+    except FileNotFoundError:
+        return ""
+    return result.stdout.strip()
+
+
+def _result_key(result: dict) -> tuple:
+    """Identify a result across runs."""
+    return result["name"], result["rows"], json.dumps(result["params"], sort_keys=True)
+
+
+def _print_results(results: list, baseline: dict) -> None:
+    """Print a results table, with the change against a baseline when given."""
+    header = f"{'layer':<15}{'benchmark':<76}{'rows':>6}{'mean µs':>12}{'p95 µs':>12}{'µs/row':>10}"
+    if baseline:
+        header += f"{'change':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        label = result["name"]
+        extra = ", ".join(f"{k}={v}" for k, v in result["params"].items() if k != "latency_ms")
+        if extra:
+            label += f" ({extra})"
+        line = (
+            f"{result['layer']:<15}{label:<76}{result['rows']:>6}"
+            f"{result['mean_us']:>12.1f}{result['p95_us']:>12.1f}{result['per_row_us']:>10.2f}"
+        )
+        previous = baseline.get(_result_key(result))
+        if previous:
+            change = (result["mean_us"] - previous["mean_us"]) / previous["mean_us"] * 100
+            line += f"{change:>+9.1f}%"
+        print(line)
+
+
+def run_benchmarks(argv=None):
+    """Run the benchmark suite and display results."""
+    parser = argparse.ArgumentParser(description="Time each layer of the prediction path.")
+    parser.add_argument("--layer", action="append", choices=LAYERS,
+                        help="Layer to benchmark, may be repeated (default: all)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 1000],
+                        help="Batch sizes to benchmark (default: 1 1000)")
+    parser.add_argument("--iterations", type=int, default=200,
+                        help="Timed calls per single-row case (default: 200)")
+    parser.add_argument("--latency-ms", type=float, default=0.0,
+                        help="Latency of the fake recommendation service (default: 0)")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--compare", type=Path, help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    print("⏱️  Running Hypertension Prediction API Benchmarks")
+    print("=" * 50)
+
+    project_dir = Path(__file__).parent
+    cases = build_cases(args.rows, args.latency_ms / 1000, args.layer or list(LAYERS))
+    results = [result.to_dict() for result in run_cases(cases, args.iterations)]
+
+    baseline = {}
+    if args.compare:
+        previous = json.loads(args.compare.read_text())
+        baseline = {_result_key(result): result for result in previous["results"]}
+    _print_results(results, baseline)
+
+    if args.output:
+        report = {
+            "metadata": {
+                "commit": _git_commit(project_dir),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "iterations": args.iterations,
+                "latency_ms": args.latency_ms
+            },
+            "results": results
+        }
+        args.output.write_text(json.dumps(report, indent=2))
+        print(f"\n✅ Results written to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = run_benchmarks()
+    sys.exit(exit_code)
@@ -4,7 +4,7 @@ Test configuration and fixtures.
 
 import os
 import pytest
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 
 
 @pytest.fixture(autouse=True)
@@ -17,6 +17,21 @@ def mock_openai_env():
 @pytest.fixture(autouse=True)
 def mock_openai_client():
     """Mock OpenAI client for all tests."""
-    with patch('app.infrastructure.openai_service.OpenAI') as mock_openai:
+    with patch('openai.AsyncOpenAI') as mock_openai:
         mock_client = mock_openai.return_value
-        yield mock_client
\ No newline at end of file
+        mock_client.chat.completions.create = AsyncMock()
+        mock_client.close = AsyncMock()
+        yield mock_client
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_dependencies():
+    """Isolate the process-wide dependencies between tests."""
+    from app.config import get_settings
+    from app.presentation.dependencies import reset_dependencies
+
+    get_settings.cache_clear()
+    reset_dependencies()
+    yield
+    reset_dependencies()
+    get_settings.cache_clear()
@@ -2,11 +2,17 @@
 Unit tests for application layer.
 """
 
+import asyncio
+import time
 import pytest
 from unittest.mock import Mock, AsyncMock
-import pandas as pd
-from app.application.use_cases import HypertensionPredictionUseCase
-from app.domain.entities import PatientData, PredictionResult
+import numpy as np
+from app.application.use_cases import HypertensionPredictionUseCase, InferenceOptions
+from app.domain.entities import PatientData, PredictionResult, PATIENT_FIELDS
+from app.domain.repositories import RecommendationUnavailableError
+from app.infrastructure.cache import AsyncTTLCache
+from app.infrastructure.metrics import PredictionMetrics
+from app.infrastructure.recommendation_jobs import RecommendationJobQueue
 
 
 class TestHypertensionPredictionUseCase:
@@ -61,7 +67,7 @@ class TestHypertensionPredictionUseCase:
     @pytest.mark.asyncio
     async def test_generate_prediction(self, use_case, mock_model_repo, mock_recommendation_service):
         """Test individual prediction generation."""
-        input_data = pd.DataFrame([[25.0, 150.0, 120.0, 70.0, 30]])
+        input_data = np.array([[25.0, 150.0, 120.0, 70.0, 30]])
 
         result = await use_case._generate_prediction('LOG', input_data)
 
@@ -77,7 +83,7 @@ class TestHypertensionPredictionUseCase:
     async def test_prediction_no_risk(self, use_case, mock_model_repo, mock_recommendation_service):
         """Test prediction when no risk is detected."""
         mock_model_repo.predict.return_value = 0
-        input_data = pd.DataFrame([[25.0, 150.0, 120.0, 70.0, 30]])
+        input_data = np.array([[25.0, 150.0, 120.0, 70.0, 30]])
 
         result = await use_case._generate_prediction('LOG', input_data)
 
@@ -93,5 +99,470 @@ class TestHypertensionPredictionUseCase:
         call_args = mock_model_repo.predict.call_args_list[0][0]
         input_data = call_args[1]
 
-        assert list(input_data.columns) == ["IMC_calculado", "actividad_total", "tension_arterial", "peso_promedio", "edad"]
-        assert input_data.iloc[0]['IMC_calculado'] == patient_data.calculate_imc()
\ No newline at end of file
+        assert isinstance(input_data, np.ndarray)
+        assert input_data.shape == (1, 5)
+        assert input_data.flags.c_contiguous
+        assert input_data[0].tolist() == [patient_data.calculate_imc(), 150.0, 120.0, 70.0, 30.0]
+    @pytest.mark.asyncio
+    async def test_predict_batch(self, use_case, patient_data, mock_model_repo, mock_recommendation_service):
+        """Test batch prediction calls each model once and deduplicates recommendations."""
+        mock_model_repo.predict_batch.return_value = [1, 0]
+        other_patient = PatientData(90.0, 1.60, 20.0, 150.0, 60)
+
+        assessments = await use_case.predict_batch([patient_data, other_patient])
+
+        assert len(assessments) == 2
+        assert assessments[0].patient_data == patient_data
+        assert [p.prediccion for p in assessments[0].predictions] == ['Sí', 'Sí', 'Sí']
+        assert [p.prediccion for p in assessments[1].predictions] == ['No', 'No', 'No']
+        assert mock_model_repo.predict_batch.call_count == 3
+        mock_model_repo.predict.assert_not_called()
+        assert mock_recommendation_service.generate_recommendation.call_count == 2
+
+        input_data = mock_model_repo.predict_batch.call_args_list[0][0][1]
+        assert len(input_data) == 2
+        assert input_data[1, 0] == other_patient.calculate_imc()
+
+    @pytest.mark.asyncio
+    async def test_inference_runs_off_event_loop(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test model inference overlaps when an inference executor is configured."""
+        import threading
+        from app.infrastructure.inference_executor import InferenceExecutor
+
+        running = []
+        released = threading.Event()
+        outcomes = []
+
+        def blocking_predict(model_name, data):
+            running.append(model_name)
+            # Only returns early if the event loop sets the event; the timeout just avoids a hang.
+            outcomes.append(released.wait(timeout=5))
+            return 1
+
+        async def release_once_all_are_running():
+            while len(running) < 3:
+                await asyncio.sleep(0.001)
+            released.set()
+
+        mock_model_repo.predict.side_effect = blocking_predict
+        executor = InferenceExecutor(kind="thread", max_workers=3)
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, inference=InferenceOptions(executor=executor)
+        )
+
+        releaser = asyncio.create_task(release_once_all_are_running())
+        try:
+            assessment = await use_case.predict_hypertension_risk(patient_data)
+        finally:
+            released.set()
+            executor.shutdown()
+
+        assert [p.prediccion for p in assessment.predictions] == ['Sí', 'Sí', 'Sí']
+        # All three models were blocked at once while the event loop kept running another task.
+        assert releaser.done()
+        assert outcomes == [True, True, True]
+
+    @pytest.mark.asyncio
+    async def test_predictions_go_through_micro_batcher(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test single-row predictions are handed to the request coalescer when enabled."""
+        batcher = AsyncMock()
+        batcher.predict.return_value = 0
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, inference=InferenceOptions(micro_batcher=batcher)
+        )
+
+        assessment = await use_case.predict_hypertension_risk(patient_data)
+
+        assert [p.prediccion for p in assessment.predictions] == ['No', 'No', 'No']
+        assert batcher.predict.await_count == 3
+        assert batcher.predict.call_args_list[0][0][:2] == (mock_model_repo, 'LOG')
+        mock_model_repo.predict.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_records_stage_metrics(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test feature building and each model's prediction are timed."""
+        metrics = PredictionMetrics()
+        mock_model_repo.predict_batch.return_value = [1, 0]
+        use_case = HypertensionPredictionUseCase(mock_model_repo, mock_recommendation_service, metrics=metrics)
+
+        await use_case.predict_hypertension_risk(patient_data)
+        await use_case.predict_batch([patient_data, patient_data])
+
+        assert metrics.feature_build.labels().count == 2
+        for model in ['LOG', 'RF', 'XGB']:
+            assert metrics.model_prediction.labels(model).count == 2
+
+    @pytest.mark.asyncio
+    async def test_result_cache_reuses_assessments(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test repeated and concurrent identical patients are computed once."""
+        cache = AsyncTTLCache()
+        use_case = HypertensionPredictionUseCase(mock_model_repo, mock_recommendation_service, result_cache=cache)
+        same_vitals = PatientData(peso=70, estatura=1.75, actividad_total=150, tension_arterial=120, edad=30)
+
+        results = await asyncio.gather(*[use_case.predict_hypertension_risk(patient_data) for _ in range(10)])
+        repeated = await use_case.predict_hypertension_risk(same_vitals)
+
+        assert mock_model_repo.predict.call_count == 3
+        assert mock_recommendation_service.generate_recommendation.await_count == 3
+        assert repeated.patient_data is same_vitals
+        assert repeated.predictions == results[0].predictions
+        assert cache.stats()["coalesced"] == 9
+
+    @pytest.mark.asyncio
+    async def test_result_cache_is_scoped_to_model_version(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test results of previous models are not served after a reload."""
+        cache = AsyncTTLCache()
+        for version in (1, 1, 2):
+            use_case = HypertensionPredictionUseCase(
+                mock_model_repo, mock_recommendation_service, result_cache=cache, cache_version=version
+            )
+            await use_case.predict_hypertension_risk(patient_data)
+
+        assert mock_model_repo.predict.call_count == 6
+
+    @pytest.mark.asyncio
+    async def test_consensus_makes_one_recommendation_call(self, use_case, patient_data, mock_model_repo, mock_recommendation_service):
+        """Test consensus mode asks for one shared recommendation."""
+        mock_model_repo.predict.side_effect = [1, 0, 1]
+        mock_recommendation_service.generate_consensus_recommendation.return_value = "Recomendación común"
+
+        assessment = await use_case.predict_hypertension_risk(patient_data, recommendation_mode="consensus")
+
+        assert assessment.recomendacion == "Recomendación común"
+        assert [p.respuesta for p in assessment.predictions] == [None, None, None]
+        mock_recommendation_service.generate_recommendation.assert_not_called()
+        mock_recommendation_service.generate_consensus_recommendation.assert_awaited_once_with(
+            {'LOG': 'Sí', 'RF': 'No', 'XGB': 'Sí'}
+        )
+
+    @pytest.mark.asyncio
+    async def test_none_mode_skips_recommendations(self, use_case, patient_data, mock_model_repo, mock_recommendation_service):
+        """Test none mode returns predictions without any recommendation call."""
+        assessment = await use_case.predict_hypertension_risk(patient_data, recommendation_mode="none")
+        mock_model_repo.predict_batch.return_value = [1, 0]
+        batch = await use_case.predict_batch([patient_data, patient_data], recommendation_mode="none")
+
+        assert [p.prediccion for p in assessment.predictions] == ['Sí', 'Sí', 'Sí']
+        assert assessment.recomendacion is None
+        assert all(p.respuesta is None for a in batch for p in a.predictions)
+        mock_recommendation_service.generate_recommendation.assert_not_called()
+        mock_recommendation_service.generate_consensus_recommendation.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_batch_consensus_deduplicates_combinations(self, use_case, patient_data, mock_model_repo, mock_recommendation_service):
+        """Test batch consensus asks once per distinct combination of model outputs."""
+        mock_model_repo.predict_batch.return_value = [1, 0, 1]
+        mock_recommendation_service.generate_consensus_recommendation.side_effect = (
+            lambda predictions: f"Consenso {predictions['LOG']}"
+        )
+
+        assessments = await use_case.predict_batch([patient_data] * 3, recommendation_mode="consensus")
+
+        assert [a.recomendacion for a in assessments] == ["Consenso Sí", "Consenso No", "Consenso Sí"]
+        assert mock_recommendation_service.generate_consensus_recommendation.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_unknown_recommendation_mode(self, use_case, patient_data):
+        """Test an unknown recommendation mode is rejected."""
+        with pytest.raises(ValueError):
+            await use_case.predict_hypertension_risk(patient_data, recommendation_mode="all")
+
+    @pytest.mark.asyncio
+    async def test_deadline_falls_back_to_local_recommendation(self, mock_model_repo, patient_data):
+        """Test a recommendation missing the request deadline is replaced by the fallback."""
+        async def slow_recommendation(prediction):
+            await asyncio.sleep(1)
+            return "Recomendación médica"
+
+        slow_service = AsyncMock()
+        slow_service.generate_recommendation.side_effect = slow_recommendation
+        fallback = AsyncMock()
+        fallback.generate_recommendation.return_value = "Recomendación local"
+        metrics = PredictionMetrics()
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, slow_service, metrics=metrics, request_deadline=0.05, fallback_service=fallback
+        )
+
+        start = time.perf_counter()
+        assessment = await use_case.predict_hypertension_risk(patient_data)
+
+        assert time.perf_counter() - start < 0.5
+        assert assessment.degradado
+        assert [p.respuesta for p in assessment.predictions] == ["Recomendación local"] * 3
+        assert all(p.degradado for p in assessment.predictions)
+        assert metrics.recommendation_fallbacks.labels("timeout").value == 3
+
+    @pytest.mark.asyncio
+    async def test_failed_recommendation_falls_back(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test a failing service degrades consensus and batch responses instead of raising."""
+        unavailable = RecommendationUnavailableError("CircuitOpenError: circuit open")
+        mock_recommendation_service.generate_consensus_recommendation.side_effect = unavailable
+        mock_recommendation_service.generate_recommendation.side_effect = unavailable
+        mock_model_repo.predict_batch.return_value = [1, 0]
+        fallback = AsyncMock()
+        fallback.generate_consensus_recommendation.return_value = "Recomendación local"
+        fallback.generate_recommendation.return_value = "Recomendación local"
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, fallback_service=fallback
+        )
+
+        assessment = await use_case.predict_hypertension_risk(patient_data, recommendation_mode="consensus")
+        batch = await use_case.predict_batch([patient_data, patient_data])
+
+        assert assessment.recomendacion == "Recomendación local"
+        assert assessment.degradado
+        assert all(a.degradado for a in batch)
+        assert fallback.generate_recommendation.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_unexpected_recommendation_error_is_not_masked(self, mock_model_repo, patient_data):
+        """Test a bug in the recommendation path propagates instead of degrading to the fallback."""
+        broken = AsyncMock()
+        broken.generate_recommendation.side_effect = TypeError("unsupported operand")
+        fallback = AsyncMock()
+        metrics = PredictionMetrics()
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, broken, metrics=metrics, request_deadline=1.0, fallback_service=fallback
+        )
+
+        with pytest.raises(TypeError):
+            await use_case.predict_hypertension_risk(patient_data)
+        fallback.generate_recommendation.assert_not_called()
+        assert metrics.recommendation_fallbacks.labels("error").value == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_recommendation_without_fallback_raises(self, use_case, patient_data, mock_recommendation_service):
+        """Test failures still propagate when no fallback service is configured."""
+        mock_recommendation_service.generate_recommendation.side_effect = RuntimeError("unavailable")
+
+        with pytest.raises(RuntimeError):
+            await use_case.predict_hypertension_risk(patient_data)
+
+    @pytest.mark.asyncio
+    async def test_degraded_results_are_not_cached(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test a degraded assessment is recomputed on the next request."""
+        mock_recommendation_service.generate_recommendation.side_effect = (
+            [RecommendationUnavailableError("unavailable")] + ["Recomendación médica"] * 5
+        )
+        fallback = AsyncMock()
+        fallback.generate_recommendation.return_value = "Recomendación local"
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, result_cache=AsyncTTLCache(), fallback_service=fallback
+        )
+
+        degraded = await use_case.predict_hypertension_risk(patient_data)
+        recovered = await use_case.predict_hypertension_risk(patient_data)
+        cached = await use_case.predict_hypertension_risk(patient_data)
+
+        assert degraded.degradado
+        assert not recovered.degradado
+        assert cached.predictions == recovered.predictions
+        assert mock_model_repo.predict.call_count == 6
+
+    @pytest.mark.asyncio
+    async def test_predict_columns_matches_predict_batch(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test the columnar path gives the same predictions and recommendations as the object path."""
+        mock_model_repo.predict_batch.side_effect = lambda model, data: [1, 0, 0] if model == 'RF' else [1, 0, 1]
+        mock_recommendation_service.generate_recommendation.side_effect = lambda label: f"Recomendación {label}"
+        mock_recommendation_service.generate_consensus_recommendation.side_effect = (
+            lambda predictions: f"Consenso {sorted(predictions.values())}"
+        )
+        use_case = HypertensionPredictionUseCase(mock_model_repo, mock_recommendation_service)
+        other_patient = PatientData(90.0, 1.60, 20.0, 150.0, 60)
+        patients = [patient_data, other_patient, patient_data]
+        columns = {
+            field: np.array([getattr(p, field) for p in patients], dtype=float)
+            for field in ("peso", "estatura", "actividad_total", "tension_arterial", "edad")
+        }
+
+        per_model = await use_case.predict_columns(columns)
+        consensus = await use_case.predict_columns(columns, recommendation_mode="consensus")
+        expected = await use_case.predict_batch(patients)
+        expected_consensus = await use_case.predict_batch(patients, recommendation_mode="consensus")
+
+        assert len(per_model) == 3
+        assert per_model.predictions['RF'].tolist() == [1, 0, 0]
+        assert per_model.respuestas['RF'].tolist() == [
+            a.predictions[1].respuesta for a in expected
+        ]
+        assert consensus.recomendaciones.tolist() == [a.recomendacion for a in expected_consensus]
+        assert not per_model.degradado.any()
+        np.testing.assert_array_equal(
+            mock_model_repo.predict_batch.call_args_list[0][0][1],
+            mock_model_repo.predict_batch.call_args_list[6][0][1]
+        )
+
+    @pytest.mark.asyncio
+    async def test_stream_yields_predictions_before_recommendations(self, mock_model_repo, patient_data):
+        """Test predictions are streamed before any recommendation completes, then each as it arrives."""
+        mock_model_repo.predict.side_effect = [1, 0, 1]
+        released = {"Sí": asyncio.Event(), "No": asyncio.Event()}
+
+        async def gated_recommendation(prediction):
+            await released[prediction].wait()
+            return f"Recomendación {prediction}"
+
+        service = AsyncMock()
+        service.generate_recommendation.side_effect = gated_recommendation
+        cache = AsyncTTLCache()
+        use_case = HypertensionPredictionUseCase(mock_model_repo, service, result_cache=cache)
+
+        events = use_case.stream_hypertension_risk(patient_data)
+        first = await events.__anext__()
+        assert first.event == "predictions"
+        assert [p.prediccion for p in first.predictions] == ['Sí', 'No', 'Sí']
+
+        released["No"].set()
+        second = await events.__anext__()
+        assert second.event == "recommendation"
+        assert second.predictions[0].modelo == 'RF'
+        assert second.predictions[0].respuesta == "Recomendación No"
+
+        released["Sí"].set()
+        rest = [event async for event in events]
+        assert [event.event for event in rest] == ["recommendation", "recommendation", "done"]
+
+        replay = [event async for event in use_case.stream_hypertension_risk(patient_data)]
+        assessment = await use_case.predict_hypertension_risk(patient_data)
+        assert [event.event for event in replay] == ["predictions"] + ["recommendation"] * 3 + ["done"]
+        assert [p.respuesta for p in assessment.predictions] == [
+            "Recomendación Sí", "Recomendación No", "Recomendación Sí"
+        ]
+        assert mock_model_repo.predict.call_count == 3
+
+    @pytest.mark.asyncio
+    async def test_deferred_returns_predictions_before_recommendations(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test deferred predictions come back at once and a job adds the recommendations."""
+        jobs = RecommendationJobQueue(workers=1)
+        cache = AsyncTTLCache()
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, result_cache=cache, recommendation_jobs=jobs
+        )
+
+        assessment, job = await use_case.predict_hypertension_risk_deferred(patient_data)
+        assert [p.respuesta for p in assessment.predictions] == [None, None, None]
+        assert job.status == "pending"
+        mock_recommendation_service.generate_recommendation.assert_not_awaited()
+
+        await jobs._queue.join()
+        assert jobs.get(job.job_id).status == "done"
+        assert [p.respuesta for p in job.assessment.predictions] == ["Recomendación médica"] * 3
+        # One call per distinct label
+        assert mock_recommendation_service.generate_recommendation.await_count == 1
+
+        cached, no_job = await use_case.predict_hypertension_risk_deferred(patient_data)
+        assert no_job is None
+        assert cached.predictions == job.assessment.predictions
+        await jobs.aclose()
+
+    @pytest.mark.asyncio
+    async def test_deferred_full_queue_skips_inference(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test a full job queue is refused before the models run, and a failed prediction frees its place."""
+        from app.infrastructure.recommendation_jobs import JobQueueFullError
+
+        jobs = RecommendationJobQueue(workers=0, max_queue_size=1)
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, recommendation_jobs=jobs
+        )
+
+        mock_model_repo.predict.side_effect = RuntimeError("model failed")
+        with pytest.raises(RuntimeError):
+            await use_case.predict_hypertension_risk_deferred(patient_data)
+        mock_model_repo.predict.side_effect = None
+        _, job = await use_case.predict_hypertension_risk_deferred(patient_data)
+        mock_model_repo.predict.reset_mock()
+
+        with pytest.raises(JobQueueFullError):
+            await use_case.predict_hypertension_risk_deferred(patient_data)
+
+        assert job.status == "pending"
+        mock_model_repo.predict.assert_not_called()
+        await jobs.aclose()
+
+    @pytest.mark.asyncio
+    async def test_deferred_without_recommendations_needs_no_job(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test recommendation_mode=none is answered inline and a missing queue is an error."""
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, recommendation_jobs=RecommendationJobQueue()
+        )
+
+        assessment, job = await use_case.predict_hypertension_risk_deferred(patient_data, "none")
+
+        assert job is None
+        assert len(assessment.predictions) == 3
+        with pytest.raises(RuntimeError):
+            await HypertensionPredictionUseCase(
+                mock_model_repo, mock_recommendation_service
+            ).predict_hypertension_risk_deferred(patient_data)
+
+    @pytest.mark.asyncio
+    async def test_production_outputs_go_to_shadow_scorer(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test single and batch predictions hand their features and outputs to the shadow scorer."""
+        mock_model_repo.predict.side_effect = [1, 0, 1]
+        mock_model_repo.predict_batch.return_value = [0, 1]
+        scorer = Mock()
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, shadow_scorer=scorer
+        )
+
+        await use_case.predict_hypertension_risk(patient_data)
+        await use_case.predict_batch([patient_data, patient_data], "none")
+
+        single, batch = scorer.submit.call_args_list
+        assert single[0][0].shape == (1, 5)
+        assert single[0][1] == {'LOG': 1, 'RF': 0, 'XGB': 1}
+        assert batch[0][0].shape == (2, 5)
+        assert batch[0][1] == {'LOG': [0, 1], 'RF': [0, 1], 'XGB': [0, 1]}
+
+    @pytest.mark.asyncio
+    async def test_assessments_go_to_audit_log(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test every kind of prediction hands its finished assessments to the audit log."""
+        mock_model_repo.predict_batch.return_value = [1, 0]
+        audit_log = AsyncMock()
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, audit_log=audit_log
+        )
+
+        single = await use_case.predict_hypertension_risk(patient_data)
+        batch = await use_case.predict_batch([patient_data, patient_data], "none")
+        events = [event async for event in use_case.stream_hypertension_risk(patient_data, "none")]
+        columns = {field: np.array([getattr(patient_data, field)] * 2) for field in PATIENT_FIELDS}
+        columnar = await use_case.predict_columns(columns, "none")
+
+        calls = audit_log.record.call_args_list
+        assert [call[0][0] for call in calls] == ["predict", "batch", "stream"]
+        assert calls[0][0][1] == [single]
+        assert calls[1][0][1] == batch
+        assert calls[2][0][1][0].predictions == events[0].predictions
+        assert all(call[0][2] >= 0 for call in calls)
+        source, recorded_columns, recorded, _ = audit_log.record_columns.call_args[0]
+        assert (source, recorded_columns, recorded) == ("columns", columns, columnar)
+
+    @pytest.mark.asyncio
+    async def test_audit_log_keeps_predictions_whose_recommendations_never_came(self, mock_model_repo, mock_recommendation_service, patient_data):
+        """Test deferred and streamed predictions are logged when sent, and failed or abandoned recommendations too."""
+        mock_recommendation_service.generate_recommendation.side_effect = RuntimeError("upstream down")
+        audit_log = AsyncMock()
+        jobs = RecommendationJobQueue(workers=1)
+        use_case = HypertensionPredictionUseCase(
+            mock_model_repo, mock_recommendation_service, recommendation_jobs=jobs, audit_log=audit_log
+        )
+
+        _, job = await use_case.predict_hypertension_risk_deferred(patient_data)
+        await jobs._queue.join()
+        events = use_case.stream_hypertension_risk(patient_data)
+        predictions = await events.__anext__()
+        # The client disconnects after the predictions.
+        await events.aclose()
+        await jobs.aclose()
+
+        assert jobs.get(job.job_id).status == "failed"
+        assert [
+            (call[0][0], call[0][3], call[0][4]) for call in audit_log.record.call_args_list
+        ] == [
+            ("deferred", "predicciones", None),
+            ("deferred", "recomendaciones", "RuntimeError: upstream down"),
+            ("stream", "predicciones", None),
+            ("stream", "recomendaciones", "cancelled"),
+        ]
+        assert audit_log.record.call_args[0][1][0].predictions == predictions.predictions
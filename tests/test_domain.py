@@ -3,7 +3,9 @@ Unit tests for domain layer.
 """
 
 import pytest
-from app.domain.entities import PatientData, PredictionResult, HypertensionAssessment
+import numpy as np
+from app.domain.entities import PatientData, PredictionResult, HypertensionAssessment, FEATURE_NAMES, calculate_imc
+from app.domain.features import build_feature_matrix, build_feature_matrix_from_columns
 
 
 class TestPatientData:
@@ -36,6 +38,48 @@ class TestPatientData:
         assert patient.tension_arterial == 130.0
         assert patient.edad == 35
 
+    def test_to_feature_row(self):
+        """Test features follow the model column order."""
+        patient = PatientData(70.0, 1.75, 150.0, 120.0, 30)
+        assert len(patient.to_feature_row()) == len(FEATURE_NAMES)
+        assert patient.to_feature_row() == (patient.calculate_imc(), 150.0, 120.0, 70.0, 30)
+
+
+class TestFeatureMatrix:
+    """Test cases for the feature builder."""
+
+    def test_build_feature_matrix(self):
+        """Test one contiguous row per patient."""
+        patients = [PatientData(70.0, 1.75, 150.0, 120.0, 30), PatientData(90.0, 1.60, 20.0, 150.0, 60)]
+        matrix = build_feature_matrix(patients)
+
+        assert matrix.shape == (2, 5)
+        assert matrix.dtype == np.float64
+        assert matrix.flags.c_contiguous
+        assert matrix[1].tolist() == list(patients[1].to_feature_row())
+
+    def test_build_feature_matrix_float32(self):
+        """Test the feature dtype is configurable."""
+        matrix = build_feature_matrix([PatientData(70.0, 1.75, 150.0, 120.0, 30)], dtype=np.float32)
+        assert matrix.dtype == np.float32
+
+    def test_build_feature_matrix_from_columns(self):
+        """Test the column-wise builder matches the per-patient one exactly."""
+        patients = [PatientData(70.0, 1.75, 150.0, 120.0, 30), PatientData(90.3, 1.61, 20.5, 150.0, 60)]
+        columns = [np.array([getattr(p, field) for p in patients])
+                   for field in ("peso", "estatura", "actividad_total", "tension_arterial", "edad")]
+
+        for dtype in (np.float64, np.float32):
+            expected = build_feature_matrix(patients, dtype=dtype)
+            matrix = build_feature_matrix_from_columns(*columns, dtype=dtype)
+            assert matrix.dtype == dtype
+            assert np.array_equal(matrix, expected)
+
+    def test_calculate_imc_vectorized(self):
+        """Test the BMI formula applies to whole columns."""
+        imc = calculate_imc(np.array([70.0, 90.0]), np.array([1.75, 1.60]))
+        assert imc.tolist() == [PatientData(70.0, 1.75, 0, 0, 0).calculate_imc(), 90.0 / 1.60 ** 2]
+
 
 class TestPredictionResult:
     """Test cases for PredictionResult entity."""
@@ -66,4 +110,4 @@ class TestHypertensionAssessment:
         
         assert assessment.patient_data == patient
         assert len(assessment.predictions) == 2
-        assert assessment.predictions[0].modelo == "LOG"
\ No newline at end of file
+        assert assessment.predictions[0].modelo == "LOG"
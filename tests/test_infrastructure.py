@@ -2,17 +2,40 @@
 Unit tests for infrastructure layer.
 """
 
+import asyncio
+import threading
+import time
 import pytest
+from pathlib import Path
+import numpy as np
 import pandas as pd
-from unittest.mock import Mock, patch, MagicMock
+import httpx
+from openai import APIConnectionError, APITimeoutError
+from unittest.mock import Mock, patch, MagicMock, AsyncMock
+from app.domain.repositories import RecommendationUnavailableError
 from app.infrastructure.ml_models import JoblibModelRepository
 from app.infrastructure.openai_service import OpenAIRecommendationService
+from app.infrastructure.model_registry import ModelRegistry
+from app.infrastructure.admission import AdmissionLimiter, AdmissionRejected
+from app.infrastructure.cache import AsyncTTLCache
+from app.infrastructure.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.infrastructure.fallback_recommendations import FallbackRecommendationService, MIXED_RECOMMENDATION
+from app.infrastructure.inference_executor import InferenceExecutor
+from app.infrastructure.micro_batching import MicroBatcher
+from app.infrastructure.recommendation_jobs import RecommendationJobQueue, JobQueueFullError
+from app.infrastructure.shadow_scoring import ShadowScorer, load_candidates
+from app.infrastructure.profiling import RequestProfiler
+from app.infrastructure.audit_log import AuditLog
+from app.infrastructure.model_store import MmapModelRepository
+from app.infrastructure.compiled_models import compile_model, LinearEvaluator, ForestEvaluator, BoosterEvaluator
+from app.infrastructure.metrics import _Metric, MetricsRegistry, PredictionMetrics
+from app.infrastructure.bulk_scoring import score_file, build_recommendation_lookup, main as bulk_scoring_main
 
 
 class TestJoblibModelRepository:
     """Test cases for JoblibModelRepository."""
     
-    @patch('app.infrastructure.ml_models.joblib.load')
+    @patch('joblib.load')
     @patch('app.infrastructure.ml_models.Path.exists')
     def test_load_models(self, mock_exists, mock_joblib_load):
         """Test model loading."""
@@ -27,7 +50,7 @@ class TestJoblibModelRepository:
         assert 'RF' in repo.get_available_models()
         assert 'XGB' in repo.get_available_models()
     
-    @patch('app.infrastructure.ml_models.joblib.load')
+    @patch('joblib.load')
     @patch('app.infrastructure.ml_models.Path.exists')
     def test_predict(self, mock_exists, mock_joblib_load):
         """Test prediction functionality."""
@@ -37,13 +60,82 @@ class TestJoblibModelRepository:
         mock_joblib_load.return_value = mock_model
         
         repo = JoblibModelRepository()
-        data = pd.DataFrame([[25.0, 150.0, 120.0, 70.0, 30]])
+        data = np.array([[25.0, 150.0, 120.0, 70.0, 30]])
         
         result = repo.predict('LOG', data)
         assert result == 1
-        mock_model.predict.assert_called_once_with(data)
+        mock_model.predict.assert_called_once()
+        assert mock_model.predict.call_args[0][0] is data
     
-    @patch('app.infrastructure.ml_models.joblib.load')
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_predict_batch(self, mock_exists, mock_joblib_load):
+        """Test batch prediction runs the model once over all rows."""
+        mock_exists.return_value = True
+        mock_model = Mock()
+        mock_model.predict.return_value = np.array([1, 0, 1])
+        mock_joblib_load.return_value = mock_model
+
+        repo = JoblibModelRepository()
+        data = np.array([[25.0, 150.0, 120.0, 70.0, 30]] * 3)
+
+        result = repo.predict_batch('RF', data)
+        assert result == [1, 0, 1]
+        assert all(type(value) is int for value in result)
+        mock_model.predict.assert_called_once()
+        assert mock_model.predict.call_args[0][0] is data
+
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_feature_order_checked_at_load(self, mock_exists, mock_joblib_load):
+        """Test feature names are validated once and mapped to a column permutation."""
+        from sklearn.linear_model import LogisticRegression
+
+        mock_exists.return_value = True
+        names = ["edad", "IMC_calculado", "actividad_total", "tension_arterial", "peso_promedio"]
+        model = LogisticRegression().fit(
+            pd.DataFrame([[30, 22.0, 150.0, 120.0, 70.0], [65, 35.0, 10.0, 160.0, 95.0]], columns=names),
+            [0, 1]
+        )
+        mock_joblib_load.return_value = model
+
+        repo = JoblibModelRepository()
+        data = np.array([[22.0, 150.0, 120.0, 70.0, 30], [35.0, 10.0, 160.0, 95.0, 65]])
+
+        assert not hasattr(model, "feature_names_in_")
+        assert repo.predict_batch('LOG', data) == [0, 1]
+
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_unexpected_features_rejected_at_load(self, mock_exists, mock_joblib_load):
+        """Test a model trained on other features fails to load."""
+        mock_exists.return_value = True
+        model = Mock()
+        model.feature_names_in_ = np.array(["a", "b", "c", "d", "e"])
+        mock_joblib_load.return_value = model
+
+        with pytest.raises(ValueError, match="expects features"):
+            JoblibModelRepository()
+
+    def test_array_path_matches_dataframe_predictions(self):
+        """Test the array fast path predicts exactly like the original DataFrame path."""
+        import joblib
+        from app.domain.entities import FEATURE_NAMES
+        from app.infrastructure.ml_models import MODEL_DIR, MODEL_FILES
+
+        rng = np.random.default_rng(0)
+        data = np.column_stack([
+            rng.uniform(17, 40, 200), rng.uniform(0, 300, 200), rng.uniform(90, 180, 200),
+            rng.uniform(45, 120, 200), rng.integers(18, 90, 200)
+        ])
+        repo = JoblibModelRepository()
+
+        for name, filename in MODEL_FILES.items():
+            original = joblib.load(MODEL_DIR / filename)
+            expected = original.predict(pd.DataFrame(data, columns=list(FEATURE_NAMES))).tolist()
+            assert repo.predict_batch(name, data) == expected
+
+    @patch('joblib.load')
     @patch('app.infrastructure.ml_models.Path.exists')
     def test_predict_invalid_model(self, mock_exists, mock_joblib_load):
         """Test prediction with invalid model name."""
@@ -51,7 +143,7 @@ class TestJoblibModelRepository:
         mock_joblib_load.return_value = Mock()
         
         repo = JoblibModelRepository()
-        data = pd.DataFrame([[25.0, 150.0, 120.0, 70.0, 30]])
+        data = np.array([[25.0, 150.0, 120.0, 70.0, 30]])
         
         with pytest.raises(ValueError, match="Model INVALID not found"):
             repo.predict('INVALID', data)
@@ -60,39 +152,143 @@ class TestJoblibModelRepository:
 class TestOpenAIRecommendationService:
     """Test cases for OpenAIRecommendationService."""
     
-    @patch('app.infrastructure.openai_service.OpenAI')
-    @patch('app.infrastructure.openai_service.os.getenv')
-    def test_init(self, mock_getenv, mock_openai):
-        """Test service initialization."""
-        mock_getenv.return_value = "test-api-key"
-        service = OpenAIRecommendationService()
-        mock_openai.assert_called_once_with(api_key="test-api-key")
-    
-    @patch('app.infrastructure.openai_service.asyncio.to_thread')
-    @patch('app.infrastructure.openai_service.OpenAI')
-    @patch('app.infrastructure.openai_service.os.getenv')
-    @pytest.mark.asyncio
-    async def test_generate_recommendation(self, mock_getenv, mock_openai, mock_to_thread):
-        """Test recommendation generation."""
-        mock_getenv.return_value = "test-api-key"
-
-        # Create proper mock structure for OpenAI response
+    @staticmethod
+    def _completion(content):
+        """Build an OpenAI chat completion response."""
         mock_message = Mock()
-        mock_message.content = "Recomendación médica"
+        mock_message.content = content
         mock_choice = Mock()
         mock_choice.message = mock_message
         mock_response = Mock()
         mock_response.choices = [mock_choice]
+        return mock_response
 
-        mock_to_thread.return_value = mock_response
+    @patch('openai.AsyncOpenAI')
+    @patch('app.infrastructure.openai_service.os.getenv')
+    def test_init(self, mock_getenv, mock_openai):
+        """Test service initialization."""
+        mock_getenv.return_value = "test-api-key"
+        service = OpenAIRecommendationService(timeout=10.0)
+        mock_openai.assert_called_once()
+        kwargs = mock_openai.call_args.kwargs
+        assert kwargs["api_key"] == "test-api-key"
+        assert kwargs["timeout"] == 10.0
+        assert kwargs["max_retries"] == 0
+        assert kwargs["http_client"] is not None
+
+    @pytest.mark.asyncio
+    async def test_generate_recommendation(self, mock_openai_client):
+        """Test recommendation generation."""
+        mock_openai_client.chat.completions.create.return_value = self._completion("Recomendación médica")
 
         service = OpenAIRecommendationService()
         result = await service.generate_recommendation("Sí")
 
         assert result == "Recomendación médica"
-        mock_to_thread.assert_called_once()
+        mock_openai_client.chat.completions.create.assert_awaited_once()
+        assert mock_openai_client.chat.completions.create.call_args.kwargs["model"] == "gpt-4o"
+
+    @pytest.mark.asyncio
+    async def test_generate_recommendation_single_flight(self, mock_openai_client):
+        """Test concurrent identical recommendations share one upstream call."""
+        async def slow_completion(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return self._completion(" Recomendación ")
+
+        mock_openai_client.chat.completions.create.side_effect = slow_completion
+        service = OpenAIRecommendationService()
+
+        results = await asyncio.gather(*[service.generate_recommendation("Sí") for _ in range(500)])
+        cached = await service.generate_recommendation("Sí")
+
+        assert set(results) == {"Recomendación"}
+        assert cached == "Recomendación"
+        assert mock_openai_client.chat.completions.create.await_count == 1
+        assert service.cache_stats() == {"hits": 1, "misses": 1, "coalesced": 499, "size": 1}
+
+    @pytest.mark.asyncio
+    async def test_generate_consensus_recommendation(self, mock_openai_client):
+        """Test unanimous models reuse the single-label recommendation and mixed ones get one prompt."""
+        mock_openai_client.chat.completions.create.return_value = self._completion("Recomendación")
+        service = OpenAIRecommendationService()
+
+        await service.generate_recommendation("Sí")
+        await service.generate_consensus_recommendation({"LOG": "Sí", "RF": "Sí"})
+        assert mock_openai_client.chat.completions.create.await_count == 1
+
+        await service.generate_consensus_recommendation({"RF": "No", "LOG": "Sí"})
+        await service.generate_consensus_recommendation({"LOG": "Sí", "RF": "No"})
+        assert mock_openai_client.chat.completions.create.await_count == 2
+        prompt = mock_openai_client.chat.completions.create.call_args.kwargs["messages"][-1]["content"]
+        assert "LOG: 'Sí', RF: 'No'" in prompt
+
+    @patch('app.infrastructure.openai_service.asyncio.sleep', new_callable=AsyncMock)
+    @pytest.mark.asyncio
+    async def test_generate_recommendation_retries_transient_errors(self, mock_sleep, mock_openai_client):
+        """Test transient upstream errors are retried with backoff."""
+        timeout_error = APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+        mock_openai_client.chat.completions.create.side_effect = [
+            timeout_error, timeout_error, self._completion("Recomendación")
+        ]
+        service = OpenAIRecommendationService(max_retries=2)
+
+        assert await service.generate_recommendation("No") == "Recomendación"
+        assert mock_openai_client.chat.completions.create.await_count == 3
+        assert mock_sleep.await_count == 2
+
+    @patch('app.infrastructure.openai_service.asyncio.sleep', new_callable=AsyncMock)
+    @pytest.mark.asyncio
+    async def test_generate_recommendation_gives_up_after_max_retries(self, mock_sleep, mock_openai_client):
+        """Test retries are bounded."""
+        timeout_error = APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+        mock_openai_client.chat.completions.create.side_effect = timeout_error
+        service = OpenAIRecommendationService(max_retries=1)
+
+        with pytest.raises(RecommendationUnavailableError) as exc_info:
+            await service.generate_recommendation("No")
+        assert exc_info.value.__cause__ is timeout_error
+        assert mock_openai_client.chat.completions.create.await_count == 2
 
-    @patch('app.infrastructure.ml_models.joblib.load')
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self, mock_openai_client):
+        """Test upstream calls never exceed the configured concurrency."""
+        active = 0
+        peak = 0
+
+        async def tracked_completion(*args, **kwargs):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return self._completion("Recomendación")
+
+        mock_openai_client.chat.completions.create.side_effect = tracked_completion
+        service = OpenAIRecommendationService(max_concurrency=2)
+
+        await asyncio.gather(*[service._complete(f"prompt {i}") for i in range(6)])
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_circuit_breaker_rejects_calls_while_open(self, mock_openai_client):
+        """Test failing calls open the circuit and later calls skip OpenAI."""
+        mock_openai_client.chat.completions.create.side_effect = APIConnectionError(
+            request=httpx.Request("POST", "https://api.openai.com")
+        )
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+        service = OpenAIRecommendationService(circuit_breaker=breaker, max_retries=0)
+
+        for prediction in ("Sí", "No"):
+            with pytest.raises(RecommendationUnavailableError):
+                await service.generate_recommendation(prediction)
+        with pytest.raises(RecommendationUnavailableError) as exc_info:
+            await service.generate_recommendation("Sí")
+        assert isinstance(exc_info.value.__cause__, CircuitOpenError)
+
+        assert breaker.state == "open"
+        assert mock_openai_client.chat.completions.create.await_count == 2
+
+    @patch('joblib.load')
     @patch('app.infrastructure.ml_models.Path.exists')
     def test_model_file_not_exists(self, mock_exists, mock_joblib_load):
         """Test behavior when model files don't exist."""
@@ -102,7 +298,7 @@ class TestOpenAIRecommendationService:
         assert len(repo.get_available_models()) == 0
         mock_joblib_load.assert_not_called()
 
-    @patch('app.infrastructure.openai_service.OpenAI')
+    @patch('openai.AsyncOpenAI')
     @patch('app.infrastructure.openai_service.os.getenv')
     def test_openai_service_no_api_key(self, mock_getenv, mock_openai):
         """Test OpenAI service initialization without API key."""
@@ -112,4 +308,1062 @@ class TestOpenAIRecommendationService:
 
         service = OpenAIRecommendationService()
         assert service.client is not None
-        mock_openai.assert_called_once_with(api_key=None)
\ No newline at end of file
+        assert mock_openai.call_args.kwargs["api_key"] is None
+
+
+class TestCircuitBreaker:
+    """Test cases for CircuitBreaker."""
+
+    def test_opens_after_consecutive_failures(self):
+        """Test the circuit opens at the threshold and a success resets the count."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=lambda: 0.0)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow_request()
+
+    def test_half_open_allows_one_trial(self):
+        """Test one trial call after the cool-down decides whether the circuit closes."""
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10.0, clock=lambda: now[0])
+        breaker.record_failure()
+
+        now[0] = 10.0
+        assert breaker.state == "half_open"
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        now[0] = 20.0
+        assert breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == "closed"
+        assert breaker.allow_request()
+
+
+class TestFallbackRecommendationService:
+    """Test cases for FallbackRecommendationService."""
+
+    @pytest.mark.asyncio
+    async def test_fixed_recommendations(self):
+        """Test every label and disagreement get a local recommendation."""
+        service = FallbackRecommendationService()
+
+        yes = await service.generate_recommendation("Sí")
+        no = await service.generate_recommendation("No")
+
+        assert yes != no
+        assert await service.generate_consensus_recommendation({"LOG": "No", "RF": "No"}) == no
+        assert await service.generate_consensus_recommendation({"LOG": "Sí", "RF": "No"}) == MIXED_RECOMMENDATION
+
+
+class TestRecommendationJobQueue:
+    """Test cases for RecommendationJobQueue."""
+
+    @pytest.mark.asyncio
+    async def test_workers_bound_concurrency(self):
+        """Test no more jobs run at once than there are workers."""
+        jobs = RecommendationJobQueue(workers=2, max_queue_size=10)
+        running = 0
+        peak = 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "assessment"
+
+        submitted = [jobs.submit(work) for _ in range(6)]
+        await jobs._queue.join()
+
+        assert peak == 2
+        assert all(jobs.get(job.job_id).assessment == "assessment" for job in submitted)
+        assert jobs.stats()["done"] == 6
+        await jobs.aclose()
+
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_jobs(self):
+        """Test submitting beyond the queue size is refused instead of waiting."""
+        jobs = RecommendationJobQueue(workers=1, max_queue_size=1)
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+
+        jobs.submit(work)
+        await asyncio.sleep(0)
+        jobs.submit(work)
+        with pytest.raises(JobQueueFullError):
+            jobs.submit(work)
+
+        assert jobs.stats() == {"queued": 1, "running": 1, "done": 0, "failed": 0, "rejected": 1}
+        release.set()
+        await jobs.aclose()
+
+    @pytest.mark.asyncio
+    async def test_reservations_count_against_the_queue(self):
+        """Test a reserved place is refused to other jobs until it is submitted or released."""
+        jobs = RecommendationJobQueue(workers=0, max_queue_size=1)
+
+        jobs.reserve()
+        with pytest.raises(JobQueueFullError):
+            jobs.submit(AsyncMock())
+        with pytest.raises(JobQueueFullError):
+            jobs.reserve()
+        jobs.release()
+        jobs.reserve()
+        job = jobs.submit(AsyncMock(), reserved=True)
+
+        assert jobs.get(job.job_id).status == "pending"
+        assert jobs.stats()["queued"] == 1
+        assert jobs.stats()["rejected"] == 2
+        with pytest.raises(JobQueueFullError):
+            jobs.reserve()
+        await jobs.aclose()
+
+    @pytest.mark.asyncio
+    async def test_failed_jobs_and_expiry(self):
+        """Test a failure is recorded on the job and finished jobs expire after the TTL."""
+        now = [0.0]
+        jobs = RecommendationJobQueue(workers=1, ttl=60, clock=lambda: now[0])
+
+        job = jobs.submit(AsyncMock(side_effect=ValueError("upstream down")))
+        await jobs._queue.join()
+
+        assert jobs.get(job.job_id).status == "failed"
+        assert job.error == "upstream down"
+        now[0] = 60.0
+        assert jobs.get(job.job_id) is None
+        assert jobs.get("unknown") is None
+        await jobs.aclose()
+
+
+class TestAdmissionLimiter:
+    """Test cases for AdmissionLimiter."""
+
+    @pytest.mark.asyncio
+    async def test_queues_then_rejects(self):
+        """Test requests beyond the cap wait in a bounded queue and the rest are rejected."""
+        limiter = AdmissionLimiter(max_in_flight=1, max_waiting=1, wait_timeout=1.0)
+
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+        assert limiter.stats() == {"in_flight": 1, "waiting": 1, "rejected": 1}
+
+        limiter.release()
+        await waiter
+        assert limiter.stats() == {"in_flight": 1, "waiting": 0, "rejected": 1}
+
+    @pytest.mark.asyncio
+    async def test_wait_times_out(self):
+        """Test a queued request is rejected once its wait runs out."""
+        limiter = AdmissionLimiter(max_in_flight=1, max_waiting=4, wait_timeout=0.01)
+
+        await limiter.acquire()
+        with pytest.raises(AdmissionRejected):
+            await limiter.acquire()
+
+        assert limiter.stats() == {"in_flight": 1, "waiting": 0, "rejected": 1}
+
+
+class TestRequestProfiler:
+    """Test cases for RequestProfiler."""
+
+    @pytest.mark.asyncio
+    async def test_sampling_and_one_profile_at_a_time(self, tmp_path):
+        """Test requests are picked by header or sample rate, never while another is profiled."""
+        profiler = RequestProfiler(tmp_path, sample_rate=0.1, random_source=iter([0.5, 0.05]).__next__)
+
+        assert not profiler.should_profile(False)
+        assert profiler.should_profile(False)
+        async with profiler.profile("predict") as profile_id:
+            assert not profiler.should_profile(True)
+            sum(range(1000))
+
+        assert profiler.should_profile(True)
+        assert (tmp_path / f"{profile_id}.prof").exists()
+        assert profiler.profiles == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("kind", ["thread", "process"])
+    async def test_executor_inference_is_merged_into_the_profile(self, tmp_path, kind):
+        """Test inference run in executor workers shows up in the request's profile."""
+        import pstats
+
+        data = np.array([[22.9, 150.0, 120.0, 70.0, 30]])
+        repo = JoblibModelRepository()
+        executor = InferenceExecutor(kind=kind, max_workers=1)
+        profiler = RequestProfiler(tmp_path)
+        try:
+            async with profiler.profile("predict") as profile_id:
+                await executor.predict_batch(repo, "RF", data)
+            # Outside a profile, calls are submitted as they are.
+            assert await executor.predict_batch(repo, "RF", data) == repo.predict_batch("RF", data)
+        finally:
+            executor.shutdown()
+
+        stats = pstats.Stats(str(tmp_path / f"{profile_id}.prof")).stats
+        assert ("ml_models.py", "predict_batch") in {(Path(path).name, name) for path, _, name in stats}
+
+    @pytest.mark.asyncio
+    async def test_profile_is_written_off_the_event_loop(self, tmp_path, monkeypatch):
+        """Test the profile file is written on a worker thread, not the event loop thread."""
+        import threading
+
+        profiler = RequestProfiler(tmp_path)
+        writers = []
+        write = profiler._write
+        monkeypatch.setattr(profiler, "_write", lambda *args: writers.append(threading.get_ident()) or write(*args))
+
+        async with profiler.profile("predict") as profile_id:
+            sum(range(1000))
+
+        assert writers and writers[0] != threading.get_ident()
+        assert (tmp_path / f"{profile_id}.prof").exists()
+
+
+class TestShadowScorer:
+    """Test cases for ShadowScorer."""
+
+    @pytest.mark.asyncio
+    async def test_counts_agreement_with_production(self):
+        """Test queued rows are scored in one batch and compared with production per model."""
+        candidate = Mock()
+        candidate.get_available_models.return_value = ['RF']
+        candidate.predict_batch.side_effect = lambda model, data: [int(v > 25) for v in data[:, 0]]
+        scorer = ShadowScorer({'v2': candidate})
+
+        assert scorer.submit(np.array([[20.0], [30.0]]), {'RF': [0, 0], 'LOG': [0, 0]})
+        assert scorer.submit(np.array([[40.0]]), {'RF': np.array([1])})
+        await scorer._queue.join()
+
+        candidate.predict_batch.assert_called_once()
+        assert scorer.stats()["candidates"] == [{
+            "version": "v2", "model": "RF", "rows": 3, "agreements": 2, "agreement_rate": 2 / 3,
+            "candidate_positive": 2, "production_positive": 1
+        }]
+        await scorer.aclose()
+
+    @pytest.mark.asyncio
+    async def test_drops_work_when_full(self):
+        """Test submitting to a full queue drops the work instead of waiting."""
+        candidate = Mock()
+        candidate.get_available_models.return_value = ['RF']
+        candidate.predict_batch.return_value = [1]
+        scorer = ShadowScorer({'v2': candidate}, max_queue_size=1)
+
+        assert scorer.submit(np.array([[1.0]]), {'RF': [1]})
+        assert not scorer.submit(np.array([[1.0]]), {'RF': [1]})
+
+        assert scorer.stats()["dropped"] == 1
+        await scorer.aclose()
+
+    def test_load_candidates(self, tmp_path):
+        """Test each subdirectory with model files is loaded as a candidate version."""
+        import shutil
+        from app.infrastructure.ml_models import MODEL_DIR
+
+        (tmp_path / "v2").mkdir()
+        (tmp_path / "empty").mkdir()
+        shutil.copy(MODEL_DIR / "modelo_hipertension_RF.pkl", tmp_path / "v2")
+
+        candidates = load_candidates(tmp_path)
+
+        assert list(candidates) == ["v2"]
+        assert candidates["v2"].get_available_models() == ['RF']
+        assert load_candidates(tmp_path / "missing") == {}
+
+
+class TestAuditLog:
+    """Test cases for AuditLog."""
+
+    @pytest.fixture
+    def assessment(self):
+        """Assessment of one patient."""
+        from app.domain.entities import HypertensionAssessment, PatientData, PredictionResult
+        return HypertensionAssessment(
+            patient_data=PatientData(
+                peso=70.0, estatura=1.75, actividad_total=150.0, tension_arterial=120.0, edad=30
+            ),
+            predictions=[PredictionResult(modelo='RF', prediccion='Sí', respuesta='Consulte a su médico')]
+        )
+
+    @pytest.fixture
+    def gated_writes(self):
+        """Replace a log's writes with ones that hold the writer until released."""
+        writing, release = threading.Event(), threading.Event()
+        written = []
+
+        def gate(log):
+            def write(entries):
+                writing.set()
+                release.wait(5)
+                written.extend(base["origen"] for _, base, _ in entries)
+            log._write = write
+            return writing, release, written
+
+        yield gate
+        release.set()
+
+    @pytest.mark.asyncio
+    async def test_writes_lines_and_flushes_on_close(self, tmp_path, assessment):
+        """Test each patient becomes one JSON line, all of them written by close."""
+        import json
+        from app.domain.entities import ColumnarAssessment
+
+        log = AuditLog(tmp_path / "audit" / "predictions.jsonl", flush_interval=60)
+        await log.record("stream", [assessment], 0.0125, stage="recomendaciones", error="cancelled")
+        columns = {
+            'peso': np.array([60.0, 90.0]), 'estatura': np.array([1.6, 1.8]),
+            'actividad_total': np.array([100.0, 0.0]), 'tension_arterial': np.array([110.0, 150.0]),
+            'edad': np.array([25, 60])
+        }
+        await log.record_columns("columns", columns, ColumnarAssessment(
+            models=['RF'], predictions={'RF': np.array([0, 1], dtype=np.int8)}
+        ), 0.002)
+        log.close()
+
+        lines = [json.loads(line) for line in (tmp_path / "audit" / "predictions.jsonl").read_text().splitlines()]
+        assert [line["origen"] for line in lines] == ["stream", "columns", "columns"]
+        assert (lines[0]["etapa"], lines[0]["error"]) == ("recomendaciones", "cancelled")
+        assert lines[0]["duracion_ms"] == 12.5
+        assert lines[0]["paciente"]["edad"] == 30
+        assert lines[0]["predicciones"] == [
+            {"modelo": "RF", "prediccion": "Sí", "respuesta": "Consulte a su médico", "degradado": False}
+        ]
+        assert lines[2]["etapa"] == "completa"
+        assert "error" not in lines[2]
+        assert lines[2]["paciente"]["peso"] == 90.0
+        assert lines[2]["predicciones"][0]["prediccion"] == "Sí"
+        assert log.stats() == {"written": 3, "dropped": 0, "queued": 0}
+
+    @pytest.mark.asyncio
+    async def test_rotates_by_size(self, tmp_path, assessment):
+        """Test the file is rotated before it would outgrow the limit, keeping a set number of backups."""
+        path = tmp_path / "predictions.jsonl"
+        log = AuditLog(path, max_bytes=1, backup_count=2, flush_interval=0.01)
+        for written in range(1, 5):
+            await log.record("predict", [assessment], 0.001)
+            deadline = time.monotonic() + 5
+            while log.written < written and time.monotonic() < deadline:
+                await asyncio.sleep(0.005)
+        log.close()
+
+        assert log.written == 4
+        assert sorted(file.name for file in tmp_path.iterdir()) == [
+            "predictions.jsonl", "predictions.jsonl.1", "predictions.jsonl.2"
+        ]
+        assert len(path.read_text().splitlines()) == 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("overflow, kept", [
+        ("drop_newest", ["first", "second"]),
+        ("drop_oldest", ["first", "third"]),
+        ("block", ["first", "second"]),
+    ])
+    async def test_overflow_policies(self, tmp_path, assessment, gated_writes, overflow, kept):
+        """Test what a full queue keeps under each overflow policy."""
+        log = AuditLog(tmp_path / "predictions.jsonl", max_queue_size=1, overflow=overflow)
+        writing, release, written = gated_writes(log)
+
+        await log.record("first", [assessment], 0.0)
+        assert writing.wait(5)
+        with patch("app.infrastructure.audit_log.BLOCK_TIMEOUT", 0.01):
+            await log.record("second", [assessment], 0.0)
+            await log.record("third", [assessment], 0.0)
+        release.set()
+        log.close()
+
+        assert written == kept
+        assert log.dropped == 1
+        with pytest.raises(ValueError):
+            AuditLog(tmp_path / "other.jsonl", overflow="spill")
+
+    @pytest.mark.asyncio
+    async def test_block_does_not_hold_up_the_event_loop(self, tmp_path, assessment, gated_writes):
+        """Test a request waiting for room under the block policy lets other work run."""
+        log = AuditLog(tmp_path / "predictions.jsonl", max_queue_size=1, overflow="block")
+        writing, release, written = gated_writes(log)
+        await log.record("first", [assessment], 0.0)
+        assert writing.wait(5)
+        await log.record("second", [assessment], 0.0)
+
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        with patch("app.infrastructure.audit_log.BLOCK_TIMEOUT", 0.2):
+            await log.record("third", [assessment], 0.0)
+        ticker.cancel()
+        release.set()
+        log.close()
+
+        assert ticks > 5
+        assert log.dropped == 1
+
+    def test_close_survives_a_lost_wake_up(self, tmp_path, assessment, gated_writes):
+        """Test close still writes everything when its wake-up marker is evicted from the queue."""
+        log = AuditLog(tmp_path / "predictions.jsonl", max_queue_size=1, overflow="drop_oldest")
+        writing, release, written = gated_writes(log)
+        log._queue.put_nowait(("assessments", {"origen": "first"}, [assessment]))
+        assert writing.wait(5)
+
+        closing = threading.Thread(target=log.close)
+        closing.start()
+        while log._queue.empty():
+            time.sleep(0.001)
+        # What a concurrent drop_oldest record does to the marker close() queued.
+        log._queue.get_nowait()
+        log._queue.put_nowait(("assessments", {"origen": "second"}, [assessment]))
+        release.set()
+        closing.join(5)
+
+        assert not log._thread.is_alive()
+        assert written == ["first", "second"]
+
+
+class TestModelRegistry:
+    """Test cases for ModelRegistry."""
+
+    def test_loads_once_and_shares_repository(self, tmp_path):
+        """Test repository is loaded on first access and reused."""
+        loader = Mock(side_effect=lambda: Mock())
+        registry = ModelRegistry(loader, tmp_path)
+
+        first = registry.repository
+        second = registry.repository
+
+        assert first is second
+        assert loader.call_count == 1
+        assert registry.version == 1
+
+    def test_reload_swaps_repository(self, tmp_path):
+        """Test reload publishes a new repository and keeps the old one usable."""
+        old_repo, new_repo = Mock(), Mock()
+        registry = ModelRegistry(Mock(side_effect=[old_repo, new_repo]), tmp_path)
+
+        in_flight = registry.repository
+        version = registry.reload()
+
+        assert version == 2
+        assert registry.repository is new_repo
+        assert in_flight is old_repo
+
+    def test_has_changed_detects_new_files(self, tmp_path):
+        """Test mtime watching notices model file changes."""
+        registry = ModelRegistry(Mock(), tmp_path)
+        registry.reload()
+        assert not registry.has_changed()
+
+        (tmp_path / 'modelo_hipertension_LOG.pkl').write_bytes(b'model')
+        assert registry.has_changed()
+
+        registry.reload()
+        assert not registry.has_changed()
+
+    def test_reload_listeners(self, tmp_path):
+        """Test listeners run when models are swapped, not on the first load."""
+        listener = Mock()
+        registry = ModelRegistry(Mock(), tmp_path)
+        registry.add_reload_listener(listener)
+
+        registry.reload()
+        listener.assert_not_called()
+        registry.reload()
+        listener.assert_called_once()
+
+    def test_partial_writes_are_ignored(self, tmp_path):
+        """Test hidden temporary files do not trigger a reload."""
+        registry = ModelRegistry(Mock(), tmp_path)
+        registry.reload()
+
+        (tmp_path / '.RF.threshold.npy.tmp').write_bytes(b'partial')
+        assert not registry.has_changed()
+
+    def test_failed_reload_keeps_previous_repository(self, tmp_path):
+        """Test a broken model file does not replace the loaded models."""
+        repo = Mock()
+        registry = ModelRegistry(Mock(side_effect=[repo, IOError("corrupt")]), tmp_path)
+        registry.reload()
+
+        with pytest.raises(IOError):
+            registry.reload()
+        assert registry.repository is repo
+        assert registry.version == 1
+
+
+class TestAsyncTTLCache:
+    """Test cases for AsyncTTLCache."""
+
+    @pytest.mark.asyncio
+    async def test_hit_and_miss(self):
+        """Test values are loaded once and then served from cache."""
+        cache = AsyncTTLCache(maxsize=4, ttl=60)
+        loader = AsyncMock(return_value="value")
+
+        assert await cache.get_or_load("key", loader) == "value"
+        assert await cache.get_or_load("key", loader) == "value"
+
+        assert loader.await_count == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_ttl_expiry(self):
+        """Test expired entries are loaded again."""
+        now = [0.0]
+        cache = AsyncTTLCache(maxsize=4, ttl=10, clock=lambda: now[0])
+        loader = AsyncMock(side_effect=["old", "new"])
+
+        assert await cache.get_or_load("key", loader) == "old"
+        now[0] = 11.0
+        assert await cache.get_or_load("key", loader) == "new"
+
+    def test_lru_eviction(self):
+        """Test the least recently used entry is evicted when full."""
+        cache = AsyncTTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert len(cache) == 2
+
+    @pytest.mark.asyncio
+    async def test_failures_are_shared_but_not_cached(self):
+        """Test a failed load reaches every waiter and is retried next time."""
+        cache = AsyncTTLCache()
+
+        async def failing():
+            await asyncio.sleep(0)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(
+            cache.get_or_load("key", failing),
+            cache.get_or_load("key", failing),
+            return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert cache.stats()["coalesced"] == 1
+        assert await cache.get_or_load("key", AsyncMock(return_value="ok")) == "ok"
+
+
+class TestInferenceExecutor:
+    """Test cases for InferenceExecutor."""
+
+    @pytest.mark.asyncio
+    async def test_thread_pool_predict(self):
+        """Test predictions run through the repository in a worker thread."""
+        repo = Mock()
+        repo.predict.return_value = 1
+        repo.predict_batch.return_value = [0, 1]
+        executor = InferenceExecutor(kind="thread", max_workers=2)
+
+        assert await executor.predict(repo, 'LOG', "data") == 1
+        assert await executor.predict_batch(repo, 'LOG', "data") == [0, 1]
+        assert executor.in_flight == 0
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_queue_depth(self):
+        """Test queue depth counts predictions waiting for a worker."""
+        release = threading.Event()
+        repo = Mock()
+        repo.predict.side_effect = lambda *args: release.wait(5) and 1
+        executor = InferenceExecutor(kind="thread", max_workers=1)
+
+        tasks = [asyncio.create_task(executor.predict(repo, 'LOG', "data")) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert executor.in_flight == 3
+        assert executor.queue_depth == 2
+
+        release.set()
+        assert await asyncio.gather(*tasks) == [1, 1, 1]
+        assert executor.queue_depth == 0
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_process_pool_uses_worker_models(self):
+        """Test process workers load their own models and match in-process inference."""
+        data = np.array([[22.9, 150.0, 120.0, 70.0, 30], [35.1, 10.0, 160.0, 95.0, 65]])
+        repo = JoblibModelRepository()
+        executor = InferenceExecutor(kind="process", max_workers=1)
+        try:
+            for model_name in repo.get_available_models():
+                assert await executor.predict_batch(None, model_name, data) == repo.predict_batch(model_name, data)
+        finally:
+            executor.shutdown()
+
+    def test_invalid_kind(self):
+        """Test unknown executor kinds are rejected."""
+        with pytest.raises(ValueError, match="Unknown inference executor"):
+            InferenceExecutor(kind="gpu")
+
+
+class TestMicroBatcher:
+    """Test cases for MicroBatcher."""
+
+    @staticmethod
+    def _row(value):
+        """Build a one-row feature matrix."""
+        return np.array([[value, 150.0, 120.0, 70.0, 30]])
+
+    @pytest.mark.asyncio
+    async def test_coalesces_concurrent_rows(self):
+        """Test concurrent rows share one batched call and get their own result."""
+        repo = Mock()
+        repo.predict_batch.side_effect = lambda model, data: [int(v > 25) for v in data[:, 0]]
+        batcher = MicroBatcher(window=0.01, max_batch_size=64)
+
+        results = await asyncio.gather(*[
+            batcher.predict(repo, 'RF', self._row(value)) for value in [20.0, 30.0, 22.0, 40.0]
+        ])
+
+        assert results == [0, 1, 0, 1]
+        repo.predict_batch.assert_called_once()
+        assert len(repo.predict_batch.call_args[0][1]) == 4
+        assert batcher.stats()["mean_batch_size"] == 4
+
+    @pytest.mark.asyncio
+    async def test_max_batch_size(self):
+        """Test a full batch is flushed without waiting for the window."""
+        repo = Mock()
+        repo.predict_batch.side_effect = lambda model, data: [1] * len(data)
+        batcher = MicroBatcher(window=10.0, max_batch_size=2)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*[batcher.predict(repo, 'RF', self._row(25.0)) for _ in range(4)]),
+            timeout=1.0
+        )
+
+        assert results == [1, 1, 1, 1]
+        assert repo.predict_batch.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_models_are_batched_separately(self):
+        """Test rows for different models never share a batch."""
+        repo = Mock()
+        repo.predict_batch.side_effect = lambda model, data: [1 if model == 'LOG' else 0] * len(data)
+        batcher = MicroBatcher(window=0.01)
+
+        results = await asyncio.gather(
+            batcher.predict(repo, 'LOG', self._row(25.0)),
+            batcher.predict(repo, 'XGB', self._row(25.0))
+        )
+
+        assert results == [1, 0]
+        assert repo.predict_batch.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        """Test a failed batch fails each coalesced request."""
+        repo = Mock()
+        repo.predict_batch.side_effect = ValueError("Model RF not found")
+        batcher = MicroBatcher(window=0.01)
+
+        results = await asyncio.gather(
+            batcher.predict(repo, 'RF', self._row(25.0)),
+            batcher.predict(repo, 'RF', self._row(30.0)),
+            return_exceptions=True
+        )
+
+        assert all(isinstance(r, ValueError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_matches_direct_prediction(self):
+        """Test batched results equal one-row predictions with the real models."""
+        repo = JoblibModelRepository()
+        rows = [
+            np.array([row]) for row in [
+                (22.9, 150.0, 120.0, 70.0, 30), (35.1, 10.0, 160.0, 95.0, 65), (27.0, 60.0, 135.0, 80.0, 50)
+            ]
+        ]
+        executor = InferenceExecutor(kind="thread", max_workers=2)
+        batcher = MicroBatcher(window=0.005, executor=executor)
+        try:
+            for model_name in repo.get_available_models():
+                batched = await asyncio.gather(*[batcher.predict(repo, model_name, row) for row in rows])
+                assert batched == [repo.predict(model_name, row) for row in rows]
+        finally:
+            executor.shutdown()
+
+
+class TestCompiledModels:
+    """Test cases for the compiled inference mode."""
+
+    @pytest.fixture
+    def features(self):
+        """Random plausible feature rows in FEATURE_NAMES order."""
+        rng = np.random.default_rng(42)
+        return np.column_stack([
+            rng.uniform(15, 45, 3000), rng.uniform(0, 400, 3000), rng.uniform(80, 200, 3000),
+            rng.uniform(40, 140, 3000), rng.integers(18, 95, 3000)
+        ]).astype(np.float64)
+
+    def test_compiled_repository_parity(self, features):
+        """Test compiled evaluators predict exactly like the original models."""
+        original = JoblibModelRepository()
+        compiled = JoblibModelRepository(compiled=True)
+
+        assert compiled.get_available_models() == original.get_available_models()
+        for model_name in original.get_available_models():
+            for rows in (features[:1], features[:20], features[:200], features):
+                assert compiled.predict_batch(model_name, rows) == original.predict_batch(model_name, rows)
+            assert compiled.predict(model_name, features[:1]) == original.predict(model_name, features[:1])
+
+    def test_compile_model_dispatch(self):
+        """Test each production model gets its lean evaluator."""
+        compiled = JoblibModelRepository(compiled=True)
+
+        assert isinstance(compiled._models['LOG'], LinearEvaluator)
+        assert isinstance(compiled._models['RF'], ForestEvaluator)
+        assert isinstance(compiled._models['XGB'], BoosterEvaluator)
+
+    def test_forest_evaluator_small_batches_skip_fallback(self, features):
+        """Test the flattened trees serve small batches and large ones use the original model."""
+        from sklearn.ensemble import RandomForestClassifier
+
+        labels = (features[:, 2] > 140).astype(int)
+        model = RandomForestClassifier(n_estimators=5, max_depth=4, random_state=0).fit(features, labels)
+        evaluator = ForestEvaluator.from_forest(model, max_rows=10)
+        evaluator.fallback = Mock(wraps=model)
+
+        assert evaluator.predict(features[:10]).tolist() == model.predict(features[:10]).tolist()
+        evaluator.fallback.predict.assert_not_called()
+        np.testing.assert_allclose(evaluator.predict_proba(features[:10]), model.predict_proba(features[:10]))
+
+        evaluator.predict(features[:11])
+        evaluator.fallback.predict.assert_called_once()
+
+    def test_booster_evaluator_small_batches_skip_booster(self, features):
+        """Test the flattened trees serve small batches and large or incomplete ones use the booster."""
+        from xgboost import XGBClassifier
+
+        labels = (features[:, 2] > 140).astype(int)
+        model = XGBClassifier(n_estimators=20, max_depth=4, base_score=0.3).fit(features, labels)
+        evaluator = BoosterEvaluator.from_classifier(model, max_rows=10)
+        evaluator.booster = Mock(wraps=model.get_booster())
+
+        assert evaluator.predict(features[:10]).tolist() == model.predict(features[:10]).tolist()
+        evaluator.booster.inplace_predict.assert_not_called()
+        np.testing.assert_allclose(
+            evaluator.predict_margin(features[:10]), model.predict(features[:10], output_margin=True), rtol=1e-5
+        )
+
+        evaluator.predict(features[:11])
+        evaluator.booster.inplace_predict.assert_called_once()
+        missing = features[:2].copy()
+        missing[0, 1] = np.nan
+        assert evaluator.predict(missing).tolist() == model.predict(missing).tolist()
+        assert evaluator.booster.inplace_predict.call_count == 2
+
+    def test_unsupported_model_is_left_untouched(self):
+        """Test models without a compiled form keep their own predict."""
+        model = object()
+        assert compile_model(model) is model
+
+
+class TestMmapModelRepository:
+    """Test cases for the memory-mapped model store."""
+
+    @pytest.fixture
+    def store_dir(self, tmp_path):
+        """Export the real models into a temporary store."""
+        MmapModelRepository.export(tmp_path / "store")
+        return tmp_path / "store"
+
+    def test_round_trip_parity(self, store_dir):
+        """Test the store predicts exactly like the pickled models."""
+        rng = np.random.default_rng(7)
+        data = np.column_stack([
+            rng.uniform(15, 45, 500), rng.uniform(0, 400, 500), rng.uniform(80, 200, 500),
+            rng.uniform(40, 140, 500), rng.integers(18, 95, 500)
+        ]).astype(np.float64)
+        original = JoblibModelRepository()
+        stored = MmapModelRepository(store_dir)
+
+        assert stored.get_available_models() == original.get_available_models()
+        for model_name in original.get_available_models():
+            for rows in (data[:20], data):
+                assert stored.predict_batch(model_name, rows) == original.predict_batch(model_name, rows)
+
+    def test_arrays_are_memory_mapped(self, store_dir):
+        """Test the model arrays are read-only views of mapped files."""
+        stored = MmapModelRepository(store_dir)
+        forest = stored._models['RF']
+
+        assert isinstance(forest.threshold.base, np.memmap)
+        assert not forest.children.flags.writeable
+
+    def test_export_replaces_files(self, store_dir):
+        """Test re-exporting swaps files instead of rewriting mapped ones in place."""
+        before = (store_dir / "RF.threshold.npy").stat().st_ino
+        MmapModelRepository.export(store_dir)
+
+        assert (store_dir / "RF.threshold.npy").stat().st_ino != before
+        assert not list(store_dir.glob(".*.tmp"))
+
+    def test_empty_store(self, tmp_path):
+        """Test a store without a manifest has no models."""
+        assert MmapModelRepository(tmp_path).get_available_models() == []
+
+    def test_store_records_inference_time(self, store_dir):
+        """Test the store shares the joblib repository's instrumented predict path."""
+        metrics = PredictionMetrics()
+        stored = MmapModelRepository(store_dir, metrics=metrics)
+
+        stored.predict("LOG", np.array([[22.9, 150.0, 120.0, 70.0, 30]]))
+
+        assert metrics.model_inference.labels("LOG").count == 1
+
+
+class TestMetrics:
+    """Test cases for the metrics instrumentation."""
+
+    def test_metric_type_must_create_its_series(self):
+        """Test a metric type without a series factory cannot be instantiated."""
+        class Untyped(_Metric):
+            type_name = "untyped"
+
+        with pytest.raises(TypeError, match="_new_child"):
+            Untyped("untyped_total", "No series.")
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test observations land in inclusive buckets rendered cumulatively."""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("stage_seconds", "Stage latency.", ("stage",), buckets=(0.001, 0.01))
+        histogram.labels("a").observe_ns(1_000_000)
+        histogram.labels("a").observe(0.005)
+        histogram.labels("a").observe(1.0)
+
+        output = registry.render()
+
+        assert "# TYPE stage_seconds histogram" in output
+        assert 'stage_seconds_bucket{stage="a",le="0.001"} 1' in output
+        assert 'stage_seconds_bucket{stage="a",le="0.01"} 2' in output
+        assert 'stage_seconds_bucket{stage="a",le="+Inf"} 3' in output
+        assert 'stage_seconds_count{stage="a"} 3' in output
+        assert 'stage_seconds_sum{stage="a"} 1.006' in output
+
+    def test_counters_gauges_and_label_escaping(self):
+        """Test counters and gauges render with escaped label values."""
+        registry = MetricsRegistry()
+        counter = registry.counter("errors_total", "Errors.", ("path",))
+        gauge = registry.gauge("in_flight", "In flight.")
+        counter.labels('/a"b').inc()
+        counter.labels('/a"b').inc(2)
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        output = registry.render()
+
+        assert 'errors_total{path="/a\\"b"} 3' in output
+        assert "in_flight 1" in output
+        with pytest.raises(ValueError):
+            counter.labels("a", "b")
+
+    def test_collectors_run_before_rendering(self):
+        """Test collectors refresh gauges on every render."""
+        registry = MetricsRegistry()
+        gauge = registry.gauge("queue_depth", "Queue depth.")
+        depth = iter([3, 5])
+        registry.add_collector(lambda: gauge.set(next(depth)))
+
+        assert "queue_depth 3" in registry.render()
+        assert "queue_depth 5" in registry.render()
+
+    def test_observations_from_threads_are_not_lost(self):
+        """Test concurrent observations are all counted."""
+        histogram = PredictionMetrics().model_inference.labels("RF")
+
+        def observe():
+            for _ in range(10000):
+                histogram.observe_ns(1000)
+
+        threads = [threading.Thread(target=observe) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert histogram.count == 40000
+
+    def test_updates_wait_for_the_series_lock(self):
+        """Test an update cannot interleave with another one holding the series lock."""
+        metrics = PredictionMetrics()
+        series = [
+            metrics.model_inference.labels("RF"),
+            metrics.http_requests.labels("POST", "/predict", "200"),
+            metrics.http_requests_in_flight.labels()
+        ]
+        updates = [lambda: series[0].observe_ns(1000), lambda: series[1].inc(), lambda: series[2].dec()]
+
+        for child, update in zip(series, updates):
+            with child._lock:
+                thread = threading.Thread(target=update)
+                thread.start()
+                thread.join(timeout=0.05)
+                assert thread.is_alive()
+            thread.join()
+
+        assert series[0].count == 1
+        assert series[1].value == 1
+        assert series[2].value == -1
+
+    def test_repository_records_inference_time(self):
+        """Test the repository times each model's predict call."""
+        metrics = PredictionMetrics()
+        repo = JoblibModelRepository(metrics=metrics)
+        data = np.array([[22.9, 150.0, 120.0, 70.0, 30]])
+
+        repo.predict("LOG", data)
+        repo.predict_batch("RF", np.repeat(data, 10, axis=0))
+
+        assert metrics.model_inference.labels("LOG").count == 1
+        assert metrics.model_inference.labels("RF").count == 1
+        assert metrics.model_inference.labels("XGB").count == 0
+
+    @pytest.mark.asyncio
+    async def test_recommendation_service_records_latency(self, mock_openai_client):
+        """Test recommendation calls and upstream attempts are timed separately."""
+        completion = Mock()
+        completion.choices = [Mock(message=Mock(content="Recomendación"))]
+        mock_openai_client.chat.completions.create.side_effect = [
+            APITimeoutError(request=httpx.Request("POST", "https://api.openai.com")),
+            completion
+        ]
+        metrics = PredictionMetrics()
+        service = OpenAIRecommendationService(metrics=metrics, retry_backoff=0)
+
+        await service.generate_recommendation("Sí")
+        await service.generate_recommendation("Sí")
+
+        assert metrics.recommendation.labels().count == 2
+        assert metrics.openai_request.labels("error").count == 1
+        assert metrics.openai_request.labels("ok").count == 1
+
+    def test_series_are_reused_and_sum_exactly(self):
+        """Test the hot path reuses one series and adds integer nanoseconds."""
+        histogram = PredictionMetrics().model_inference
+
+        series = histogram.labels("LOG")
+        for _ in range(1000):
+            histogram.labels("LOG").observe_ns(1)
+
+        # Cost per observation is tracked by benchmarks/bench_layers.py.
+        assert histogram.labels("LOG") is series
+        assert series.count == 1000
+        assert series.sum == 1000 / 1e9
+
+
+class TestBulkScoring:
+    """Test cases for offline bulk scoring."""
+
+    @pytest.fixture
+    def population_csv(self, tmp_path):
+        """Write a small population file with two invalid rows."""
+        rng = np.random.default_rng(3)
+        frame = pd.DataFrame({
+            "id": np.arange(50),
+            "peso": rng.uniform(45, 120, 50),
+            "estatura": rng.uniform(1.45, 1.95, 50),
+            "actividad_total": rng.uniform(0, 300, 50),
+            "tension_arterial": rng.uniform(90, 180, 50),
+            "edad": rng.integers(18, 90, 50),
+            "region": "norte"
+        })
+        frame.loc[3, "peso"] = np.nan
+        frame.loc[7, "estatura"] = 0
+        path = tmp_path / "population.csv"
+        frame.to_csv(path, index=False)
+        return path
+
+    def test_matches_repository_predictions(self, population_csv, tmp_path):
+        """Test chunked scoring predicts exactly like the repository."""
+        output = tmp_path / "scores.csv"
+        counts = score_file(population_csv, output, chunk_size=16, keep_columns=["id"])
+
+        result = pd.read_csv(output)
+        source = pd.read_csv(population_csv)
+        valid = source.drop(index=[3, 7])
+        repository = JoblibModelRepository()
+        data = np.column_stack([
+            valid["peso"] / valid["estatura"] ** 2, valid["actividad_total"],
+            valid["tension_arterial"], valid["peso"], valid["edad"]
+        ])
+
+        assert counts == {"rows": 50, "scored": 48}
+        assert list(result.columns) == ["id", "prediccion_LOG", "prediccion_RF", "prediccion_XGB"]
+        assert result["id"].tolist() == list(range(50))
+        assert result.loc[[3, 7]].drop(columns="id").isna().all().all()
+        for model in ["LOG", "RF", "XGB"]:
+            expected = repository.predict_batch(model, data)
+            assert result.drop(index=[3, 7])[f"prediccion_{model}"].astype(int).tolist() == expected
+
+    def test_parallel_workers_keep_input_order(self, population_csv, tmp_path):
+        """Test scoring in worker processes writes the same file."""
+        score_file(population_csv, tmp_path / "serial.csv", chunk_size=8, keep_columns=["id"])
+        score_file(population_csv, tmp_path / "parallel.csv", chunk_size=8, workers=2, keep_columns=["id"])
+
+        assert (tmp_path / "serial.csv").read_text() == (tmp_path / "parallel.csv").read_text()
+
+    def test_parquet_round_trip(self, population_csv, tmp_path):
+        """Test Parquet input and output give the same scores as CSV, with nullable predictions."""
+        pytest.importorskip("pyarrow")
+        source = tmp_path / "population.parquet"
+        pd.read_csv(population_csv).to_parquet(source, index=False)
+
+        counts = score_file(source, tmp_path / "scores.parquet", chunk_size=16, keep_columns=["id"])
+        score_file(population_csv, tmp_path / "scores.csv", chunk_size=16, keep_columns=["id"])
+
+        result = pd.read_parquet(tmp_path / "scores.parquet")
+        expected = pd.read_csv(tmp_path / "scores.csv")
+        assert counts == {"rows": 50, "scored": 48}
+        assert str(result["prediccion_RF"].dtype) == "Int8"
+        pd.testing.assert_frame_equal(result.astype("float64"), expected.astype("float64"))
+
+    def test_missing_pyarrow_is_a_usage_error(self, population_csv, tmp_path, capsys):
+        """Test asking for Parquet without pyarrow exits with a message instead of a traceback."""
+        with patch.dict("sys.modules", {"pyarrow": None, "pyarrow.parquet": None}):
+            with pytest.raises(SystemExit) as exit_info:
+                bulk_scoring_main([str(population_csv), str(tmp_path / "scores.parquet")])
+
+        assert exit_info.value.code == 2
+        assert "Parquet files require pyarrow" in capsys.readouterr().err
+        assert not (tmp_path / "scores.parquet").exists()
+
+    @pytest.mark.asyncio
+    async def test_recommendations_from_deduplicated_lookup(self, population_csv, tmp_path):
+        """Test recommendations cost one call per label, not per row."""
+        service = AsyncMock()
+        service.generate_recommendation.side_effect = lambda label: f"Recomendación {label}"
+        lookup = await build_recommendation_lookup(service)
+
+        output = tmp_path / "scores.csv"
+        await asyncio.to_thread(score_file, population_csv, output, recommendation_lookup=lookup)
+        result = pd.read_csv(output)
+
+        assert service.generate_recommendation.await_count == 2
+        assert set(result["respuesta_RF"].dropna()) <= {"Recomendación Sí", "Recomendación No"}
+        assert (result["respuesta_XGB"].dropna() == result["prediccion_XGB"].dropna().map(
+            {1: "Recomendación Sí", 0: "Recomendación No"}
+        )).all()
+        assert pd.isna(result.loc[3, "respuesta_LOG"])
@@ -2,6 +2,11 @@
 Unit tests for presentation layer.
 """
 
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, AsyncMock, patch
@@ -86,6 +91,689 @@ class TestAPIRoutes:
         assert "detail" in error_data
 
 
+    def test_predict_batch_endpoint(self, client, sample_request, mock_assessment):
+        """Test batch endpoint returns one result per patient in order."""
+        from app.presentation.routes import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_batch = AsyncMock(return_value=[mock_assessment, mock_assessment])
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            response = client.post("/predict/batch", json={"pacientes": [sample_request, sample_request]})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        resultados = response.json()["resultados"]
+        assert len(resultados) == 2
+        assert resultados[0]["riesgo_hipertension"][2] == {
+            "modelo": "XGB", "prediccion": "Sí", "respuesta": "Consultar médico"
+        }
+        patients = use_case.predict_batch.call_args[0][0]
+        assert patients[0] == mock_assessment.patient_data
+
+    def test_predict_batch_endpoint_empty(self, client):
+        """Test batch endpoint rejects an empty batch."""
+        response = client.post("/predict/batch", json={"pacientes": []})
+        assert response.status_code == 422
+
+    def test_predict_batch_columnar_formats(self, client, sample_request):
+        """Test .npy bodies and responses go through the columnar use case path."""
+        import io
+        import numpy as np
+        from app.domain.entities import ColumnarAssessment
+        from app.presentation.routes import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_columns = AsyncMock(return_value=ColumnarAssessment(
+            models=["LOG", "RF"],
+            predictions={"LOG": np.array([1, 0], dtype=np.int8), "RF": np.array([0, 0], dtype=np.int8)}
+        ))
+        buffer = io.BytesIO()
+        np.save(buffer, np.array([[70.0, 1.75, 150.0, 120.0, 30], [92.0, 1.6, 20.0, 150.0, 61]]))
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            npy = client.post(
+                "/predict/batch", content=buffer.getvalue(),
+                headers={"Content-Type": "application/x-npy", "Accept": "application/x-npy"}
+            )
+            as_json = client.post(
+                "/predict/batch?recommendation_mode=none", content=buffer.getvalue(),
+                headers={"Content-Type": "application/x-npy"}
+            )
+            from_json = client.post(
+                "/predict/batch", json={"pacientes": [sample_request, sample_request]},
+                headers={"Accept": "application/x-npy"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert npy.status_code == 200
+        assert npy.headers["X-Columns"] == "prediccion_LOG,prediccion_RF"
+        assert np.load(io.BytesIO(npy.content)).tolist() == [[1, 0], [0, 0]]
+        columns, mode = use_case.predict_columns.call_args_list[0][0]
+        assert columns["estatura"].tolist() == [1.75, 1.6]
+        assert mode == "none"
+        assert as_json.json()["resultados"][0] == {
+            "riesgo_hipertension": [
+                {"modelo": "LOG", "prediccion": "Sí", "respuesta": None},
+                {"modelo": "RF", "prediccion": "No", "respuesta": None}
+            ],
+            "recomendacion": None,
+            "degradado": False
+        }
+        assert use_case.predict_columns.call_args_list[2][0][0]["edad"].tolist() == [30, 30]
+
+    def test_invalid_patients_are_rejected_in_every_format(self, client, sample_request):
+        """Test a zero height is a 422 for JSON and columnar bodies alike."""
+        import io
+        import numpy as np
+
+        zero_height = {**sample_request, "estatura": 0}
+        buffer = io.BytesIO()
+        np.save(buffer, np.array([[70.0, 0.0, 150.0, 120.0, 30]]))
+
+        json_batch = client.post("/predict/batch", json={"pacientes": [sample_request, zero_height]})
+        npy_batch = client.post(
+            "/predict/batch", content=buffer.getvalue(), headers={"Content-Type": "application/x-npy"}
+        )
+        single = client.post("/predict?recommendation_mode=none", json=zero_height)
+
+        assert json_batch.status_code == 422
+        assert json_batch.json()["detail"][0]["loc"][-1] == "estatura"
+        assert npy_batch.status_code == 422
+        assert npy_batch.json()["detail"] == "estatura must be positive"
+        assert single.status_code == 422
+
+    @pytest.fixture
+    def columnar_use_case(self):
+        """Use case returning a per_model columnar assessment for two patients."""
+        import numpy as np
+        from app.domain.entities import ColumnarAssessment
+        from app.presentation.routes import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_columns = AsyncMock(return_value=ColumnarAssessment(
+            models=["LOG", "RF"],
+            predictions={"LOG": np.array([1, 0], dtype=np.int8), "RF": np.array([0, 0], dtype=np.int8)},
+            respuestas={
+                "LOG": np.array(["Consultar médico", "Mantener hábitos"], dtype=object),
+                "RF": np.array(["Mantener hábitos", "Mantener hábitos"], dtype=object)
+            },
+            degradado=np.array([False, True])
+        ))
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        yield use_case
+        app.dependency_overrides.clear()
+
+    def test_predict_batch_arrow_round_trip(self, client, columnar_use_case):
+        """Test Arrow bodies are decoded per field and Arrow responses carry every output column."""
+        pyarrow = pytest.importorskip("pyarrow")
+        import pyarrow.ipc
+
+        def arrow_stream(columns):
+            table = pyarrow.table(columns)
+            sink = pyarrow.BufferOutputStream()
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue().to_pybytes()
+
+        patients = {
+            "peso": [70.0, 92.0], "estatura": [1.75, 1.6], "actividad_total": [150.0, 20.0],
+            "tension_arterial": [120.0, 150.0], "edad": [30, 61]
+        }
+        headers = {"Content-Type": "application/vnd.apache.arrow.stream", "Accept": "application/vnd.apache.arrow.stream"}
+
+        response = client.post("/predict/batch", content=arrow_stream(patients), headers=headers)
+        missing_field = client.post(
+            "/predict/batch", content=arrow_stream({k: v for k, v in patients.items() if k != "edad"}), headers=headers
+        )
+        fractional_age = client.post(
+            "/predict/batch", content=arrow_stream({**patients, "edad": [30.7, 61.0]}), headers=headers
+        )
+        garbage = client.post("/predict/batch", content=b"not arrow", headers=headers)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        assert table.to_pydict() == {
+            "prediccion_LOG": [1, 0], "prediccion_RF": [0, 0],
+            "respuesta_LOG": ["Consultar médico", "Mantener hábitos"],
+            "respuesta_RF": ["Mantener hábitos", "Mantener hábitos"],
+            "degradado": [False, True]
+        }
+        columns, mode = columnar_use_case.predict_columns.call_args[0]
+        assert {field: column.tolist() for field, column in columns.items()} == patients
+        assert mode == "per_model"
+        assert [r.status_code for r in (missing_field, fractional_age, garbage)] == [422, 422, 422]
+        assert fractional_age.json()["detail"] == "edad must be a whole number"
+        assert columnar_use_case.predict_columns.await_count == 1
+
+    def test_predict_batch_msgpack_round_trip(self, client, columnar_use_case):
+        """Test msgpack bodies are decoded per field and msgpack responses carry every output column."""
+        msgpack = pytest.importorskip("msgpack")
+
+        patients = {
+            "peso": [70.0, 92.0], "estatura": [1.75, 1.6], "actividad_total": [150.0, 20.0],
+            "tension_arterial": [120.0, 150.0], "edad": [30, 61]
+        }
+        headers = {"Content-Type": "application/msgpack", "Accept": "application/msgpack"}
+
+        response = client.post("/predict/batch", content=msgpack.packb(patients), headers=headers)
+        as_json = client.post(
+            "/predict/batch", content=msgpack.packb(patients), headers={"Content-Type": "application/x-msgpack"}
+        )
+        invalid = [
+            client.post("/predict/batch", content=body, headers=headers)
+            for body in (
+                msgpack.packb({k: v for k, v in patients.items() if k != "peso"}),
+                msgpack.packb([1, 2, 3]),
+                msgpack.packb({**patients, "peso": ["a", "b"]}),
+                msgpack.packb({**patients, "estatura": [1.75]}),
+                msgpack.packb({**patients, "edad": [30.5, 61]}),
+                b"\xc1",
+            )
+        ]
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(response.content) == {
+            "prediccion_LOG": [1, 0], "prediccion_RF": [0, 0],
+            "respuesta_LOG": ["Consultar médico", "Mantener hábitos"],
+            "respuesta_RF": ["Mantener hábitos", "Mantener hábitos"],
+            "degradado": [False, True]
+        }
+        assert as_json.json()["resultados"][1]["riesgo_hipertension"][0] == {
+            "modelo": "LOG", "prediccion": "No", "respuesta": "Mantener hábitos"
+        }
+        columns, _ = columnar_use_case.predict_columns.call_args_list[0][0]
+        assert {field: column.tolist() for field, column in columns.items()} == patients
+        assert [r.status_code for r in invalid] == [422] * 6
+        assert invalid[4].json()["detail"] == "edad must be a whole number"
+        assert columnar_use_case.predict_columns.await_count == 2
+
+    def test_fractional_age_is_rejected_in_every_format(self, client, sample_request):
+        """Test a non-integral edad is a 422 for JSON and columnar bodies, while 30.0 is accepted."""
+        import io
+        import numpy as np
+
+        def npy(age):
+            buffer = io.BytesIO()
+            np.save(buffer, np.array([[70.0, 1.75, 150.0, 120.0, age]]))
+            return buffer.getvalue()
+
+        npy_headers = {"Content-Type": "application/x-npy"}
+        json_batch = client.post("/predict/batch", json={"pacientes": [{**sample_request, "edad": 30.7}]})
+        npy_batch = client.post("/predict/batch?recommendation_mode=none", content=npy(30.7), headers=npy_headers)
+        whole = client.post("/predict/batch?recommendation_mode=none", content=npy(30.0), headers=npy_headers)
+
+        assert json_batch.status_code == 422
+        assert json_batch.json()["detail"][0]["loc"][-1] == "edad"
+        assert npy_batch.status_code == 422
+        assert npy_batch.json()["detail"] == "edad must be a whole number"
+        assert whole.status_code == 200
+
+    def test_predict_batch_rejects_unsupported_formats(self, client):
+        """Test content negotiation and columnar validation errors."""
+        import io
+        import numpy as np
+
+        buffer = io.BytesIO()
+        np.save(buffer, np.array([[70.0, 0.0, 150.0, 120.0, 30]]))
+
+        assert client.post("/predict/batch", content=b"x", headers={"Content-Type": "text/csv"}).status_code == 415
+        assert client.post(
+            "/predict/batch", json={"pacientes": []}, headers={"Accept": "text/html"}
+        ).status_code == 406
+        assert client.post(
+            "/predict/batch", content=buffer.getvalue(), headers={"Content-Type": "application/x-npy"}
+        ).status_code == 422
+        assert client.post(
+            "/predict/batch", content=b"not npy", headers={"Content-Type": "application/x-npy"}
+        ).status_code == 422
+
+    def test_predict_stream(self, client, sample_request):
+        """Test the streaming endpoint frames events as NDJSON or server-sent events."""
+        from app.domain.entities import AssessmentEvent
+        from app.presentation.routes import get_prediction_use_case
+
+        async def events(patient_data, recommendation_mode):
+            yield AssessmentEvent("predictions", predictions=[PredictionResult(modelo="LOG", prediccion="No")])
+            yield AssessmentEvent(
+                "recommendation", predictions=[PredictionResult("LOG", "No", "Mantener hábitos saludables")]
+            )
+            yield AssessmentEvent("done")
+
+        use_case = Mock()
+        use_case.stream_hypertension_risk = events
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            ndjson = client.post("/predict/stream", json=sample_request)
+            sse = client.post("/predict/stream", json=sample_request, headers={"Accept": "text/event-stream"})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert ndjson.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in ndjson.text.splitlines()]
+        assert lines == [
+            {"event": "predictions", "riesgo_hipertension": [{"modelo": "LOG", "prediccion": "No", "respuesta": None}]},
+            {
+                "event": "recommendation", "modelo": "LOG", "prediccion": "No",
+                "respuesta": "Mantener hábitos saludables", "degradado": False
+            },
+            {"event": "done", "degradado": False}
+        ]
+        assert sse.headers["content-type"].startswith("text/event-stream")
+        frames = sse.text.strip().split("\n\n")
+        assert frames[0].startswith("event: predictions\ndata: {")
+        assert frames[-1] == 'event: done\ndata: {"degradado":false}'
+
+    def test_websocket_pipelines_readings(self, client, sample_request, mock_assessment):
+        """Test pipelined readings get replies tagged with their ids, and bad readings an error."""
+        from app.presentation.routes import get_prediction_use_case_factory
+
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(return_value=mock_assessment)
+        app.dependency_overrides[get_prediction_use_case_factory] = lambda: lambda: use_case
+        try:
+            with client.websocket_connect("/ws/predict?recommendation_mode=none") as websocket:
+                for reading_id in range(3):
+                    websocket.send_json({**sample_request, "id": reading_id})
+                websocket.send_json({"id": "bad", "peso": "invalid"})
+                replies = [websocket.receive_json() for _ in range(4)]
+        finally:
+            app.dependency_overrides.clear()
+
+        by_id = {reply["id"]: reply for reply in replies}
+        assert set(by_id) == {0, 1, 2, "bad"}
+        assert by_id[0]["riesgo_hipertension"][2]["prediccion"] == "Sí"
+        assert by_id["bad"]["error"][0]["loc"] == ["peso"]
+        assert use_case.predict_hypertension_risk.await_count == 3
+        assert use_case.predict_hypertension_risk.call_args[0][1] == "none"
+
+    def test_websocket_limits_readings_in_flight(self, client, sample_request, mock_assessment, monkeypatch):
+        """Test no more than WEBSOCKET_MAX_IN_FLIGHT readings are predicted at once."""
+        import asyncio
+        from app.presentation.routes import get_prediction_use_case_factory
+
+        monkeypatch.setenv("WEBSOCKET_MAX_IN_FLIGHT", "2")
+        active = 0
+        peak = 0
+
+        async def slow_prediction(patient_data, recommendation_mode):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return mock_assessment
+
+        use_case = Mock()
+        use_case.predict_hypertension_risk = slow_prediction
+        app.dependency_overrides[get_prediction_use_case_factory] = lambda: lambda: use_case
+        try:
+            with client.websocket_connect("/ws/predict") as websocket:
+                for reading_id in range(8):
+                    websocket.send_json({**sample_request, "id": reading_id})
+                replies = [websocket.receive_json() for _ in range(8)]
+        finally:
+            app.dependency_overrides.clear()
+
+        assert sorted(reply["id"] for reply in replies) == list(range(8))
+        assert peak == 2
+
+    def test_predict_recommendation_mode(self, client, sample_request, mock_assessment):
+        """Test the recommendation mode is passed through and the shared recommendation returned."""
+        from app.presentation.routes import get_prediction_use_case
+
+        consensus = HypertensionAssessment(
+            patient_data=mock_assessment.patient_data,
+            predictions=[PredictionResult(modelo="LOG", prediccion="No")],
+            recomendacion="Mantener hábitos saludables"
+        )
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(return_value=consensus)
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            response = client.post("/predict?recommendation_mode=consensus", json=sample_request)
+            invalid = client.post("/predict?recommendation_mode=all", json=sample_request)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "riesgo_hipertension": [{"modelo": "LOG", "prediccion": "No", "respuesta": None}],
+            "recomendacion": "Mantener hábitos saludables",
+            "degradado": False
+        }
+        assert use_case.predict_hypertension_risk.call_args[0][1] == "consensus"
+        assert invalid.status_code == 422
+
+    def test_idempotency_key_replays_stored_response(self, client, sample_request, mock_assessment):
+        """Test a retry with the same Idempotency-Key is not recomputed."""
+        from app.presentation.routes import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(return_value=mock_assessment)
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            first = client.post("/predict", json=sample_request, headers={"Idempotency-Key": "abc"})
+            retry = client.post("/predict", json=sample_request, headers={"Idempotency-Key": "abc"})
+            other = client.post("/predict", json=sample_request, headers={"Idempotency-Key": "def"})
+            unkeyed = client.post("/predict", json=sample_request)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert other.status_code == unkeyed.status_code == 200
+        assert use_case.predict_hypertension_risk.await_count == 3
+
+    def test_deferred_recommendations(self, client, sample_request, mock_assessment):
+        """Test deferred predictions return a job whose result is served from /jobs."""
+        from app.presentation.routes import get_prediction_use_case, get_recommendation_jobs
+        from app.domain.entities import RecommendationJob
+        from app.infrastructure.recommendation_jobs import JobQueueFullError
+
+        predictions_only = HypertensionAssessment(
+            patient_data=mock_assessment.patient_data,
+            predictions=[PredictionResult(modelo="LOG", prediccion="No")]
+        )
+        job = RecommendationJob(job_id="abc123")
+        jobs = Mock()
+        jobs.get.side_effect = lambda job_id: job if job_id == job.job_id else None
+        use_case = Mock()
+        use_case.predict_hypertension_risk_deferred = AsyncMock(return_value=(predictions_only, job))
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        app.dependency_overrides[get_recommendation_jobs] = lambda: jobs
+        try:
+            response = client.post("/predict?deferred=true", json=sample_request)
+            pending = client.get("/jobs/abc123").json()
+            job.status, job.assessment = "done", mock_assessment
+            done = client.get("/jobs/abc123").json()
+            unknown = client.get("/jobs/other")
+            use_case.predict_hypertension_risk_deferred.side_effect = JobQueueFullError("full")
+            full = client.post("/predict?deferred=true", json=sample_request)
+            app.dependency_overrides[get_recommendation_jobs] = lambda: None
+            disabled = client.post("/predict?deferred=true", json=sample_request)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 202
+        assert response.headers["Location"] == "/jobs/abc123"
+        assert response.json() == {
+            "riesgo_hipertension": [{"modelo": "LOG", "prediccion": "No", "respuesta": None}],
+            "recomendacion": None,
+            "degradado": False,
+            "job_id": "abc123"
+        }
+        assert pending == {"job_id": "abc123", "estado": "pending", "resultado": None, "error": None}
+        assert done["estado"] == "done"
+        assert done["resultado"]["riesgo_hipertension"][2]["respuesta"] == "Consultar médico"
+        assert unknown.status_code == 404
+        assert full.status_code == 503
+        assert full.headers["Retry-After"] == "1"
+        assert disabled.status_code == 400
+
+    def test_shadow_stats(self, client, monkeypatch):
+        """Test the shadow scoring counters are exposed, and 404 when disabled."""
+        from app.presentation.routes import get_shadow_scorer
+
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        admin = {"X-Admin-Token": "secret"}
+
+        scorer = Mock()
+        scorer.stats.return_value = {
+            "queued": 0, "dropped": 2, "failures": 0,
+            "candidates": [{
+                "version": "v2", "model": "RF", "rows": 4, "agreements": 3, "agreement_rate": 0.75,
+                "candidate_positive": 1, "production_positive": 2
+            }]
+        }
+        app.dependency_overrides[get_shadow_scorer] = lambda: scorer
+        try:
+            response = client.get("/admin/shadow/stats", headers=admin)
+            app.dependency_overrides[get_shadow_scorer] = lambda: None
+            disabled = client.get("/admin/shadow/stats", headers=admin)
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "candidatos": [{
+                "version": "v2", "modelo": "RF", "filas": 4, "coincidencias": 3, "tasa_coincidencia": 0.75,
+                "positivos_candidato": 1, "positivos_produccion": 2
+            }],
+            "en_cola": 0,
+            "descartadas": 2,
+            "fallos": 0
+        }
+        assert disabled.status_code == 404
+
+
+    def test_shadow_stats_require_admin_token(self, client, monkeypatch):
+        """Test the shadow stats are not public, with or without a configured admin token."""
+        from app.config import get_settings
+        from app.presentation.routes import get_shadow_scorer
+
+        scorer = Mock()
+        app.dependency_overrides[get_shadow_scorer] = lambda: scorer
+        try:
+            monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+            unconfigured = client.get("/admin/shadow/stats")
+            get_settings.cache_clear()
+            monkeypatch.setenv("ADMIN_TOKEN", "secret")
+            missing = client.get("/admin/shadow/stats")
+            wrong = client.get("/admin/shadow/stats", headers={"X-Admin-Token": "guess"})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert [r.status_code for r in (unconfigured, missing, wrong)] == [403, 403, 403]
+        scorer.stats.assert_not_called()
+    def test_admission_control_sheds_excess_requests(self, client, sample_request, mock_assessment, monkeypatch):
+        """Test a full lane is rejected with 503 while requests without recommendations still pass."""
+        import asyncio
+        from app.presentation.routes import get_prediction_use_case
+        from app.presentation.dependencies import get_admission_limiter
+
+        monkeypatch.setenv("ADMISSION_MAX_IN_FLIGHT", "1")
+        monkeypatch.setenv("ADMISSION_MAX_WAITING", "0")
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(return_value=mock_assessment)
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        # Hold the only slot of the recommendations lane.
+        asyncio.run(get_admission_limiter("recommendations").acquire())
+        try:
+            shed = client.post("/predict", json=sample_request)
+            predictions_only = client.post("/predict?recommendation_mode=none", json=sample_request)
+            metrics = client.get("/metrics").text
+        finally:
+            app.dependency_overrides.clear()
+
+        assert shed.status_code == 503
+        assert shed.headers["Retry-After"] == "1"
+        assert predictions_only.status_code == 200
+        assert use_case.predict_hypertension_risk.await_count == 1
+        assert 'hypertension_admission_rejected_total{lane="recommendations"} 1' in metrics
+        assert 'hypertension_admission_in_flight{lane="recommendations"} 1' in metrics
+        assert 'hypertension_admission_in_flight{lane="predictions"} 0' in metrics
+
+    def test_admission_control_covers_stream_batch_and_websocket(
+        self, client, sample_request, mock_assessment, monkeypatch
+    ):
+        """Test the streaming, batch and WebSocket variants cannot bypass the admission caps."""
+        import asyncio
+        from app.domain.entities import AssessmentEvent
+        from app.presentation.routes import get_prediction_use_case, get_prediction_use_case_factory
+        from app.presentation.dependencies import get_admission_limiter
+
+        monkeypatch.setenv("ADMISSION_MAX_IN_FLIGHT", "1")
+        monkeypatch.setenv("ADMISSION_MAX_IN_FLIGHT_PREDICTIONS", "1")
+        monkeypatch.setenv("ADMISSION_MAX_WAITING", "0")
+        in_flight_while_streaming = []
+
+        async def events(patient_data, recommendation_mode):
+            yield AssessmentEvent("predictions", predictions=[PredictionResult(modelo="LOG", prediccion="No")])
+            in_flight_while_streaming.append(get_admission_limiter("recommendations").in_flight)
+            yield AssessmentEvent("done")
+
+        use_case = Mock()
+        use_case.stream_hypertension_risk = events
+        use_case.predict_hypertension_risk = AsyncMock(return_value=mock_assessment)
+        use_case.predict_batch = AsyncMock(return_value=[mock_assessment])
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        app.dependency_overrides[get_prediction_use_case_factory] = lambda: lambda: use_case
+        try:
+            streamed = client.post("/predict/stream", json=sample_request)
+            batch = client.post("/predict/batch", json={"pacientes": [sample_request]})
+            recommendations = get_admission_limiter("recommendations")
+            predictions = get_admission_limiter("predictions")
+            in_flight_after = (recommendations.in_flight, predictions.in_flight)
+
+            asyncio.run(recommendations.acquire())
+            asyncio.run(predictions.acquire())
+            shed_stream = client.post("/predict/stream", json=sample_request)
+            shed_batch = client.post("/predict/batch", json={"pacientes": [sample_request]})
+            with client.websocket_connect("/ws/predict") as websocket:
+                websocket.send_json({**sample_request, "id": 1})
+                shed_reading = websocket.receive_json()
+        finally:
+            app.dependency_overrides.clear()
+
+        assert streamed.status_code == batch.status_code == 200
+        # The slot is held until the stream ends, not only until the response starts.
+        assert in_flight_while_streaming == [1]
+        assert in_flight_after == (0, 0)
+        assert shed_stream.status_code == shed_batch.status_code == 503
+        assert shed_stream.headers["Retry-After"] == shed_batch.headers["Retry-After"] == "1"
+        assert shed_reading == {"id": 1, "error": "Too many requests in flight"}
+        use_case.predict_hypertension_risk.assert_not_awaited()
+        assert use_case.predict_batch.await_count == 1
+
+    def test_stream_is_closed_when_sending_fails(self, sample_request):
+        """Test pending recommendations and the admission slot are released if the stream is never sent."""
+        import asyncio
+        import contextlib
+        from app.domain.entities import AssessmentEvent
+        from app.presentation.dependencies import get_admission_limiter
+        from app.presentation.routes import predict_hypertension_risk_stream
+        from app.presentation.schemas import PatientDataRequest
+
+        closed = []
+
+        async def events(patient_data, recommendation_mode):
+            try:
+                yield AssessmentEvent("predictions", predictions=[PredictionResult(modelo="LOG", prediccion="No")])
+                # Recommendations that never arrive.
+                await asyncio.Event().wait()
+                yield AssessmentEvent("done")
+            finally:
+                closed.append(recommendation_mode)
+
+        async def connection_reset(message):
+            raise OSError("Connection reset by peer")
+
+        async def sent(message):
+            pass
+
+        async def disconnected():
+            return {"type": "http.disconnect"}
+
+        use_case = Mock()
+        use_case.stream_hypertension_risk = events
+
+        async def stream(spec_version, send):
+            response = await predict_hypertension_risk_stream(
+                PatientDataRequest(**sample_request), use_case, "per_model", None
+            )
+            with contextlib.suppress(Exception):
+                await response({"type": "http", "asgi": {"spec_version": spec_version}}, disconnected, send)
+            return get_admission_limiter("recommendations").in_flight
+
+        # Fails on the response start, before the body is iterated; then a client that goes away.
+        in_flight = [asyncio.run(stream("2.4", connection_reset)), asyncio.run(stream("2.0", sent))]
+
+        assert closed == ["per_model", "per_model"]
+        assert in_flight == [0, 0]
+
+    def test_profiling_hook(self, client, sample_request, monkeypatch, tmp_path):
+        """Test a request asking for a profile gets its call tree written to the profile directory."""
+        import pstats
+
+        monkeypatch.setenv("PROFILING_ENABLED", "1")
+        monkeypatch.setenv("PROFILING_DIR", str(tmp_path))
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+        profiled = client.post(
+            "/predict?recommendation_mode=none", json=sample_request,
+            headers={"X-Profile": "1", "X-Admin-Token": "secret"}
+        )
+        plain = client.post("/predict?recommendation_mode=none", json=sample_request)
+        unauthorized = client.post(
+            "/predict?recommendation_mode=none", json=sample_request, headers={"X-Profile": "1"}
+        )
+
+        assert profiled.status_code == plain.status_code == 200
+        assert "X-Profile-Id" not in plain.headers
+        assert "X-Profile-Id" not in unauthorized.headers
+        profile = tmp_path / f"{profiled.headers['X-Profile-Id']}.prof"
+        assert list(tmp_path.iterdir()) == [profile]
+        functions = {(Path(path).name, name) for path, _, name in pstats.Stats(str(profile)).stats}
+        assert ("use_cases.py", "predict_hypertension_risk") in functions
+        # Inference runs in executor threads, profiled there and merged in.
+        assert {("ml_models.py", "predict"), ("ml_models.py", "predict_batch")} & functions
+
+    def test_profile_header_needs_a_configured_admin_token(self, client, sample_request, monkeypatch, tmp_path):
+        """Test clients cannot force a profile when no admin token is configured."""
+        monkeypatch.setenv("PROFILING_ENABLED", "1")
+        monkeypatch.setenv("PROFILING_DIR", str(tmp_path))
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+
+        response = client.post(
+            "/predict?recommendation_mode=none", json=sample_request,
+            headers={"X-Profile": "1", "X-Admin-Token": ""}
+        )
+
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+        assert not tmp_path.exists() or not any(tmp_path.iterdir())
+
+    def test_profiling_is_off_by_default(self, client, sample_request, mock_assessment):
+        """Test the profile header is ignored unless profiling is enabled."""
+        from app.presentation.routes import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(return_value=mock_assessment)
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            response = client.post("/predict", json=sample_request, headers={"X-Profile": "1"})
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 200
+        assert "X-Profile-Id" not in response.headers
+
+    def test_idempotency_key_reused_with_other_request(self, client, sample_request, mock_assessment):
+        """Test reusing a key for a different request is rejected."""
+        from app.presentation.routes import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(return_value=mock_assessment)
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            client.post("/predict", json=sample_request, headers={"Idempotency-Key": "abc"})
+            response = client.post(
+                "/predict", json={**sample_request, "edad": 31}, headers={"Idempotency-Key": "abc"}
+            )
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 422
+        assert use_case.predict_hypertension_risk.await_count == 1
+
+
 class TestSchemas:
     """Test cases for API schemas."""
 
@@ -122,9 +810,9 @@ class TestSchemas:
         assert response.prediccion == "Sí"
         assert response.respuesta == "Recomendación médica"
 
-    @patch('app.infrastructure.openai_service.OpenAI')
+    @patch('openai.AsyncOpenAI')
     @patch('app.infrastructure.openai_service.os.getenv')
-    @patch('app.infrastructure.ml_models.joblib.load')
+    @patch('joblib.load')
     @patch('app.infrastructure.ml_models.Path.exists')
     def test_dependency_injection(self, mock_exists, mock_joblib_load, mock_getenv, mock_openai):
         """Test dependency injection in routes."""
@@ -137,4 +825,291 @@ class TestSchemas:
 
         use_case = get_prediction_use_case()
         assert use_case is not None
-        assert hasattr(use_case, 'predict_hypertension_risk')
\ No newline at end of file
+        assert hasattr(use_case, 'predict_hypertension_risk')
+
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_dependency_injection_shares_models(self, mock_exists, mock_joblib_load):
+        """Test models are loaded once per process, not per request."""
+        from app.presentation.routes import get_prediction_use_case
+
+        mock_exists.return_value = True
+        mock_joblib_load.return_value = Mock()
+
+        first = get_prediction_use_case()
+        second = get_prediction_use_case()
+
+        assert first.model_repo is second.model_repo
+        assert first.recommendation_service is second.recommendation_service
+        assert mock_joblib_load.call_count == 3
+
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_dependency_injection_inference_options(self, mock_exists, mock_joblib_load, monkeypatch):
+        """Test the inference settings reach the use case as one options object."""
+        from app.config import get_settings
+        from app.presentation.dependencies import get_inference_executor, get_prediction_use_case
+
+        mock_exists.return_value = True
+        mock_joblib_load.return_value = Mock()
+        monkeypatch.setenv("FEATURE_DTYPE", "float32")
+        get_settings.cache_clear()
+
+        use_case = get_prediction_use_case()
+
+        assert use_case.inference.feature_dtype == "float32"
+        assert use_case.inference.executor is get_inference_executor()
+
+
+    def test_model_store_dependency(self, tmp_path, monkeypatch):
+        """Test MODEL_STORE serves the models from the memory-mapped store."""
+        from app.infrastructure.model_store import MmapModelRepository
+        from app.presentation.dependencies import get_model_registry
+
+        MmapModelRepository.export(tmp_path)
+        monkeypatch.setenv("MODEL_STORE", str(tmp_path))
+
+        repository = get_model_registry().repository
+        assert isinstance(repository, MmapModelRepository)
+        assert repository.get_available_models() == ['LOG', 'RF', 'XGB']
+
+    @patch('app.presentation.dependencies.gc.freeze')
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_preload(self, mock_exists, mock_joblib_load, mock_freeze):
+        """Test preloading loads the models before any request."""
+        from app.presentation.dependencies import preload, get_model_registry
+
+        mock_exists.return_value = True
+        mock_joblib_load.return_value = Mock()
+
+        preload()
+
+        assert get_model_registry().is_loaded
+        mock_freeze.assert_called_once()
+
+
+class TestStartup:
+    """Test cases for startup cost."""
+
+    # Wall-clock, so only checked when a budget is set; importing app.main takes ~0.6s locally.
+    IMPORT_BUDGET_SECONDS = os.environ.get("APP_IMPORT_BUDGET")
+    DEFERRED_MODULES = ["openai", "httpx", "joblib", "sklearn", "xgboost", "pandas", "dotenv"]
+
+    def _import_app_main(self) -> dict:
+        """Import app.main in a fresh interpreter and report its cost."""
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            "import app.main\n"
+            "elapsed = time.perf_counter() - start\n"
+            f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {self.DEFERRED_MODULES!r} if m in sys.modules]}}))"
+        )
+        # Preloading is the gunicorn master's job, so even when enabled the import must stay light.
+        env = {**os.environ, "PRELOAD_MODELS": "1"}
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=Path(__file__).parent.parent,
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def test_import_defers_heavy_dependencies(self):
+        """Test importing app.main loads no model or OpenAI libraries."""
+        assert self._import_app_main()["loaded"] == []
+
+    def test_gunicorn_hook_preloads_models(self, monkeypatch):
+        """Test the gunicorn master preloads the models only when PRELOAD_MODELS is set."""
+        import runpy
+        from app.presentation import dependencies
+
+        hooks = runpy.run_path(str(Path(__file__).parent.parent / "gunicorn.conf.py"))
+        preload = Mock()
+        monkeypatch.setattr(dependencies, "preload", preload)
+
+        hooks["when_ready"](Mock())
+        monkeypatch.setenv("PRELOAD_MODELS", "1")
+        from app.config import get_settings
+        get_settings.cache_clear()
+        hooks["when_ready"](Mock())
+
+        preload.assert_called_once_with()
+
+    @pytest.mark.skipif(IMPORT_BUDGET_SECONDS is None, reason="set APP_IMPORT_BUDGET to check the import time")
+    def test_import_time_budget(self):
+        """Test importing app.main stays within its time budget."""
+        # Best of two runs, so one cold file cache does not fail the build.
+        seconds = min(self._import_app_main()["seconds"] for _ in range(2))
+        assert seconds < float(self.IMPORT_BUDGET_SECONDS)
+
+    def test_startup_report_phases(self, monkeypatch):
+        """Test phases record their duration and the heavy packages they import."""
+        from app import startup_report as module
+
+        monkeypatch.setattr(module, "HEAVY_MODULES", ("numpy", "fake_heavy_module"))
+        report = module.StartupReport()
+        with report.phase("already imported"):
+            import numpy  # noqa: F401
+        with report.phase("fake import"):
+            monkeypatch.setitem(sys.modules, "fake_heavy_module", Mock())
+
+        assert [phase.name for phase in report.phases] == ["already imported", "fake import"]
+        assert report.phases[0].imported == []
+        assert report.phases[1].imported == ["fake_heavy_module"]
+        assert "fake import" in report.summary()
+        assert "(imported fake_heavy_module)" in report.summary()
+        assert report.as_dict()["phases"][1]["imported"] == ["fake_heavy_module"]
+
+    @pytest.mark.asyncio
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    async def test_startup_logs_report(self, mock_exists, mock_joblib_load, caplog):
+        """Test startup times model loading and client creation and logs a summary."""
+        from app.presentation.dependencies import startup, shutdown, is_ready
+        from app.startup_report import startup_report
+
+        mock_exists.return_value = False
+        recorded = len(startup_report.phases)
+        with caplog.at_level("INFO", logger="uvicorn.error"):
+            await startup()
+        # Without model files there is nothing to serve with.
+        assert not is_ready()
+        await shutdown()
+
+        names = [phase.name for phase in startup_report.phases[recorded:]]
+        assert names == ["load models", "create recommendation service", "warm up"]
+        assert "Startup finished in" in caplog.text
+
+    def test_health_probes(self, mock_openai_client):
+        """Test the service is live at once but only ready once warm-up has run through the models."""
+        mock_openai_client.models.list = AsyncMock()
+        client = TestClient(app)
+        assert client.get("/health/live").json() == {"estado": "ok", "modelos": []}
+        not_ready = client.get("/health/ready")
+        assert not_ready.status_code == 503
+        assert not_ready.json()["estado"] == "not_ready"
+
+        with TestClient(app) as started:
+            ready = started.get("/health/ready")
+
+        assert ready.status_code == 200
+        assert ready.json() == {"estado": "ready", "modelos": ["LOG", "RF", "XGB"]}
+        mock_openai_client.models.list.assert_awaited_once()
+
+
+class TestAdminRoutes:
+    """Test cases for admin routes."""
+
+    @pytest.fixture
+    def client(self):
+        """Create test client."""
+        return TestClient(app)
+
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_reload_models(self, mock_exists, mock_joblib_load, client, monkeypatch):
+        """Test the reload endpoint swaps in freshly loaded models."""
+        from app.presentation.dependencies import get_model_registry
+
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+        mock_exists.return_value = True
+        mock_joblib_load.return_value = Mock()
+        registry = get_model_registry()
+        old_repo = registry.repository
+
+        response = client.post("/admin/models/reload", headers={"X-Admin-Token": "secret"})
+
+        assert response.status_code == 200
+        assert response.json() == {"version": 2, "modelos": ["LOG", "RF", "XGB"]}
+        assert registry.repository is not old_repo
+
+    def test_reload_models_requires_admin_token(self, client, monkeypatch):
+        """Test the reload endpoint rejects calls without the admin token."""
+        monkeypatch.setenv("ADMIN_TOKEN", "secret")
+
+        response = client.post("/admin/models/reload")
+        assert response.status_code == 403
+        wrong = client.post("/admin/models/reload", headers={"X-Admin-Token": "guess"})
+        assert wrong.status_code == 403
+        non_ascii = client.post("/admin/models/reload", headers={"X-Admin-Token": "clavé".encode("latin-1")})
+        assert non_ascii.status_code == 403
+
+    def test_reload_models_disabled_without_admin_token(self, client, monkeypatch):
+        """Test the reload endpoint fails closed when no admin token is configured."""
+        from app.presentation.dependencies import get_model_registry
+
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        registry = get_model_registry()
+        old_repo = registry.repository
+
+        response = client.post("/admin/models/reload", headers={"X-Admin-Token": ""})
+
+        assert response.status_code == 403
+        assert response.json() == {"detail": "Admin endpoints are disabled"}
+        assert registry.repository is old_repo
+
+
+class TestMetricsRoute:
+    """Test cases for the metrics endpoint."""
+
+    @pytest.fixture
+    def client(self):
+        """Create test client."""
+        return TestClient(app)
+
+    @patch('joblib.load')
+    @patch('app.infrastructure.ml_models.Path.exists')
+    def test_metrics_endpoint(self, mock_exists, mock_joblib_load, client):
+        """Test request metrics are exposed in the Prometheus text format."""
+        mock_exists.return_value = False
+        client.post("/predict", json={"peso": 70.0})
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'http_requests_total{method="POST",path="/predict",status="422"} 1' in response.text
+        assert "http_requests_in_flight 1" in response.text
+        assert "# TYPE hypertension_model_inference_seconds histogram" in response.text
+        assert "hypertension_model_version 1" in response.text
+
+    def test_server_errors_are_counted(self, client):
+        """Test failed requests increment the error counter."""
+        from app.presentation.dependencies import get_prediction_use_case
+
+        use_case = Mock()
+        use_case.predict_hypertension_risk = AsyncMock(side_effect=RuntimeError("boom"))
+        app.dependency_overrides[get_prediction_use_case] = lambda: use_case
+        try:
+            failing_client = TestClient(app, raise_server_exceptions=False)
+            response = failing_client.post("/predict", json={
+                "peso": 70.0, "estatura": 1.75, "actividad_total": 150.0, "tension_arterial": 120.0, "edad": 30
+            })
+        finally:
+            app.dependency_overrides.clear()
+
+        assert response.status_code == 500
+        assert 'http_request_errors_total{method="POST",path="/predict"} 1' in client.get("/metrics").text
+
+    def test_metrics_with_shadow_scoring(self, client, monkeypatch, tmp_path):
+        """Test the shadow scoring state is exported alongside the request metrics."""
+        import shutil
+        from app.infrastructure.ml_models import MODEL_DIR
+
+        (tmp_path / "v2").mkdir()
+        shutil.copy(MODEL_DIR / "modelo_hipertension_RF.pkl", tmp_path / "v2")
+        monkeypatch.setenv("SHADOW_MODEL_DIR", str(tmp_path))
+        with client:
+            client.post("/predict?recommendation_mode=none", json={
+                "peso": 70.0, "estatura": 1.75, "actividad_total": 150.0, "tension_arterial": 120.0, "edad": 30
+            })
+            response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert "# TYPE hypertension_shadow_dropped gauge" in response.text
+        assert "hypertension_shadow_dropped 0" in response.text
+
+    def test_metrics_can_be_disabled(self, client, monkeypatch):
+        """Test the endpoint is absent when metrics are disabled."""
+        monkeypatch.setenv("METRICS_ENABLED", "0")
+
+        assert client.get("/metrics").status_code == 404